@@ -0,0 +1,78 @@
+"""
+Run the backend benchmarks:
+
+    python -m benchmarks                              # full suite, print a table
+    python -m benchmarks --only build_graph --sizes 10 1000
+    python -m benchmarks --save-baseline bench_baseline.json
+    python -m benchmarks --baseline bench_baseline.json --tolerance 0.25
+
+With --baseline, exits with status 1 if any p50/p95/peak-allocation figure is more
+than --tolerance worse than the stored one. Baselines are machine-specific, so
+record them on the machine (or CI runner) that will compare against them.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+from dataclasses import asdict
+
+from benchmarks.harness import (
+    find_regressions,
+    format_results,
+    load_baseline,
+    save_baseline,
+)
+from benchmarks.suite import DEFAULT_PDF_PAGES, DEFAULT_SIZES, run_suite
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the backend hot paths")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument(
+        "--pdf-pages", type=int, nargs="+", default=list(DEFAULT_PDF_PAGES)
+    )
+    parser.add_argument("--only", help="only run benchmarks whose name contains this")
+    parser.add_argument(
+        "--min-time", type=float, default=0.5, help="seconds per benchmark"
+    )
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against this baseline file")
+    parser.add_argument("--save-baseline", help="write the results as a new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument(
+        "--show-output", action="store_true", help="don't silence the app's prints"
+    )
+    args = parser.parse_args(argv)
+
+    results = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(
+        sys.stdout if args.show_output else devnull
+    ):
+        for result in run_suite(
+            tuple(args.sizes), tuple(args.pdf_pages), args.only, args.min_time
+        ):
+            print(f"  {result.name}: p50 {result.p50_ms:.3f} ms", file=sys.stderr)
+            results.append(result)
+
+    print(format_results(results))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+    if args.save_baseline:
+        save_baseline(results, args.save_baseline)
+    if args.baseline:
+        regressions = find_regressions(
+            results, load_baseline(args.baseline), args.tolerance
+        )
+        if regressions:
+            print("\nREGRESSIONS:\n" + "\n".join(regressions))
+            return 1
+        print("\nNo regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""In-process stand-ins for the Anthropic client, for driving handle_chat_stream offline."""
+
+import time
+import uuid
+from typing import Iterator, Optional
+
+from anthropic.types import Message, TextBlock, ToolUseBlock, Usage
+
+
+class FakeMessageStream:
+    def __init__(self, chunks: list[str], tool_use: Optional[dict], chunk_delay: float):
+        self.chunks = chunks
+        self.tool_use = tool_use
+        self.chunk_delay = chunk_delay
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        self.closed = True
+
+    @property
+    def text_stream(self) -> Iterator[str]:
+        for chunk in self.chunks:
+            if self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            yield chunk
+
+    def get_final_message(self) -> Message:
+        content = [TextBlock(type="text", text="".join(self.chunks))]
+        if self.tool_use:
+            content.append(
+                ToolUseBlock(
+                    type="tool_use",
+                    id=f"toolu_{uuid.uuid4().hex[:24]}",
+                    name="node_complete",
+                    input=self.tool_use,
+                )
+            )
+        return Message(
+            id=f"msg_{uuid.uuid4().hex[:24]}",
+            type="message",
+            role="assistant",
+            model="claude-3-5-sonnet-20241022",
+            content=content,
+            stop_reason="tool_use" if self.tool_use else "end_turn",
+            usage=Usage(input_tokens=1000, output_tokens=len(self.chunks)),
+        )
+
+
+class FakeMessages:
+    def __init__(self, client: "FakeAnthropic"):
+        self.client = client
+
+    def stream(self, **kwargs) -> FakeMessageStream:
+        self.client.requests.append(kwargs)
+        # the follow-up to a tool result never uses the tool again, ending the turn
+        last_content = kwargs["messages"][-1]["content"]
+        answering_tool = isinstance(last_content, list) and any(
+            block.get("type") == "tool_result" for block in last_content
+        )
+        tool_use = None if answering_tool else self.client.tool_use
+        stream = FakeMessageStream(
+            self.client.chunks, tool_use, self.client.chunk_delay
+        )
+        self.client.streams.append(stream)
+        return stream
+
+
+class FakeAnthropic:
+    """
+    Mimics client.beta.prompt_caching.messages.stream(...) with canned output.
+
+    tool_use, e.g. {"node_id": 1, "judgement": "good"}, makes the first stream of a
+    turn end in a node_complete call.
+    """
+
+    def __init__(
+        self,
+        n_chunks: int = 20,
+        chunk: str = "Let's think about this. ",
+        tool_use: Optional[dict] = None,
+        chunk_delay: float = 0.0,
+    ):
+        self.chunks = [chunk] * n_chunks
+        self.tool_use = tool_use
+        self.chunk_delay = chunk_delay
+        self.requests: list[dict] = []
+        self.streams: list[FakeMessageStream] = []
+        messages = FakeMessages(self)
+        prompt_caching = type("PromptCaching", (), {"messages": messages})()
+        self.beta = type("Beta", (), {"prompt_caching": prompt_caching})()
@@ -0,0 +1,199 @@
+"""Synthetic data for benchmarks: graphs, learning progress, model output and PDFs."""
+
+import json
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from src.api.models import LearningProgressUpdateData, SpacedRepState
+from src.storage import Storage
+
+WORDS = (
+    "channel noise code parity bit block rate capacity error syndrome decode "
+    "encode matrix vector entropy signal message redundancy theorem probability"
+).split()
+
+
+def sentence(rng: random.Random, n_words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n_words)).capitalize() + "."
+
+
+def make_nodes(graph_id: str, n_nodes: int, rng: random.Random) -> list[dict]:
+    return [
+        {
+            "id": f"node_{uuid.UUID(int=rng.getrandbits(128)).hex}",
+            "graph_id": graph_id,
+            "summary": sentence(rng, 6),
+            "content": " ".join(sentence(rng, 15) for _ in range(4)),
+            "supporting_quotes": [sentence(rng, 20) for _ in range(2)],
+            "order_index": i,
+        }
+        for i in range(1, n_nodes + 1)
+    ]
+
+
+def make_edges(
+    graph_id: str, nodes: list[dict], rng: random.Random, max_parents: int = 2
+) -> list[dict]:
+    """A random DAG: each node after the first depends on up to max_parents earlier nodes"""
+    edges = []
+    for i, node in enumerate(nodes[1:], start=1):
+        window = nodes[max(0, i - 20) : i]
+        for parent in rng.sample(window, min(len(window), rng.randint(1, max_parents))):
+            edges.append(
+                {
+                    "parent_id": parent["id"],
+                    "child_id": node["id"],
+                    "graph_id": graph_id,
+                }
+            )
+    return edges
+
+
+def make_spaced_rep_state(rng: random.Random, n_reviews: int) -> SpacedRepState:
+    now = datetime.now()
+    history = [
+        (
+            now - timedelta(days=n_reviews - i),
+            LearningProgressUpdateData(quality=rng.choice(["hard", "good", "easy"])),
+        )
+        for i in range(n_reviews)
+    ]
+    return SpacedRepState(
+        next_review=now + timedelta(days=rng.uniform(-5, 5)),
+        last_review=now - timedelta(days=1),
+        current_interval=rng.uniform(1, 10),
+        ease_factor=rng.uniform(1.3, 2.8),
+        review_history=history,
+    )
+
+
+def make_learning_progress(
+    graph_id: str,
+    user_id: str,
+    nodes: list[dict],
+    rng: random.Random,
+    learned_fraction: float = 0.3,
+) -> list[dict]:
+    learned = nodes[: int(len(nodes) * learned_fraction)]
+    return [
+        {
+            "user_id": user_id,
+            "node_id": node["id"],
+            "graph_id": graph_id,
+            "version": 1,
+            "spaced_rep_state": make_spaced_rep_state(rng, 3).model_dump(mode="json"),
+        }
+        for node in learned
+    ]
+
+
+async def seed_storage(storage: Storage, n_nodes: int, n_pages: int = 2, seed: int = 0):
+    """Insert a document (with a generated PDF), graph, learning progress and session"""
+    rng = random.Random(seed)
+    user_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    pdf = make_pdf(n_pages, seed=seed)
+    storage_path = f"{user_id}/bench_{n_nodes}.pdf"
+    await storage.upload_document(storage_path, pdf)
+    document = await storage.insert_document(
+        {
+            "user_id": user_id,
+            "title": f"Benchmark document ({n_nodes} nodes)",
+            "file_size": len(pdf),
+            "storage_path": storage_path,
+        }
+    )
+    graph = await storage.insert_graph(
+        {"document_id": document["id"], "status": "complete"}
+    )
+    nodes = make_nodes(graph["id"], n_nodes, rng)
+    await storage.insert_nodes(nodes)
+    await storage.insert_edges(make_edges(graph["id"], nodes, rng))
+    for progress in make_learning_progress(graph["id"], user_id, nodes, rng):
+        await storage.insert_learning_progress(progress)
+    session = await storage.insert_chat_session(
+        {"user_id": user_id, "document_id": document["id"]}
+    )
+    return {
+        "user_id": user_id,
+        "document_id": document["id"],
+        "graph_id": graph["id"],
+        "session_id": session["id"],
+    }
+
+
+def make_graph_output(n_nodes: int, seed: int = 0) -> str:
+    """Model output in the NODES / EDGES format that parse_graph_output expects"""
+    rng = random.Random(seed)
+    nodes = [
+        {
+            "order_index": node["order_index"],
+            "summary": node["summary"],
+            "content": node["content"],
+            "supporting_quotes": node["supporting_quotes"],
+        }
+        for node in make_nodes("graph", n_nodes, rng)
+    ]
+    edges = []
+    for i in range(2, n_nodes + 1):
+        for parent in rng.sample(range(max(1, i - 20), i), min(i - 1, 2)):
+            edges.append({"parent_index": parent, "child_index": i})
+    return (
+        "Some brainstorming before the structured output.\n\nNODES\n"
+        + json.dumps(nodes, indent=4)
+        + "\n\nEDGES\n"
+        + json.dumps(edges, indent=4)
+        + "\n"
+    )
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(n_pages: int, lines_per_page: int = 40, seed: int = 0) -> bytes:
+    """A minimal valid PDF with n_pages of Helvetica text that PyPDF2 can extract"""
+    rng = random.Random(seed)
+    objects: list[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")  # filled in once the page tree exists
+    pages = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_ids = []
+    for _ in range(n_pages):
+        lines = " T* ".join(
+            f"({_pdf_escape(sentence(rng, 10))}) Tj" for _ in range(lines_per_page)
+        )
+        stream = f"BT /F1 10 Tf 12 TL 50 780 Td {lines} ET".encode()
+        content = add(
+            b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        )
+        page_ids.append(
+            add(
+                b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] "
+                b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+                % (pages, font, content)
+            )
+        )
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages
+    objects[pages - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, n_pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        catalog,
+        xref,
+    )
+    return bytes(out)
@@ -0,0 +1,132 @@
+"""Timing, allocation and baseline-comparison machinery for the benchmark suite."""
+
+import asyncio
+import inspect
+import json
+import math
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    iterations: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    peak_alloc_kib: float
+    alloc_blocks: int
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _call(fn: Callable[[], Any | Awaitable[Any]], loop: asyncio.AbstractEventLoop):
+    result = fn()
+    if inspect.isawaitable(result):
+        result = loop.run_until_complete(result)
+    return result
+
+
+def measure(
+    name: str,
+    fn: Callable[[], Any | Awaitable[Any]],
+    min_time: float = 0.5,
+    min_iterations: int = 5,
+    max_iterations: int = 200,
+    loop: asyncio.AbstractEventLoop | None = None,
+) -> BenchmarkResult:
+    """
+    Time fn (sync, or returning an awaitable) until min_time has elapsed, then run it
+    once more under tracemalloc for allocations (kept separate so tracing doesn't skew
+    the timings).
+    """
+    own_loop = loop is None
+    loop = loop or asyncio.new_event_loop()
+    try:
+        _call(fn, loop)  # warm-up
+
+        samples: list[float] = []
+        started = time.perf_counter()
+        while len(samples) < max_iterations and (
+            len(samples) < min_iterations or time.perf_counter() - started < min_time
+        ):
+            start = time.perf_counter()
+            _call(fn, loop)
+            samples.append((time.perf_counter() - start) * 1000)
+
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        baseline_memory, _ = tracemalloc.get_traced_memory()
+        _call(fn, loop)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        blocks = sum(
+            stat.count_diff
+            for stat in after.compare_to(before, "filename")
+            if stat.count_diff > 0
+        )
+    finally:
+        if own_loop:
+            loop.close()
+
+    return BenchmarkResult(
+        name=name,
+        iterations=len(samples),
+        p50_ms=round(percentile(samples, 50), 4),
+        p95_ms=round(percentile(samples, 95), 4),
+        p99_ms=round(percentile(samples, 99), 4),
+        peak_alloc_kib=round((peak - baseline_memory) / 1024, 1),
+        alloc_blocks=blocks,
+    )
+
+
+def format_results(results: list[BenchmarkResult]) -> str:
+    header = f"{'benchmark':<45} {'iters':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'peak KiB':>10}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(
+            f"{r.name:<45} {r.iterations:>6} {r.p50_ms:>10.3f} {r.p95_ms:>10.3f} "
+            f"{r.p99_ms:>10.3f} {r.peak_alloc_kib:>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def save_baseline(results: list[BenchmarkResult], path: str):
+    with open(path, "w") as f:
+        json.dump({r.name: asdict(r) for r in results}, f, indent=2, sort_keys=True)
+
+
+def load_baseline(path: str) -> dict[str, dict]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def find_regressions(
+    results: list[BenchmarkResult],
+    baseline: dict[str, dict],
+    tolerance: float = 0.25,
+    metrics: tuple[str, ...] = ("p50_ms", "p95_ms", "peak_alloc_kib"),
+) -> list[str]:
+    """Describe every metric that is more than `tolerance` worse than the baseline"""
+    regressions = []
+    for result in results:
+        previous = baseline.get(result.name)
+        if previous is None:
+            continue
+        for metric in metrics:
+            old, new = previous[metric], getattr(result, metric)
+            if old > 0 and new > old * (1 + tolerance):
+                regressions.append(
+                    f"{result.name}: {metric} {old} -> {new} (+{(new / old - 1) * 100:.0f}%)"
+                )
+    return regressions
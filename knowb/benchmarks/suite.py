@@ -0,0 +1,127 @@
+"""The backend hot-path benchmarks, each parametrised by a size."""
+
+import asyncio
+import base64
+import random
+from datetime import datetime
+from typing import Callable, Iterator
+
+from benchmarks.fakes import FakeAnthropic
+from benchmarks.generators import (
+    make_graph_output,
+    make_pdf,
+    make_spaced_rep_state,
+    seed_storage,
+)
+from benchmarks.harness import BenchmarkResult, measure
+from src.api.ai.prompts import parse_graph_output
+from src.api.ai import session as chat_session
+from src.api.ai.session import handle_chat_stream
+from src.api.graph import build_graph, get_graph_learning_state
+from src.api.models import LearningProgressUpdate, LearningProgressUpdateData
+from src.api.pdf2text import convert_base64_pdf_to_text
+from src.api.spaced_repetition import apply_learning_update
+from src.storage import MemoryStorage, set_storage
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+DEFAULT_PDF_PAGES = (1, 10, 100)
+
+
+def bench_build_graph(size: int, loop: asyncio.AbstractEventLoop) -> Callable:
+    storage = MemoryStorage()
+    ids = loop.run_until_complete(seed_storage(storage, size))
+    return lambda: build_graph(ids["graph_id"], storage)
+
+
+def bench_get_graph_learning_state(
+    size: int, loop: asyncio.AbstractEventLoop
+) -> Callable:
+    storage = MemoryStorage()
+    ids = loop.run_until_complete(seed_storage(storage, size))
+    return lambda: get_graph_learning_state(ids["graph_id"], datetime.now(), storage)
+
+
+def bench_apply_learning_update(size: int, loop: asyncio.AbstractEventLoop) -> Callable:
+    # size is the length of the review history being extended
+    state = make_spaced_rep_state(random.Random(0), size)
+    update = LearningProgressUpdate(
+        learning_progress_id="progress",
+        created_at=datetime.now(),
+        update_data=LearningProgressUpdateData(quality="good"),
+    )
+    return lambda: apply_learning_update(state, update, datetime.now())
+
+
+def bench_parse_graph_output(size: int, loop: asyncio.AbstractEventLoop) -> Callable:
+    output = make_graph_output(size)
+    return lambda: parse_graph_output(output)
+
+
+def bench_convert_pdf_to_text(pages: int, loop: asyncio.AbstractEventLoop) -> Callable:
+    pdf_base64 = base64.b64encode(make_pdf(pages)).decode("utf-8")
+    return lambda: convert_base64_pdf_to_text(pdf_base64)
+
+
+def bench_handle_chat_stream(size: int, loop: asyncio.AbstractEventLoop) -> Callable:
+    storage = MemoryStorage()
+    ids = loop.run_until_complete(seed_storage(storage, size))
+
+    async def turn():
+        # a fresh session per turn so the chat history doesn't grow across iterations
+        session = await storage.insert_chat_session(
+            {"user_id": ids["user_id"], "document_id": ids["document_id"]}
+        )
+        # handle_chat_stream gets its storage from get_storage(), and its per-chunk
+        # pause would otherwise swamp the time spent in the code being measured
+        chunk_delay = chat_session.STREAM_CHUNK_DELAY
+        set_storage(storage)
+        chat_session.STREAM_CHUNK_DELAY = 0
+        try:
+            async for _ in handle_chat_stream(
+                "What is a parity bit?",
+                session["id"],
+                token=None,
+                client=FakeAnthropic(n_chunks=5),
+            ):
+                pass
+        finally:
+            chat_session.STREAM_CHUNK_DELAY = chunk_delay
+            set_storage(None)
+
+    return turn
+
+
+# name -> (setup, which size grid it uses, max iterations)
+BENCHMARKS: dict[str, tuple[Callable, str, int]] = {
+    "build_graph": (bench_build_graph, "nodes", 200),
+    "get_graph_learning_state": (bench_get_graph_learning_state, "nodes", 200),
+    "apply_learning_update": (bench_apply_learning_update, "history", 200),
+    "parse_graph_output": (bench_parse_graph_output, "nodes", 200),
+    "convert_base64_pdf_to_text": (bench_convert_pdf_to_text, "pages", 50),
+    "handle_chat_stream": (bench_handle_chat_stream, "nodes", 10),
+}
+
+
+def run_suite(
+    sizes: tuple[int, ...] = DEFAULT_SIZES,
+    pdf_pages: tuple[int, ...] = DEFAULT_PDF_PAGES,
+    only: str | None = None,
+    min_time: float = 0.5,
+) -> Iterator[BenchmarkResult]:
+    loop = asyncio.new_event_loop()
+    try:
+        for name, (setup, grid, max_iterations) in BENCHMARKS.items():
+            if only and only not in name:
+                continue
+            for size in pdf_pages if grid == "pages" else sizes:
+                fn = setup(size, loop)
+                yield measure(
+                    f"{name}[{grid}={size}]",
+                    fn,
+                    min_time=min_time,
+                    max_iterations=max_iterations,
+                    loop=loop,
+                )
+    finally:
+        set_storage(None)
+        loop.close()
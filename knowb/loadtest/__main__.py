@@ -0,0 +1,92 @@
+"""
+Load-test /api/chat/stream on main:app against a local fake Anthropic server:
+
+    python -m loadtest --concurrency 1 5 10 25 --turns 2
+    python -m loadtest --tool-use-rate 0.3 --report loadtest_report.json
+    python -m loadtest --compare loadtest_report.json    # diff against an older report
+
+Both servers run in child processes with no network access needed: auth is stubbed
+and the app uses a seeded in-memory storage backend.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from dataclasses import asdict
+
+from loadtest.fake_anthropic import FakeAnthropicConfig
+from loadtest.runner import compare_reports, format_report, report_to_dict, run_level
+from loadtest.servers import STUB_TOKEN, LoadTestServers
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="SSE chat load test")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 5, 10, 25])
+    parser.add_argument("--turns", type=int, default=2, help="turns per virtual user")
+    parser.add_argument(
+        "--nodes", type=int, default=50, help="nodes in the seeded graph"
+    )
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--output-tokens", type=int, default=60)
+    parser.add_argument("--tool-use-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--report", help="write the JSON report here")
+    parser.add_argument("--compare", help="diff the results against this JSON report")
+    parser.add_argument("--show-app-output", action="store_true")
+    args = parser.parse_args(argv)
+
+    fake_config = FakeAnthropicConfig(
+        tokens_per_second=args.tokens_per_second,
+        first_token_delay=args.first_token_delay,
+        output_tokens=args.output_tokens,
+        tool_use_rate=args.tool_use_rate,
+        max_node_index=args.nodes,
+        seed=0,
+    )
+
+    levels = []
+    # every level gets fresh sessions, so chat histories don't grow between levels
+    with LoadTestServers(
+        fake_config,
+        n_nodes=args.nodes,
+        n_sessions=sum(args.concurrency),
+        quiet=not args.show_app_output,
+    ) as servers:
+        offset = 0
+        for concurrency in args.concurrency:
+            sessions = servers.session_ids[offset : offset + concurrency]
+            offset += concurrency
+            print(f"  running concurrency {concurrency}...", file=sys.stderr)
+            levels.append(
+                asyncio.run(
+                    run_level(
+                        servers.app_url,
+                        concurrency,
+                        sessions,
+                        args.turns,
+                        STUB_TOKEN,
+                        args.timeout,
+                    )
+                )
+            )
+
+    print(format_report(levels))
+    for level in levels:
+        for error in level.error_samples:
+            print(f"  [concurrency {level.concurrency}] {error}")
+
+    config = {"turns": args.turns, "nodes": args.nodes, **asdict(fake_config)}
+    report = report_to_dict(config, levels)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print("\n" + compare_reports(json.load(f), report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""
+A local stand-in for the Anthropic Messages API.
+
+Serves POST /v1/messages (with or without "stream": true) using the same JSON and SSE
+event shapes as the real API, at a configurable token rate. Point the app at it with
+ANTHROPIC_BASE_URL=http://127.0.0.1:<port>; the Anthropic SDK picks that up itself.
+
+Prompt caching is simulated too: a prompt prefix ending in a block marked with
+"cache_control" is cached, and a later request repeating it reports that part of its
+input as cache_read_input_tokens.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+TOOL_INPUT_CHUNK_CHARS = 40
+WORDS = "the a parity bit channel noise code error we can see that if then so".split()
+
+
+@dataclass
+class FakeAnthropicConfig:
+    tokens_per_second: float = 50.0  # output token rate of each stream
+    first_token_delay: float = 0.3  # seconds before the first token
+    output_tokens: int = 60  # tokens in each reply
+    tool_use_rate: float = 0.0  # chance that a reply ends in a node_complete call
+    max_node_index: int = 10  # node_complete picks an order_index in 1..max_node_index
+    seed: Optional[int] = None
+
+
+@dataclass
+class FakeReply:
+    tokens: list[str]
+    tool_use: Optional[dict] = None  # the input of a tool call ending the reply
+    tool_name: str = "node_complete"
+
+
+@dataclass
+class FakeAnthropicStats:
+    requests: int = 0
+    streams: int = 0
+    input_chars: int = 0
+    output_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+    requests_by_path: dict[str, int] = field(default_factory=dict)
+
+
+def _answers_tool_result(body: dict) -> bool:
+    content = body["messages"][-1]["content"]
+    return isinstance(content, list) and any(
+        isinstance(block, dict) and block.get("type") == "tool_result"
+        for block in content
+    )
+
+
+def default_responder(
+    config: FakeAnthropicConfig, rng: random.Random
+) -> Callable[[dict], FakeReply]:
+    """Lorem-ipsum replies; a reply to a tool result never calls the tool again"""
+
+    def respond(body: dict) -> FakeReply:
+        tokens = [f"{rng.choice(WORDS)} " for _ in range(config.output_tokens)]
+        tool_use = None
+        if (
+            body.get("tools")
+            and not _answers_tool_result(body)
+            and rng.random() < config.tool_use_rate
+        ):
+            tool_use = {
+                "node_id": rng.randint(1, config.max_node_index),
+                "judgement": rng.choice(["easy", "good", "hard", "failed"]),
+            }
+        return FakeReply(tokens=tokens, tool_use=tool_use)
+
+    return respond
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _tokens(value: Any) -> int:
+    # roughly 4 characters per token, which is all the accounting a load test needs
+    return len(json.dumps(value)) // 4
+
+
+def _prompt_blocks(body: dict) -> list[Any]:
+    """The prompt as a flat list of blocks, in the order the API caches it"""
+    blocks = list(body.get("tools", []))
+    system = body.get("system", [])
+    blocks += [system] if isinstance(system, str) else system
+    for message in body.get("messages", []):
+        content = message["content"]
+        if isinstance(content, str):
+            content = [content]
+        blocks += [{"role": message["role"], "block": block} for block in content]
+    return blocks
+
+
+def _cache_control(block: Any) -> bool:
+    if isinstance(block, dict) and "block" in block:
+        block = block["block"]
+    return isinstance(block, dict) and "cache_control" in block
+
+
+class FakePromptCache:
+    """Prefix hashes (up to a cache_control breakpoint) -> their token counts"""
+
+    def __init__(self):
+        self.prefixes: dict[str, int] = {}
+
+    def usage(self, body: dict, output_tokens: int) -> dict:
+        blocks = _prompt_blocks(body)
+        digest = hashlib.sha256()
+        tokens = 0
+        breakpoints = []
+        for block in blocks:
+            digest.update(json.dumps(block, sort_keys=True).encode())
+            tokens += _tokens(block)
+            if _cache_control(block):
+                breakpoints.append((digest.hexdigest(), tokens))
+
+        read = max(
+            (count for key, count in breakpoints if key in self.prefixes), default=0
+        )
+        created = 0
+        if breakpoints and breakpoints[-1][1] > read:
+            created = breakpoints[-1][1] - read
+            self.prefixes.update(breakpoints)
+        return {
+            "input_tokens": tokens - read - created,
+            "output_tokens": output_tokens,
+            "cache_creation_input_tokens": created,
+            "cache_read_input_tokens": read,
+        }
+
+
+def _content_blocks(reply: FakeReply, tool_use_id: str) -> list[dict]:
+    blocks = [{"type": "text", "text": "".join(reply.tokens)}]
+    if reply.tool_use:
+        blocks.append(
+            {
+                "type": "tool_use",
+                "id": tool_use_id,
+                "name": reply.tool_name,
+                "input": reply.tool_use,
+            }
+        )
+    return blocks
+
+
+def create_fake_anthropic_app(
+    config: FakeAnthropicConfig,
+    responder: Optional[Callable[[dict], FakeReply]] = None,
+) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(config.seed)
+    respond = responder or default_responder(config, rng)
+    stats = FakeAnthropicStats()
+    app.state.stats = stats
+    cache = FakePromptCache()
+
+    async def stream_reply(body: dict, reply: FakeReply, usage: dict, message_id: str):
+        message = {
+            "id": message_id,
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model"),
+            "content": [],
+            "stop_reason": None,
+            "stop_sequence": None,
+            "usage": {**usage, "output_tokens": 1},
+        }
+        yield _sse("message_start", {"type": "message_start", "message": message})
+        yield _sse(
+            "content_block_start",
+            {
+                "type": "content_block_start",
+                "index": 0,
+                "content_block": {"type": "text", "text": ""},
+            },
+        )
+        await asyncio.sleep(config.first_token_delay)
+        for token in reply.tokens:
+            yield _sse(
+                "content_block_delta",
+                {
+                    "type": "content_block_delta",
+                    "index": 0,
+                    "delta": {"type": "text_delta", "text": token},
+                },
+            )
+            await asyncio.sleep(1 / config.tokens_per_second)
+        yield _sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+        if reply.tool_use:
+            yield _sse(
+                "content_block_start",
+                {
+                    "type": "content_block_start",
+                    "index": 1,
+                    "content_block": {
+                        "type": "tool_use",
+                        "id": f"toolu_{uuid.uuid4().hex[:24]}",
+                        "name": reply.tool_name,
+                        "input": {},
+                    },
+                },
+            )
+            # the real API streams tool input in small pieces too
+            partial_json = json.dumps(reply.tool_use)
+            for start in range(0, len(partial_json), TOOL_INPUT_CHUNK_CHARS):
+                yield _sse(
+                    "content_block_delta",
+                    {
+                        "type": "content_block_delta",
+                        "index": 1,
+                        "delta": {
+                            "type": "input_json_delta",
+                            "partial_json": partial_json[
+                                start : start + TOOL_INPUT_CHUNK_CHARS
+                            ],
+                        },
+                    },
+                )
+            yield _sse("content_block_stop", {"type": "content_block_stop", "index": 1})
+        yield _sse(
+            "message_delta",
+            {
+                "type": "message_delta",
+                "delta": {
+                    "stop_reason": "tool_use" if reply.tool_use else "end_turn",
+                    "stop_sequence": None,
+                },
+                "usage": {"output_tokens": len(reply.tokens)},
+            },
+        )
+        yield _sse("message_stop", {"type": "message_stop"})
+
+    @app.post("/v1/messages")
+    async def messages(request: Request) -> Any:
+        body = await request.json()
+        reply = respond(body)
+        stats.requests += 1
+        stats.input_chars += len(json.dumps(body.get("messages", [])))
+        stats.output_tokens += len(reply.tokens)
+        usage = cache.usage(body, len(reply.tokens))
+        stats.cache_creation_input_tokens += usage["cache_creation_input_tokens"]
+        stats.cache_read_input_tokens += usage["cache_read_input_tokens"]
+        path = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+        stats.requests_by_path[path] = stats.requests_by_path.get(path, 0) + 1
+        message_id = f"msg_{uuid.uuid4().hex[:24]}"
+
+        if body.get("stream"):
+            stats.streams += 1
+            return StreamingResponse(
+                stream_reply(body, reply, usage, message_id),
+                media_type="text/event-stream",
+            )
+
+        await asyncio.sleep(
+            config.first_token_delay + len(reply.tokens) / config.tokens_per_second
+        )
+        return JSONResponse(
+            {
+                "id": message_id,
+                "type": "message",
+                "role": "assistant",
+                "model": body.get("model"),
+                "content": _content_blocks(reply, f"toolu_{uuid.uuid4().hex[:24]}"),
+                "stop_reason": "tool_use" if reply.tool_use else "end_turn",
+                "stop_sequence": None,
+                "usage": usage,
+            }
+        )
+
+    @app.get("/stats")
+    async def get_stats():
+        return vars(stats)
+
+    return app
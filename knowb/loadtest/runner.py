@@ -0,0 +1,187 @@
+"""Drive concurrent /api/chat/stream connections and summarise what the clients saw."""
+
+import asyncio
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+import httpx
+
+from benchmarks.harness import percentile
+
+MESSAGES = [
+    "Can you explain what a parity bit does?",
+    "I think it flips when there's an error?",
+    "So the syndrome tells us which bit is wrong.",
+]
+
+
+@dataclass
+class StreamSample:
+    ok: bool
+    ttfb: Optional[float] = None  # seconds until the first data event
+    duration: float = 0.0
+    gaps: list[float] = field(default_factory=list)  # seconds between data events
+    chunks: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class LevelReport:
+    concurrency: int
+    requests: int
+    errors: int
+    error_rate: float
+    wall_time_s: float
+    requests_per_s: float
+    chunks_per_s: float
+    ttfb_ms: dict[str, float]
+    inter_chunk_ms: dict[str, float]
+    duration_ms: dict[str, float]
+    error_samples: list[str]
+
+
+def summarise(samples: list[float]) -> dict[str, float]:
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    ms = [s * 1000 for s in samples]
+    return {
+        "p50": round(percentile(ms, 50), 2),
+        "p95": round(percentile(ms, 95), 2),
+        "p99": round(percentile(ms, 99), 2),
+        "max": round(max(ms), 2),
+    }
+
+
+async def stream_turn(
+    client: httpx.AsyncClient, session_id: str, message: str, token: str
+) -> StreamSample:
+    start = time.perf_counter()
+    last = None
+    sample = StreamSample(ok=False)
+    try:
+        async with client.stream(
+            "GET",
+            "/api/chat/stream",
+            params={"message": message, "session_id": session_id},
+            headers={"Authorization": f"Bearer {token}"},
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                sample.error = f"HTTP {response.status_code}: {response.text[:200]}"
+                return sample
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                now = time.perf_counter()
+                if last is None:
+                    sample.ttfb = now - start
+                else:
+                    sample.gaps.append(now - last)
+                last = now
+                sample.chunks += 1
+                data = line[len("data:") :].strip()
+                if data.startswith("Error occurred"):
+                    sample.error = data[:200]
+                elif data == "[END]":
+                    sample.ok = sample.error is None
+            if not sample.ok and sample.error is None:
+                sample.error = "stream ended without [END]"
+    except httpx.HTTPError as e:
+        sample.error = f"{type(e).__name__}: {e}"
+    finally:
+        sample.duration = time.perf_counter() - start
+    return sample
+
+
+async def run_level(
+    app_url: str,
+    concurrency: int,
+    session_ids: list[str],
+    turns: int,
+    token: str,
+    timeout: float = 120.0,
+) -> LevelReport:
+    """Each of `concurrency` virtual users runs `turns` chat turns on its own session"""
+    limits = httpx.Limits(max_connections=concurrency + 10)
+    async with httpx.AsyncClient(
+        base_url=app_url, timeout=timeout, limits=limits
+    ) as client:
+
+        async def user(session_id: str) -> list[StreamSample]:
+            return [
+                await stream_turn(
+                    client, session_id, MESSAGES[i % len(MESSAGES)], token
+                )
+                for i in range(turns)
+            ]
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(user(s) for s in session_ids[:concurrency]))
+        wall_time = time.perf_counter() - start
+
+    samples = [sample for user_samples in results for sample in user_samples]
+    errors = [s for s in samples if not s.ok]
+    return LevelReport(
+        concurrency=concurrency,
+        requests=len(samples),
+        errors=len(errors),
+        error_rate=round(len(errors) / len(samples), 4) if samples else 0.0,
+        wall_time_s=round(wall_time, 3),
+        requests_per_s=round(len(samples) / wall_time, 3),
+        chunks_per_s=round(sum(s.chunks for s in samples) / wall_time, 2),
+        ttfb_ms=summarise([s.ttfb for s in samples if s.ttfb is not None]),
+        inter_chunk_ms=summarise([gap for s in samples for gap in s.gaps]),
+        duration_ms=summarise([s.duration for s in samples]),
+        error_samples=sorted({s.error for s in errors})[:5],
+    )
+
+
+def format_report(levels: list[LevelReport]) -> str:
+    header = (
+        f"{'conc':>5} {'reqs':>6} {'err%':>6} {'req/s':>8} {'chunk/s':>9} "
+        f"{'ttfb p50':>9} {'ttfb p95':>9} {'gap p50':>8} {'gap p95':>8} {'gap p99':>8}"
+    )
+    lines = [header, "-" * len(header)]
+    for level in levels:
+        lines.append(
+            f"{level.concurrency:>5} {level.requests:>6} {level.error_rate * 100:>6.1f} "
+            f"{level.requests_per_s:>8.2f} {level.chunks_per_s:>9.1f} "
+            f"{level.ttfb_ms['p50']:>9.1f} {level.ttfb_ms['p95']:>9.1f} "
+            f"{level.inter_chunk_ms['p50']:>8.1f} {level.inter_chunk_ms['p95']:>8.1f} "
+            f"{level.inter_chunk_ms['p99']:>8.1f}"
+        )
+    return "\n".join(lines)
+
+
+COMPARED_METRICS = [
+    ("error_rate", None),
+    ("requests_per_s", None),
+    ("chunks_per_s", None),
+    ("ttfb_ms", "p50"),
+    ("ttfb_ms", "p95"),
+    ("inter_chunk_ms", "p95"),
+    ("inter_chunk_ms", "p99"),
+]
+
+
+def compare_reports(old: dict, new: dict) -> str:
+    """Side-by-side diff of two saved reports, per concurrency level"""
+    old_levels = {level["concurrency"]: level for level in old["levels"]}
+    lines = []
+    for level in new["levels"]:
+        previous = old_levels.get(level["concurrency"])
+        if previous is None:
+            continue
+        lines.append(f"concurrency {level['concurrency']}:")
+        for metric, key in COMPARED_METRICS:
+            before = previous[metric][key] if key else previous[metric]
+            after = level[metric][key] if key else level[metric]
+            change = f"{(after / before - 1) * 100:+.0f}%" if before else "n/a"
+            name = f"{metric}.{key}" if key else metric
+            lines.append(f"  {name:<20} {before:>10} -> {after:<10} ({change})")
+    return "\n".join(lines)
+
+
+def report_to_dict(config: dict, levels: list[LevelReport]) -> dict:
+    return {"config": config, "levels": [asdict(level) for level in levels]}
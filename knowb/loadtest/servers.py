@@ -0,0 +1,149 @@
+"""Launch the fake Anthropic server and main:app (stubbed auth, seeded memory storage)."""
+
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from dataclasses import asdict
+from types import SimpleNamespace
+
+from loadtest.fake_anthropic import FakeAnthropicConfig
+
+STUB_TOKEN = "loadtest-token"
+
+
+class StubAuthClient:
+    """Stands in for the Supabase client in get_user_id_from_token"""
+
+    def __init__(self, user_id: str):
+        self.auth = SimpleNamespace(
+            get_user=lambda token: SimpleNamespace(user=SimpleNamespace(id=user_id))
+        )
+
+
+def install_stub_auth(user_id: str):
+    """Make every bearer token resolve to user_id, without calling Supabase"""
+    from src.services import security
+
+    security.get_supabase_client = lambda access_token=None: StubAuthClient(user_id)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def _run_fake_anthropic(port: int, config: dict):
+    import uvicorn
+
+    from loadtest.fake_anthropic import create_fake_anthropic_app
+
+    app = create_fake_anthropic_app(FakeAnthropicConfig(**config))
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _run_app(
+    port: int, anthropic_url: str, n_nodes: int, n_sessions: int, conn, quiet: bool
+):
+    os.environ["ANTHROPIC_BASE_URL"] = anthropic_url
+    os.environ.setdefault("ANTHROPIC_API_KEY", "loadtest-key")
+    if quiet:
+        sys.stdout = open(os.devnull, "w")
+
+    import uvicorn
+
+    import main
+    from benchmarks.generators import seed_storage
+    from src.storage import MemoryStorage, set_storage
+
+    storage = MemoryStorage()
+    set_storage(storage)
+
+    async def seed():
+        ids = await seed_storage(storage, n_nodes)
+        sessions = [
+            await storage.insert_chat_session(
+                {"user_id": ids["user_id"], "document_id": ids["document_id"]}
+            )
+            for _ in range(n_sessions)
+        ]
+        return ids, [session["id"] for session in sessions]
+
+    ids, session_ids = asyncio.run(seed())
+    install_stub_auth(ids["user_id"])
+    conn.send(session_ids)
+    conn.close()
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+class LoadTestServers:
+    """Context manager running both servers in child processes"""
+
+    def __init__(
+        self,
+        config: FakeAnthropicConfig,
+        n_nodes: int,
+        n_sessions: int,
+        quiet: bool = True,
+    ):
+        self.config = config
+        self.n_nodes = n_nodes
+        self.n_sessions = n_sessions
+        self.quiet = quiet
+        self.processes: list[multiprocessing.Process] = []
+
+    def __enter__(self):
+        ctx = multiprocessing.get_context("spawn")
+        anthropic_port, app_port = free_port(), free_port()
+        self.anthropic_url = f"http://127.0.0.1:{anthropic_port}"
+        self.app_url = f"http://127.0.0.1:{app_port}"
+
+        self.processes.append(
+            ctx.Process(
+                target=_run_fake_anthropic,
+                args=(anthropic_port, asdict(self.config)),
+                daemon=True,
+            )
+        )
+        receiver, sender = ctx.Pipe(duplex=False)
+        self.processes.append(
+            ctx.Process(
+                target=_run_app,
+                args=(
+                    app_port,
+                    self.anthropic_url,
+                    self.n_nodes,
+                    self.n_sessions,
+                    sender,
+                    self.quiet,
+                ),
+                daemon=True,
+            )
+        )
+        for process in self.processes:
+            process.start()
+
+        self.session_ids: list[str] = receiver.recv()
+        wait_for_port(anthropic_port)
+        wait_for_port(app_port)
+        return self
+
+    def __exit__(self, *exc):
+        for process in self.processes:
+            process.terminate()
+            process.join(timeout=5)
+        return False
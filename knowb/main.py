@@ -1,13 +1,19 @@
-from fastapi import FastAPI
+import os
+
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from src.api.routes import speech
 from src.api.routes import learning
 from src.api.routes import content_map
 from src.services.security import security
 from src.api.routes import documents
 from src.api.routes import session_routes
+from src.api.routes import settings
 from src.api.routes import test
 from src.api.routes import tts_routes
+from src.jobs.worker import start_in_process_worker, stop_in_process_worker
+from src.services import metrics
 
 app = FastAPI()
 
@@ -21,10 +27,46 @@ app.add_middleware(
 )
 
 # Include routers
-app.include_router(documents.router, prefix="/api/documents")
-app.include_router(content_map.router, prefix="/api/content_map")
-app.include_router(session_routes.router, prefix="/api/chat")
-app.include_router(test.router, prefix="/api/test")
-app.include_router(learning.router, prefix="/api/learning")
-# app.include_router(tts_routes.router)
-app.include_router(speech.router, prefix="/api")
+ROUTERS = {
+    "/api/documents": documents,
+    "/api/content_map": content_map,
+    "/api/chat": session_routes,
+    "/api/test": test,
+    "/api/learning": learning,
+    "/api/settings": settings,
+    # "": tts_routes,
+    "/api": speech,
+}
+for prefix, module in ROUTERS.items():
+    app.include_router(module.router, prefix=prefix)
+
+# request latency per router, labelled with its module's name ("documents", ...)
+app.add_middleware(
+    metrics.MetricsMiddleware,
+    routers={
+        prefix: module.__name__.rsplit(".", 1)[-1] for prefix, module in ROUTERS.items()
+    },
+)
+
+# set METRICS_TOKEN to require "Authorization: Bearer <token>" from the scraper
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(authorization: str = Header(None)):
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# Content maps are generated by `python -m src.jobs.worker`; for local development the
+# web app can run a worker itself instead.
+if os.getenv("CONTENT_MAP_WORKER_IN_PROCESS", "false").lower() == "true":
+
+    @app.on_event("startup")
+    async def start_content_map_worker():
+        start_in_process_worker()
+
+    @app.on_event("shutdown")
+    async def stop_content_map_worker():
+        await stop_in_process_worker()
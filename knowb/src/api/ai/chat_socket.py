@@ -0,0 +1,326 @@
+"""
+A persistent WebSocket per learner, carrying the turns of any of their chat sessions.
+
+The connection authenticates once, with its first message; every turn after that skips
+the token check. Turns run through the same pipeline as the SSE endpoint
+(handle_chat_stream, via src/api/ai/chat_turns.py), so a turn_id is idempotent and a
+turn can be resumed from last_event_id on a new connection.
+
+Client -> server (JSON):
+    {"type": "auth", "token"}                                   first, once
+    {"type": "turn", "session_id", "turn_id", "message", "last_event_id"?, "speak"?}
+
+Server -> client (JSON):
+    {"type": "ready", "user_id"}
+    {"type": "text", "session_id", "turn_id", "id", "data"}      reply text
+    {"type": "tool_use", "session_id", "turn_id", "id", "data"}  a node was completed
+    {"type": "learning_state", "session_id", "graph_id", "changes": [{"node_id", "state"}]}
+    {"type": "end", "session_id", "turn_id", "id"}
+    {"type": "audio", "session_id", "turn_id", "seq", "text", "data"}  with "speak"
+    {"type": "audio_end", "session_id", "turn_id"}
+    {"type": "error", "session_id"?, "turn_id"?, "detail"}
+
+Flow control: outgoing messages go through a bounded queue, so a slow client holds
+up the forwarding of its turns (which keep generating into their replay buffers)
+rather than filling memory. A client that can't take a message within
+CHAT_WS_SEND_TIMEOUT_SECONDS is disconnected; it can reconnect and resume.
+
+A turn with "speak": true is also read out: the reply's text is fed, as it streams
+from the model, through the sentence pipeline of src/api/tts/pipeline.py, and each
+sentence's audio (base64 MP3, in order) follows shortly after its text.
+"""
+
+import asyncio
+import base64
+import os
+from contextlib import aclosing
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.security import HTTPAuthorizationCredentials
+
+from src.api.ai.chat_turns import get_or_start_turn
+from src.api.ai.session import handle_chat_stream
+from src.api.data import session_id_to_graph_id
+from src.api.graph import get_graph_learning_state
+from src.api.tts import SpeakableText, get_tts_service, speak
+from src.services.security import get_user_id_from_token
+from src.storage import Storage, get_storage
+
+SEND_QUEUE_SIZE = int(os.getenv("CHAT_WS_SEND_QUEUE", "256"))
+SEND_TIMEOUT_SECONDS = float(os.getenv("CHAT_WS_SEND_TIMEOUT_SECONDS", "10"))
+AUTH_TIMEOUT_SECONDS = 10
+
+# close codes (4000-4999 are for applications)
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_TOO_SLOW = 4408
+
+TOOL_USE_OPEN, TOOL_USE_CLOSE = "<tool_use>", "</tool_use>"
+# how handle_chat_stream and chat_turns report failures
+ERROR_PREFIXES = ("Error occurred: ", "Error: ")
+
+
+async def node_states(graph_id: str, storage: Storage) -> dict[str, str]:
+    """node id -> past | to_review | not_yet_learned"""
+    state = await get_graph_learning_state(graph_id, datetime.now(), storage)
+    return {
+        node_state.node.id: name
+        for name in ("past", "to_review", "not_yet_learned")
+        for node_state in getattr(state, name)
+    }
+
+
+class ChatConnection:
+    def __init__(
+        self, websocket: WebSocket, token: HTTPAuthorizationCredentials, user_id: str
+    ):
+        self.websocket = websocket
+        self.token = token
+        self.user_id = user_id
+        self.storage = get_storage()
+        self.outbox: asyncio.Queue = asyncio.Queue(SEND_QUEUE_SIZE)
+        self.forwarders: dict[tuple[str, str], asyncio.Task] = {}
+        # per session this connection has used: its graph, and the node states the
+        # client was last told about (to send only what a turn changed)
+        self.graphs: dict[str, str] = {}
+        self.states: dict[str, dict[str, str]] = {}
+
+    async def run(self):
+        await self.outbox.put({"type": "ready", "user_id": self.user_id})
+        sender = asyncio.create_task(self._send_loop())
+        try:
+            while not sender.done():
+                receive = asyncio.create_task(self.websocket.receive_json())
+                await asyncio.wait(
+                    [receive, sender], return_when=asyncio.FIRST_COMPLETED
+                )
+                if not receive.done():
+                    receive.cancel()
+                    break
+                await self._handle(receive.result())
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            sender.cancel()
+            for forwarder in self.forwarders.values():
+                forwarder.cancel()
+
+    async def _send_loop(self):
+        while True:
+            message = await self.outbox.get()
+            try:
+                await asyncio.wait_for(
+                    self.websocket.send_json(message), SEND_TIMEOUT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                print(f"[DEBUG] Closing chat socket of {self.user_id}: client too slow")
+                await self.websocket.close(CLOSE_TOO_SLOW)
+                return
+
+    async def _handle(self, request: dict):
+        if request.get("type") != "turn":
+            await self.outbox.put(
+                {
+                    "type": "error",
+                    "detail": f"Unknown message type {request.get('type')}",
+                }
+            )
+            return
+        session_id = request.get("session_id")
+        turn_id = request.get("turn_id")
+        message = request.get("message")
+        if not (session_id and turn_id and message):
+            await self.outbox.put(
+                {
+                    "type": "error",
+                    "session_id": session_id,
+                    "turn_id": turn_id,
+                    "detail": "A turn needs session_id, turn_id and message",
+                }
+            )
+            return
+        if not await self._owns(session_id):
+            await self.outbox.put(
+                {
+                    "type": "error",
+                    "session_id": session_id,
+                    "turn_id": turn_id,
+                    "detail": "Chat session not found",
+                }
+            )
+            return
+
+        key = (session_id, turn_id)
+        if key in self.forwarders and not self.forwarders[key].done():
+            return
+        try:
+            turn = get_or_start_turn(
+                session_id,
+                turn_id,
+                lambda: handle_chat_stream(
+                    message, session_id, self.token, user_id=self.user_id
+                ),
+                user_id=self.user_id,
+                message=message,
+            )
+        except HTTPException as e:
+            await self.outbox.put(
+                {
+                    "type": "error",
+                    "session_id": session_id,
+                    "turn_id": turn_id,
+                    "detail": e.detail,
+                }
+            )
+            return
+        self.forwarders[key] = asyncio.create_task(
+            self._forward(
+                turn,
+                session_id,
+                turn_id,
+                request.get("last_event_id") or 0,
+                bool(request.get("speak")),
+            )
+        )
+
+    async def _owns(self, session_id: str) -> bool:
+        if session_id in self.graphs:
+            return True
+        session = await self.storage.get_chat_session(session_id)
+        if not session or session["user_id"] != self.user_id:
+            return False
+        graph_id = await session_id_to_graph_id(session_id, self.storage)
+        self.graphs[session_id] = graph_id
+        self.states[graph_id] = await node_states(graph_id, self.storage)
+        return True
+
+    async def _forward(
+        self,
+        turn,
+        session_id: str,
+        turn_id: str,
+        last_event_id: int,
+        speak_reply: bool = False,
+    ):
+        ids = {"session_id": session_id, "turn_id": turn_id}
+        # the reply's text for the speaker, None when it has ended
+        texts: Optional[asyncio.Queue] = asyncio.Queue() if speak_reply else None
+        speaker = asyncio.create_task(self._speak(texts, ids)) if texts else None
+        try:
+            await self._forward_messages(turn, ids, last_event_id, texts)
+            if speaker:
+                await texts.put(None)
+                await speaker
+        except Exception as e:
+            print(f"[ERROR] Forwarding chat turn {turn_id} failed: {e}")
+            await self.outbox.put({"type": "error", **ids, "detail": str(e)})
+        finally:
+            if speaker:
+                speaker.cancel()
+
+    async def _speak(self, texts: asyncio.Queue, ids: dict):
+        async def reply():
+            while (text := await texts.get()) is not None:
+                yield text
+
+        seq = 0
+        async with aclosing(speak(reply(), get_tts_service())) as audio:
+            async for sentence, audio_content in audio:
+                seq += 1
+                await self.outbox.put(
+                    {
+                        "type": "audio",
+                        **ids,
+                        "seq": seq,
+                        "text": sentence,
+                        "data": base64.b64encode(audio_content).decode("ascii"),
+                    }
+                )
+        await self.outbox.put({"type": "audio_end", **ids})
+
+    async def _forward_messages(
+        self,
+        turn,
+        ids: dict,
+        last_event_id: int,
+        texts: Optional[asyncio.Queue] = None,
+    ):
+        session_id = ids["session_id"]
+        speakable = SpeakableText()
+        async with aclosing(turn.replay(last_event_id)) as messages:
+            async for event_id, data in messages:
+                if data == "[END]":
+                    if texts is not None:
+                        await texts.put(speakable.flush())
+                    await self.outbox.put({"type": "end", **ids, "id": event_id})
+                elif data.startswith(ERROR_PREFIXES):
+                    await self.outbox.put({"type": "error", **ids, "detail": data})
+                elif data.startswith(TOOL_USE_OPEN) and data.endswith(TOOL_USE_CLOSE):
+                    content = data[len(TOOL_USE_OPEN) : -len(TOOL_USE_CLOSE)]
+                    await self.outbox.put(
+                        {"type": "tool_use", **ids, "id": event_id, "data": content}
+                    )
+                    await self._send_learning_changes(session_id)
+                    if texts is not None:
+                        # the reply after a tool use starts a new sentence
+                        await texts.put(speakable.flush() + "\n")
+                else:
+                    await self.outbox.put(
+                        {"type": "text", **ids, "id": event_id, "data": data}
+                    )
+                    if texts is not None:
+                        # not the model's <thinking>, nor markup the chat UI hides
+                        await texts.put(speakable.feed(data))
+
+    async def _send_learning_changes(self, session_id: str):
+        graph_id = self.graphs[session_id]
+        states = await node_states(graph_id, self.storage)
+        previous = self.states.get(graph_id, {})
+        self.states[graph_id] = states
+        changes = [
+            {"node_id": node_id, "state": state}
+            for node_id, state in states.items()
+            if previous.get(node_id) != state
+        ]
+        if changes:
+            await self.outbox.put(
+                {
+                    "type": "learning_state",
+                    "session_id": session_id,
+                    "graph_id": graph_id,
+                    "changes": changes,
+                }
+            )
+
+
+async def authenticate(
+    websocket: WebSocket,
+) -> Optional[tuple[HTTPAuthorizationCredentials, str]]:
+    """
+    (token, user id) from the connection's first message, or None (and closed). The
+    token is wrapped like the one HTTP routes get from Depends(security).
+    """
+    try:
+        request = await asyncio.wait_for(websocket.receive_json(), AUTH_TIMEOUT_SECONDS)
+        access_token = request.get("token") if request.get("type") == "auth" else None
+        if access_token:
+            token = HTTPAuthorizationCredentials(
+                scheme="Bearer", credentials=access_token
+            )
+            return token, await get_user_id_from_token(token)
+    except (asyncio.TimeoutError, WebSocketDisconnect):
+        return None
+    except Exception as e:
+        print(f"[DEBUG] Chat socket authentication failed: {e}")
+    await websocket.close(CLOSE_UNAUTHORIZED)
+    return None
+
+
+async def serve_chat_socket(websocket: WebSocket):
+    await websocket.accept()
+    credentials = await authenticate(websocket)
+    if credentials is None:
+        return
+    token, user_id = credentials
+    await ChatConnection(websocket, token, user_id).run()
@@ -0,0 +1,184 @@
+"""
+Chat turns as resumable server-sent event streams.
+
+A turn is identified by the session and a client-chosen turn id (the idempotency key).
+Its generation runs as a task of its own, so it is not tied to the connection that
+started it: every message it produces gets the next event id and goes into a bounded
+replay buffer. A request for a turn that is already running (or finished less than
+CHAT_TURN_RETENTION_SECONDS ago) does not start a new model call or store the user's
+message again; it attaches to the turn, replaying what came after its Last-Event-ID.
+Only the user who started a turn can attach to it, and only with the same message: a
+turn id reused for a different message is a conflict (409), not a resume.
+
+When the last client of an unfinished turn disconnects and none comes back within
+CHAT_DISCONNECT_GRACE_SECONDS, the turn is cancelled, which stops the model's stream
+(src/api/ai/session.py keeps the partial reply, marked interrupted).
+
+Turns live in this process, so a client must reconnect to the same backend process to
+resume (true for a single worker or sticky sessions).
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterator, Callable, Optional
+
+from fastapi import HTTPException
+
+REPLAY_BUFFER_EVENTS = int(os.getenv("CHAT_REPLAY_BUFFER_EVENTS", "2000"))
+TURN_RETENTION_SECONDS = float(os.getenv("CHAT_TURN_RETENTION_SECONDS", "120"))
+DISCONNECT_GRACE_SECONDS = float(os.getenv("CHAT_DISCONNECT_GRACE_SECONDS", "5"))
+# how soon a dropped EventSource should try again
+RECONNECT_MILLISECONDS = 1000
+
+
+def format_sse(data: str, event_id: Optional[int] = None) -> str:
+    """One SSE event; each line of data gets its own data: field"""
+    lines = [] if event_id is None else [f"id: {event_id}"]
+    lines += [f"data: {line}" for line in data.replace("\r\n", "\n").split("\n")]
+    return "\n".join(lines) + "\n\n"
+
+
+def parse_last_event_id(value: Optional[str]) -> int:
+    try:
+        return int(value) if value else 0
+    except ValueError:
+        return 0
+
+
+class ChatTurn:
+    def __init__(
+        self,
+        key: tuple[str, str],
+        messages: AsyncIterator[str],
+        user_id: Optional[str] = None,
+        message: Optional[str] = None,
+    ):
+        self.key = key
+        # who started the turn, and with what, to tell a resume from a misuse of the key
+        self.user_id = user_id
+        self.message = message
+        self.buffer: deque[tuple[int, str]] = deque(maxlen=REPLAY_BUFFER_EVENTS)
+        self.last_id = 0
+        self.finished_at: Optional[float] = None
+        self.listeners = 0
+        self._abandon_handle: Optional[asyncio.TimerHandle] = None
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._run(messages))
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    def _append(self, data: str):
+        self.last_id += 1
+        self.buffer.append((self.last_id, data))
+        # wake everyone waiting, then start a new generation of waiters
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _run(self, messages: AsyncIterator[str]):
+        try:
+            async for data in messages:
+                self._append(data)
+        except asyncio.CancelledError:
+            # for a client that comes back too late: don't wait for more
+            self._append("Error: the reply was interrupted")
+            raise
+        except Exception as e:
+            print(f"[ERROR] Chat turn {self.key} failed: {e}")
+            self._append(f"Error occurred: {e}")
+        finally:
+            self.finished_at = time.monotonic()
+            self._changed.set()
+
+    def _abandon(self):
+        if self.listeners == 0 and not self.done:
+            print(f"[DEBUG] Cancelling chat turn {self.key}: its client left")
+            self.task.cancel()
+
+    def _attach(self):
+        self.listeners += 1
+        if self._abandon_handle is not None:
+            self._abandon_handle.cancel()
+            self._abandon_handle = None
+
+    def _detach(self):
+        self.listeners -= 1
+        if self.listeners == 0 and not self.done:
+            self._abandon_handle = asyncio.get_running_loop().call_later(
+                DISCONNECT_GRACE_SECONDS, self._abandon
+            )
+
+    async def replay(
+        self, last_event_id: int = 0
+    ) -> AsyncIterator[tuple[Optional[int], str]]:
+        """
+        (event id, message) for each of this turn's messages after last_event_id, as
+        they come, until the turn ends. The client counts as listening meanwhile.
+        """
+        self._attach()
+        try:
+            while True:
+                changed = self._changed
+                # read before the buffer: once done, the buffer holds everything
+                done = self.done
+                oldest = self.buffer[0][0] if self.buffer else self.last_id + 1
+                if last_event_id + 1 < oldest:
+                    # the client fell further behind than the buffer reaches
+                    yield None, "Error: the stream can't be resumed, please reload"
+                    return
+                for event_id, data in list(self.buffer):
+                    if event_id > last_event_id:
+                        yield event_id, data
+                        last_event_id = event_id
+                if done:
+                    return
+                await changed.wait()
+        finally:
+            self._detach()
+
+    async def events(self, last_event_id: int = 0) -> AsyncIterator[str]:
+        """This turn's messages after last_event_id as SSE, until the turn ends"""
+        yield f"retry: {RECONNECT_MILLISECONDS}\n\n"
+        async with aclosing(self.replay(last_event_id)) as messages:
+            async for event_id, data in messages:
+                yield format_sse(data, event_id)
+
+
+_turns: dict[tuple[str, str], ChatTurn] = {}
+
+
+def _forget_finished_turns():
+    now = time.monotonic()
+    for key, turn in list(_turns.items()):
+        if turn.done and now - turn.finished_at > TURN_RETENTION_SECONDS:
+            del _turns[key]
+
+
+def get_or_start_turn(
+    session_id: str,
+    turn_id: str,
+    start: Callable[[], AsyncIterator[str]],
+    *,
+    user_id: str,
+    message: str,
+) -> ChatTurn:
+    """
+    The turn for this key, started with start() unless it is already known. Raises a
+    403 if the known turn is another user's, and a 409 if it was for another message.
+    """
+    _forget_finished_turns()
+    key = (session_id, turn_id)
+    turn = _turns.get(key)
+    if turn is None:
+        turn = _turns[key] = ChatTurn(key, start(), user_id, message)
+    elif turn.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Chat turn belongs to another user")
+    elif turn.message != message:
+        raise HTTPException(
+            status_code=409, detail="Turn id was already used for a different message"
+        )
+    return turn
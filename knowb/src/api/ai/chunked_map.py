@@ -0,0 +1,297 @@
+"""
+Map-reduce content maps for documents too long to map in one pass.
+
+    map:    split the PDF into page ranges and extract nodes (with the edges between
+            them) from each range, CHUNK_CONCURRENCY ranges at a time
+    merge:  renumber the nodes in document order and drop the duplicates that the
+            overlapping pages produce
+    stitch: one text-only call over the merged node summaries adds the prerequisite
+            edges that cross from one range to another
+"""
+
+import base64
+import io
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from anthropic import Anthropic
+from PyPDF2 import PdfReader, PdfWriter
+
+from src.api.ai.prompts import (
+    CHUNK_PROMPT,
+    CONTENT_MAP_TOOL,
+    STITCH_PROMPT,
+    TOOL_OUTPUT_NOTE,
+)
+from src.api.ai.repair import repair_content_map
+from src.api.ai.stream_parse import GraphStreamParser
+from src.api.ai.usage import UsageLog
+from src.api.models import ContentMapEdge, ContentMapEdgePreID, ContentMapNode
+from src.services.metrics import LLMCallTimer
+from src.users.user_settings import UserPrompt
+
+CHUNK_PAGES = int(os.getenv("CONTENT_MAP_CHUNK_PAGES", "20"))
+CHUNK_OVERLAP_PAGES = int(os.getenv("CONTENT_MAP_CHUNK_OVERLAP_PAGES", "1"))
+CHUNK_CONCURRENCY = int(os.getenv("CONTENT_MAP_CHUNK_CONCURRENCY", "4"))
+# summaries in neighbouring chunks sharing at least this fraction of their words
+# (Jaccard similarity) are taken to be the same concept
+DUPLICATE_SIMILARITY = 0.8
+
+
+@dataclass
+class PdfChunk:
+    first_page: int  # 1-based, inclusive
+    last_page: int
+    total_pages: int
+    pdf: bytes
+
+
+@dataclass
+class ChunkMap:
+    chunk: PdfChunk
+    nodes: list[ContentMapNode]
+    edges: list[ContentMapEdge]
+
+
+def count_pages(pdf_content: bytes) -> int:
+    return len(PdfReader(io.BytesIO(pdf_content)).pages)
+
+
+def split_pdf(
+    pdf_content: bytes,
+    chunk_pages: int = CHUNK_PAGES,
+    overlap: int = CHUNK_OVERLAP_PAGES,
+) -> list[PdfChunk]:
+    """Split a PDF into page ranges of chunk_pages, each sharing `overlap` pages with the last"""
+    reader = PdfReader(io.BytesIO(pdf_content))
+    total = len(reader.pages)
+    step = max(chunk_pages - overlap, 1)
+    chunks = []
+    for start in range(0, total, step):
+        end = min(start + chunk_pages, total)
+        writer = PdfWriter()
+        for page in reader.pages[start:end]:
+            writer.add_page(page)
+        out = io.BytesIO()
+        writer.write(out)
+        chunks.append(PdfChunk(start + 1, end, total, out.getvalue()))
+        if end == total:
+            break
+    return chunks
+
+
+def extract_chunk(
+    client: Anthropic,
+    chunk: PdfChunk,
+    user_prompt: UserPrompt,
+    model: str,
+    usage: UsageLog,
+) -> ChunkMap:
+    pdf_base64 = base64.b64encode(chunk.pdf).decode("utf-8")
+    chunk_prompt = CHUNK_PROMPT.format(
+        first_page=chunk.first_page,
+        last_page=chunk.last_page,
+        total_pages=chunk.total_pages,
+    )
+    final_prompt = user_prompt.prompt_texts["final_prompt"]
+    stage = f"pages {chunk.first_page}-{chunk.last_page}"
+    request = dict(
+        model=model,
+        betas=["pdfs-2024-09-25"],
+        max_tokens=8192,
+        tools=[CONTENT_MAP_TOOL],
+        tool_choice={"type": "tool", "name": CONTENT_MAP_TOOL["name"]},
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "document",
+                        "source": {
+                            "type": "base64",
+                            "media_type": "application/pdf",
+                            "data": pdf_base64,
+                        },
+                    },
+                    {
+                        "type": "text",
+                        "text": f"{chunk_prompt}\n\n{final_prompt}\n\n{TOOL_OUTPUT_NOTE}",
+                    },
+                ],
+            }
+        ],
+    )
+    timer = LLMCallTimer(model, request)
+    response = client.beta.messages.create(**request)
+    usage.record(stage, response.usage)
+    timer.finish(response.usage, response)
+
+    # the same path as a single-pass map: the graph is the tool's input, and invalid
+    # nodes and edges get a small repair request instead of failing the whole job
+    parser = GraphStreamParser(tool_input=True)
+    for block in response.content:
+        if block.type == "tool_use":
+            parser.feed(json.dumps(block.input))
+    repair_content_map(client, model, parser, usage, rerun_stages=(stage,))
+    if not parser.nodes:
+        print(f"[DEBUG] Pages {chunk.first_page}-{chunk.last_page}: no valid nodes")
+        return ChunkMap(chunk, [], [])
+    nodes, edges = parser.finish()
+    print(
+        f"[DEBUG] Pages {chunk.first_page}-{chunk.last_page}: "
+        f"{len(nodes)} nodes, {len(edges)} edges"
+    )
+    return ChunkMap(chunk, nodes, edges)
+
+
+def _words(summary: str) -> set[str]:
+    return set(re.findall(r"[a-z0-9]+", summary.lower()))
+
+
+def _is_duplicate(a: ContentMapNode, b: ContentMapNode) -> bool:
+    a_words, b_words = _words(a.summary), _words(b.summary)
+    if not a_words or not b_words:
+        return False
+    return len(a_words & b_words) / len(a_words | b_words) >= DUPLICATE_SIMILARITY
+
+
+def merge_chunk_maps(
+    chunk_maps: list[ChunkMap],
+) -> tuple[list[ContentMapNode], list[ContentMapEdge], dict[str, int]]:
+    """
+    Concatenate the chunk maps in document order, renumbering order_index from 1.
+
+    A node that duplicates one from the previous chunk (the chunks overlap by a page or
+    so) is folded into it: its quotes are kept, the longer content wins and its edges
+    are redirected. Returns the nodes, the deduplicated edges, and each node's chunk.
+    """
+    nodes: list[ContentMapNode] = []
+    chunk_of: dict[str, int] = {}
+    # duplicate node id -> id of the node it was merged into
+    replaced: dict[str, str] = {}
+    previous: list[ContentMapNode] = []
+
+    for chunk_index, chunk_map in enumerate(chunk_maps):
+        current = []
+        for node in sorted(chunk_map.nodes, key=lambda n: n.order_index):
+            original = next((p for p in previous if _is_duplicate(p, node)), None)
+            if original is not None:
+                replaced[node.id] = original.id
+                original.supporting_quotes += [
+                    q
+                    for q in node.supporting_quotes
+                    if q not in original.supporting_quotes
+                ]
+                if len(node.content) > len(original.content):
+                    original.content = node.content
+                continue
+            node.order_index = len(nodes) + 1
+            nodes.append(node)
+            current.append(node)
+            chunk_of[node.id] = chunk_index
+        previous = current
+
+    edges: list[ContentMapEdge] = []
+    seen = set()
+    for chunk_map in chunk_maps:
+        for edge in chunk_map.edges:
+            parent = replaced.get(edge.parent_id, edge.parent_id)
+            child = replaced.get(edge.child_id, edge.child_id)
+            if parent != child and (parent, child) not in seen:
+                seen.add((parent, child))
+                edges.append(ContentMapEdge(parent_id=parent, child_id=child))
+    return nodes, edges, chunk_of
+
+
+def parse_edges_output(
+    output: str, nodes: list[ContentMapNode]
+) -> list[ContentMapEdge]:
+    """Parse an "EDGES" JSON list, skipping edges that name unknown nodes"""
+    sections = output.split("EDGES")
+    if len(sections) < 2:
+        raise ValueError("Output must contain an 'EDGES' delimiter")
+    try:
+        edges_pre = [ContentMapEdgePreID(**e) for e in json.loads(sections[-1].strip())]
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON in edges section: {e}")
+    node_index_to_id = {node.order_index: node.id for node in nodes}
+    return [
+        ContentMapEdge(
+            parent_id=node_index_to_id[edge.parent_index],
+            child_id=node_index_to_id[edge.child_index],
+        )
+        for edge in edges_pre
+        if edge.parent_index in node_index_to_id
+        and edge.child_index in node_index_to_id
+        and edge.parent_index != edge.child_index
+    ]
+
+
+def stitch_edges(
+    client: Anthropic,
+    nodes: list[ContentMapNode],
+    edges: list[ContentMapEdge],
+    chunk_of: dict[str, int],
+    model: str,
+    usage: UsageLog,
+) -> list[ContentMapEdge]:
+    """Ask for the cross-chunk edges; returns them (not the ones passed in)"""
+    order_index = {node.id: node.order_index for node in nodes}
+    prompt = STITCH_PROMPT.format(
+        nodes="\n".join(
+            f"{node.order_index} [{chunk_of[node.id] + 1}]: {node.summary}"
+            for node in nodes
+        ),
+        edges="\n".join(
+            f"{order_index[edge.parent_id]} -> {order_index[edge.child_id]}"
+            for edge in edges
+        ),
+    )
+    request = dict(
+        model=model,
+        max_tokens=4096,
+        messages=[{"role": "user", "content": prompt}],
+    )
+    timer = LLMCallTimer(model, request)
+    response = client.messages.create(**request)
+    usage.record("stitch", response.usage)
+    timer.finish(response.usage, response)
+    existing = {(edge.parent_id, edge.child_id) for edge in edges}
+    return [
+        edge
+        for edge in parse_edges_output(response.content[0].text, nodes)
+        if chunk_of[edge.parent_id] != chunk_of[edge.child_id]
+        and (edge.parent_id, edge.child_id) not in existing
+    ]
+
+
+def make_chunked_content_map(
+    pdf_content: bytes,
+    user_prompt: UserPrompt,
+    client: Anthropic,
+    model: str,
+    chunk_pages: int = CHUNK_PAGES,
+    concurrency: int = CHUNK_CONCURRENCY,
+    usage: UsageLog = None,
+) -> tuple[list[ContentMapNode], list[ContentMapEdge]]:
+    usage = usage if usage is not None else UsageLog()
+    chunks = split_pdf(pdf_content, chunk_pages)
+    print(f"[DEBUG] Mapping {chunks[-1].last_page} pages in {len(chunks)} chunks")
+
+    # the client is blocking, so the concurrency cap is the size of the thread pool
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        chunk_maps = list(
+            pool.map(
+                lambda chunk: extract_chunk(client, chunk, user_prompt, model, usage),
+                chunks,
+            )
+        )
+
+    nodes, edges, chunk_of = merge_chunk_maps(chunk_maps)
+    if len(chunks) > 1:
+        edges += stitch_edges(client, nodes, edges, chunk_of, model, usage)
+    print(f"[DEBUG] Chunked content map usage:\n{usage.summary()}")
+    return nodes, edges
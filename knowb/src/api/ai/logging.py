@@ -1,192 +1,224 @@
+"""
+Logging of LLM calls. A call wrapped with log_llm_call (litellm) or log_anthropic_call
+(the Anthropic SDK), or timed with src/services/metrics.py's LLMCallTimer (every model
+call the app makes), is recorded as one JSON line in logs/llm_calls.jsonl:
+
+    {"ts", "provider", "model", "status", "latency_ms", "usage", "error", "cost_usd",
+     "payload": {"request", "response"}}
+
+The request path does as little as possible: it times the call and puts the record on
+a queue. Serialization, cost and file writes happen on a background thread (see
+src/services/jsonl_log.py). Request and response bodies are only logged for a sample of
+calls (LLM_LOG_PAYLOAD_SAMPLE_RATE) and for failed ones; the logged request is a
+redacted copy (document and image data, API keys), so the live request is never
+modified. The file rotates when it reaches LLM_LOG_MAX_BYTES or gets
+LLM_LOG_ROTATE_SECONDS old, keeping LLM_LOG_BACKUP_COUNT old files.
+"""
+
+import atexit
 import functools
-import json
 import logging
-from datetime import datetime
 import os
-import litellm
-from anthropic import Anthropic
-import sys
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+from src.api.ai.usage import usage_cost
+from src.services.jsonl_log import JsonLinesLog, resolve
+
+LOG_DIR = os.getenv("LLM_LOG_DIR", "logs")
+LOG_FILE = "llm_calls.jsonl"
+PAYLOAD_SAMPLE_RATE = float(os.getenv("LLM_LOG_PAYLOAD_SAMPLE_RATE", "0.05"))
+MAX_BYTES = int(os.getenv("LLM_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+ROTATE_SECONDS = float(os.getenv("LLM_LOG_ROTATE_SECONDS", str(24 * 60 * 60)))
+BACKUP_COUNT = int(os.getenv("LLM_LOG_BACKUP_COUNT", "14"))
+
+REDACTED_HEADERS = {"authorization", "x-api-key", "api-key", "api_key"}
+
+
+#
+# REDACTION
+#
+
+
+def redact(value: Any) -> Any:
+    """
+    A copy of a request (or part of one) for logging, with base64 document and image
+    data and credentials replaced. Containers are copied, never changed in place.
+    """
+    if isinstance(value, dict):
+        if value.get("type") == "base64" and "data" in value:
+            return {**value, "data": f"<{len(value['data'])} base64 chars removed>"}
+        return {
+            key: (
+                "<redacted>"
+                if isinstance(key, str) and key.lower() in REDACTED_HEADERS
+                else redact(item)
+            )
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
 
-# Set verbose to True to see more detailed logs
-# litellm.set_verbose = True # this is deprecated, instead:
-os.environ["LITELLM_LOG"] = "DEBUG"
 
+def _jsonable(value: Any) -> Any:
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if hasattr(value, "dict"):
+        return value.dict()
+    return value
 
-# Configure logging to write to a file in a logs directory
-LOG_DIR = "logs"
-os.makedirs(LOG_DIR, exist_ok=True)
 
-# Create a new log file for each day
-log_file = os.path.join(LOG_DIR, f"llm_{datetime.now().strftime('%Y%m%d')}.log")
+#
+# WRITER
+#
 
-# Create two loggers: one for console, one for file
-console_logger = logging.getLogger("llm.console")
-file_logger = logging.getLogger("llm.file")
 
-# Configure console logger (simple format, no JSON)
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)
-console_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-)
-console_logger.addHandler(console_handler)
-console_logger.setLevel(logging.DEBUG)
-
-# Configure file logger (detailed format, with JSON)
-file_handler = logging.FileHandler(log_file)
-file_handler.setLevel(logging.DEBUG)
-file_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-)
-file_logger.addHandler(file_handler)
-file_logger.setLevel(logging.DEBUG)
-
-
-def log_llm_call(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        # Create a clean version of the request for logging
-        log_kwargs = kwargs.copy()
-
-        # For debugging, let's print the actual data length before removal
-        if "messages" in log_kwargs:
-            for msg in log_kwargs["messages"]:
-                if isinstance(msg.get("content"), list):
-                    for content in msg["content"]:
-                        if (
-                            isinstance(content, dict)
-                            and content.get("type") == "document"
-                            and "data" in content.get("source", {})
-                        ):
-                            print(
-                                f"DEBUG: Base64 data length before removal: {len(content['source']['data'])}",
-                                file=sys.stderr,
-                            )
-                            print(
-                                f"DEBUG: Base64 data starts with: {content['source']['data'][:50]}",
-                                file=sys.stderr,
-                            )
-
-        model = kwargs.get("model", "unknown_model")
-
-        # Calculate input tokens
-        input_tokens = litellm.token_counter(
-            model=model, messages=kwargs.get("messages", [])
+class SummaryFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = resolve(record)
+        return (
+            f"LLM call - {entry['provider']} {entry['model']} - {entry['status']} - "
+            f"{entry['latency_ms']:.0f}ms - usage {entry.get('usage')}"
         )
 
-        # Log the request
-        console_logger.debug(f"LLM Request - Model: {model}")
-        console_logger.debug(f"LLM Request - Input tokens: {input_tokens}")
 
-        file_logger.debug(f"LLM Request - Model: {model}")
-        file_logger.debug(f"LLM Request - Input tokens: {input_tokens}")
-        file_logger.debug(
-            f"LLM Request - Headers: {json.dumps(kwargs.get('headers', {}), indent=2)}"
+class LLMCallLog(JsonLinesLog):
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = MAX_BYTES,
+        rotate_seconds: float = ROTATE_SECONDS,
+        backups: int = BACKUP_COUNT,
+        console: bool = True,
+    ):
+        super().__init__(
+            path,
+            max_bytes,
+            rotate_seconds,
+            backups,
+            console=SummaryFormatter() if console else None,
         )
-        file_logger.debug(f"LLM Request - Payload: {json.dumps(log_kwargs, indent=2)}")
-
-        # Make the actual API call
-        try:
-            response = func(*args, **kwargs)
-
-            # Get output tokens and cost
-            output_tokens = len(
-                response.choices[0].message.content
-            )  # This is an approximation
-            total_cost = litellm.completion_cost(completion_response=response)
-
-            # Log the response
-            console_logger.debug(f"LLM Response - Output tokens: {output_tokens}")
-            console_logger.debug(f"LLM Response - Total cost: ${total_cost:.6f}")
-
-            file_logger.debug(f"LLM Response - Output tokens: {output_tokens}")
-            file_logger.debug(f"LLM Response - Total cost: ${total_cost:.6f}")
-            file_logger.debug(
-                f"LLM Response - Content: {json.dumps(response.dict(), indent=2)}"
-            )
 
+
+call_log = LLMCallLog(os.path.join(LOG_DIR, LOG_FILE))
+atexit.register(call_log.close)
+
+
+#
+# WRAPPERS
+#
+
+
+def _start_entry(provider: str, kwargs: dict) -> dict:
+    return {
+        "ts": datetime.now(timezone.utc).isoformat(),
+        "provider": provider,
+        "model": kwargs.get("model", "unknown_model"),
+        "sampled": random.random() < PAYLOAD_SAMPLE_RATE,
+    }
+
+
+def _finish_entry(
+    entry: dict,
+    started: float,
+    kwargs: dict,
+    response: Any = None,
+    error: Optional[Exception] = None,
+    usage: Callable[[Any], Any] = lambda response: None,
+    cost: Optional[Callable[[], float]] = None,
+):
+    entry["latency_ms"] = (time.perf_counter() - started) * 1000
+    entry["status"] = "error" if error else "ok"
+    entry["error"] = f"{type(error).__name__}: {error}" if error else None
+    deferred = {}
+    if error is None:
+        deferred["usage"] = lambda: _jsonable(usage(response))
+        if cost:
+            deferred["cost_usd"] = cost
+    if entry["sampled"] or error:
+        # redact now: the caller may reuse or change the request once we return
+        request = redact(kwargs)
+        deferred["payload"] = lambda: {
+            "request": request,
+            "response": _jsonable(response) if response is not None else None,
+        }
+    entry["deferred"] = deferred
+    call_log.log(entry)
+
+
+def _logged(provider: str, usage: Callable, cost: Optional[Callable] = None):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            entry = _start_entry(provider, kwargs)
+            started = time.perf_counter()
+            try:
+                response = func(*args, **kwargs)
+            except Exception as e:
+                _finish_entry(entry, started, kwargs, error=e)
+                raise
+            _finish_entry(
+                entry,
+                started,
+                kwargs,
+                response=response,
+                usage=usage,
+                cost=(lambda: cost(response)) if cost else None,
+            )
             return response
-        except Exception as e:
-            error_msg = f"LLM Error: {str(e)}"
-            console_logger.error(error_msg)
-            file_logger.error(error_msg)
-            raise
-
-    return wrapper
-
-
-# Wrap the completion function with our logging decorator
-llm_call = log_llm_call(litellm.completion)
-
-
-def log_anthropic_call(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        # Debug the actual request before any modification
-        print("\nDEBUG ANTHROPIC REQUEST:", file=sys.stderr)
-        if "messages" in kwargs:
-            for msg in kwargs["messages"]:
-                if isinstance(msg.get("content"), list):
-                    for content in msg["content"]:
-                        if (
-                            isinstance(content, dict)
-                            and content.get("type") == "document"
-                            and "source" in content
-                            and "data" in content["source"]
-                        ):
-                            print(
-                                f"PDF data length: {len(content['source']['data'])}",
-                                file=sys.stderr,
-                            )
-                            print(
-                                f"PDF data starts with: {content['source']['data'][:100]}",
-                                file=sys.stderr,
-                            )
-                            print(
-                                f"PDF data ends with: {content['source']['data'][-100:]}",
-                                file=sys.stderr,
-                            )
-
-        # Create a clean version of the request for logging (without the PDF data)
-        log_kwargs = kwargs.copy()
-        if "messages" in log_kwargs:
-            log_messages = log_kwargs["messages"].copy()
-            # Remove base64 PDF data from logged message
-            for msg in log_messages:
-                if isinstance(msg.get("content"), list):
-                    for content in msg["content"]:
-                        if content.get("type") == "document":
-                            content["source"]["data"] = "<PDF_DATA_REMOVED>"
-            log_kwargs["messages"] = log_messages
-
-        model = kwargs.get("model", "unknown_model")
-
-        # Make the actual API call
-        try:
-            response = func(*args, **kwargs)
-            print("Anthropic call succeeded!", file=sys.stderr)
-            return response
-        except Exception as e:
-            print(f"Anthropic call failed with error: {str(e)}", file=sys.stderr)
-            raise
 
-    return wrapper
+        return wrapper
 
+    return decorator
 
-# Initialize Anthropic client
-anthropic = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
 
+def _litellm_cost(response: Any) -> float:
+    import litellm
+
+    return litellm.completion_cost(completion_response=response)
+
+
+log_llm_call = _logged(
+    "litellm",
+    usage=lambda response: getattr(response, "usage", None),
+    cost=_litellm_cost,
+)
+
+log_anthropic_call = _logged(
+    "anthropic", usage=lambda response: getattr(response, "usage", None)
+)
 
-# Create a wrapped version of the messages endpoint
-@log_anthropic_call
-def anthropic_call(model: str, messages: list, max_tokens: int = 4096, **kwargs):
-    # Remove any extra kwargs that might interfere
-    kwargs.pop("headers", None)
 
-    # Make the call exactly like the standalone example
-    return anthropic.beta.messages.create(
-        model=model,
-        messages=messages,
-        max_tokens=max_tokens,
-        betas=["pdfs-2024-09-25"],
+def llm_call(*args, **kwargs):
+    """litellm.completion, logged"""
+    # imported here: litellm takes seconds to import, and only this needs it
+    import litellm
+
+    return log_llm_call(litellm.completion)(*args, **kwargs)
+
+
+def log_call(
+    model: str,
+    started: float,
+    request: Optional[dict] = None,
+    response: Any = None,
+    usage: Any = None,
+    error: Optional[Exception] = None,
+):
+    """
+    Log an Anthropic call timed by the caller (see LLMCallTimer), e.g. a stream, whose
+    usage is only known at the end. started is its time.perf_counter() start.
+    """
+    request = request if request is not None else {"model": model}
+    _finish_entry(
+        _start_entry("anthropic", request),
+        started,
+        request,
+        response=response,
+        error=error,
+        usage=lambda response: usage,
+        cost=lambda: usage_cost(model, usage),
     )
@@ -1,16 +1,34 @@
 import base64
 from anthropic import Anthropic
 import os
+from typing import Callable, Optional
 
+from src.api.data import InvalidDocumentError
 from src.api.models import ContentMapEdge, ContentMapNode
-from src.api.ai.prompts import parse_graph_output
+from src.api.ai.chunked_map import CHUNK_PAGES, count_pages, make_chunked_content_map
+from src.api.ai.prompts import CONTENT_MAP_TOOL, TOOL_OUTPUT_NOTE
+from src.api.ai.repair import repair_content_map
+from src.api.ai.stream_parse import GraphStreamParser
+from src.api.ai.usage import UsageLog
+from src.services.metrics import LLMCallTimer
 from src.users.user_settings import UserPrompt
 
+MODEL = "claude-3-5-sonnet-20240620"
+BETAS = ["pdfs-2024-09-25", "prompt-caching-2024-07-31"]
+
 
 def make_content_map(
     pdf_content: bytes,
     user_prompt: UserPrompt,
+    client: Anthropic = None,
+    usage: UsageLog = None,
+    on_node: Optional[Callable[[ContentMapNode], None]] = None,
 ) -> tuple[list[ContentMapNode], list[ContentMapEdge]]:
+    """
+    Returns the nodes and edges; pass a UsageLog to get the token usage per call.
+    on_node is called with each node as soon as it has streamed in (single-pass
+    documents only: the chunked path returns everything at the end).
+    """
     # Use the prompt texts directly from the UserPrompt object
     brainstorm_prompt = user_prompt.prompt_texts["brainstorm_prompt"]
     final_prompt = user_prompt.prompt_texts["final_prompt"]
@@ -18,79 +36,106 @@ def make_content_map(
 
     # Ensure we have valid PDF content
     if not pdf_content.startswith(b"%PDF"):
-        raise ValueError("Invalid PDF content received")
+        raise InvalidDocumentError("Invalid PDF content received")
+
+    # Initialize Anthropic client
+    client = client or Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+    usage = usage if usage is not None else UsageLog()
+
+    # Long documents are mapped in page ranges and then stitched together
+    if count_pages(pdf_content) > CHUNK_PAGES:
+        return make_chunked_content_map(
+            pdf_content, user_prompt, client, MODEL, usage=usage
+        )
 
     # Use the exact same encoding process as the working example
     pdf_base64 = base64.b64encode(pdf_content).decode("utf-8")
 
-    # Initialize Anthropic client
-    client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-
-    # If we get here, proceed with brainstorming call
-    interim_response = client.beta.messages.create(
-        model="claude-3-5-sonnet-20240620",
-        betas=["pdfs-2024-09-25"],
-        max_tokens=4096,
-        messages=[
+    # Both calls start with the same document + brainstorm prompt turn, built once.
+    # The cache breakpoint on it lets a rerun of the brainstorm (a retried job) read
+    # the whole prefix from the prompt cache instead of having the PDF processed (and
+    # billed) again.
+    shared_prefix = {
+        "role": "user",
+        "content": [
+            {
+                "type": "document",
+                "source": {
+                    "type": "base64",
+                    "media_type": "application/pdf",
+                    "data": pdf_base64,
+                },
+            },
             {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "document",
-                        "source": {
-                            "type": "base64",
-                            "media_type": "application/pdf",
-                            "data": pdf_base64,
-                        },
-                    },
-                    {
-                        "type": "text",
-                        "text": brainstorm_prompt,
-                    },
-                ],
-            }
+                "type": "text",
+                "text": brainstorm_prompt,
+                "cache_control": {"type": "ephemeral"},
+            },
         ],
+    }
+
+    # If we get here, proceed with brainstorming call. It is offered no tools, so the
+    # reply is always the free-text brainstorm the final call builds on; the final call
+    # then forces the save_content_map tool. (Tools and tool_choice are part of the
+    # cached prefix, so the final call doesn't read the brainstorm's cache entry.)
+    request = dict(model=MODEL, betas=BETAS, max_tokens=4096, messages=[shared_prefix])
+    timer = LLMCallTimer(MODEL, request)
+    interim_response = client.beta.messages.create(**request)
+    usage.record("brainstorm", interim_response.usage)
+    timer.finish(interim_response.usage, interim_response)
+    interim_text = "".join(
+        block.text for block in interim_response.content if block.type == "text"
     )
+    if not interim_text.strip():
+        raise ValueError("Brainstorm response contained no text")
 
     print("INTERIM RESPONSE")
-    print(interim_response.content[0].text)
+    print(interim_text)
 
-    # Make final call with the brainstorming results
-    final_response = client.beta.messages.create(
-        model="claude-3-5-sonnet-20240620",
-        betas=["pdfs-2024-09-25"],
+    # Make final call with the brainstorming results, streamed so that nodes can be
+    # saved while the rest of the graph is still being written
+    request = dict(
+        model=MODEL,
+        betas=BETAS,
         max_tokens=8192,
+        tools=[CONTENT_MAP_TOOL],
+        tool_choice={"type": "tool", "name": CONTENT_MAP_TOOL["name"]},
         messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "document",
-                        "source": {
-                            "type": "base64",
-                            "media_type": "application/pdf",
-                            "data": pdf_base64,
-                        },
-                    },
-                    {
-                        "type": "text",
-                        "text": brainstorm_prompt,
-                    },
-                ],
-            },
-            {
-                "role": "assistant",
-                "content": interim_response.content[0].text,
-            },
-            {"role": "user", "content": final_prompt},
+            shared_prefix,
+            {"role": "assistant", "content": interim_text},
+            {"role": "user", "content": f"{final_prompt}\n\n{TOOL_OUTPUT_NOTE}"},
         ],
+        stream=True,
     )
+    timer = LLMCallTimer(MODEL, request)
+    final_stream = client.beta.messages.create(**request)
+    # the tool is forced, so the graph arrives as the tool's input
+    parser = GraphStreamParser(tool_input=True)
+    for event in final_stream:
+        if event.type == "message_start":
+            final_usage = event.message.usage
+        elif event.type == "content_block_delta":
+            timer.first_token()
+            if event.delta.type != "input_json_delta":
+                continue
+            new_nodes = parser.feed(event.delta.partial_json)
+            if on_node:
+                for node in new_nodes:
+                    on_node(node)
+        elif event.type == "message_delta":
+            final_usage = final_usage.model_copy(
+                update={"output_tokens": event.usage.output_tokens}
+            )
+    usage.record("final", final_usage)
+    timer.finish(final_usage)
 
     print("FINAL RESPONSE")
-    print(final_response.content[0].text)
+    print(parser.text)
+
+    for node in repair_content_map(client, MODEL, parser, usage):
+        if on_node:
+            on_node(node)
 
-    print("DONE")
+    print(f"DONE\n{usage.summary()}")
 
-    # Parse the response into nodes and edges
-    nodes, edges = parse_graph_output(final_response.content[0].text)
-    return nodes, edges
+    return parser.finish()
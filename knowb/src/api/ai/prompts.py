@@ -1,13 +1,14 @@
-import base64
 import json
+import os
+from functools import lru_cache
 
-from supabase import Client
-
+from src.api.ai.tokens import count_tokens
 from src.api.data import session_id_to_document_id
 from src.api.graph import get_unlocked_nodes
-from src.api.pdf2text import convert_base64_pdf_to_text
-from src.api.routes.content_map import get_document_content
 from src.api.models import ContentMapEdge, ContentMapEdgePreID, ContentMapNode
+from src.api.passages import get_relevant_passages
+from src.services.tracing import traced
+from src.storage import Storage
 
 SESSION_SYSTEM_PROMPT = """
 You name is Robinson, a helpful socratic tutor guiding a learner through various concepts. You are given the ground truth document that contains information about all concepts, and a list of "knowledge nodes" that the learner wants to learn about the document. You should ask questions to the learner to help them learn and understand the knowledge nodes, and give them feedback on their responses. You should not mention the existence of nodes to the learner, except for within <thinking> tags, which will not be shown to the learner.
@@ -25,7 +26,7 @@ In this environment you have access to a tool called "node_complete". You should
 - failed: learner couldn't grasp the concept despite assistance
 Upon using this tool, you will be returned a new set of nodes to teach next. After receiving the outputs of this tool, you should think through your next set of questions once more in <thinking> tags, and then respond with your next set of questions. It is very important that you ask a question after receiving this tool's output.
 
-Here is the document content:
+Here are the passages of the document most relevant to these nodes and to the learner's latest message, each marked with its page:
 {document_content}
 
 Here are the nodes you could choose from to address first. You should choose the node that you think will be the most helpful to the learner. You should make sure to cover the content of nodes well before moving on to other nodes. Some nodes may be prerequisites for others, so you should prioritise these.
@@ -73,6 +74,86 @@ where "parent_index" is the order_index of the parent, and the "child_index" is
 If you need to finish some lines of thought, you can brainstorm at the start of your response. In particular, you want to be prepared to get specific and concrete, especially for each node's "content" field. But after that, output "NODES" on a single line, and after that your output must be entirely structured: list the nodes, output a blank line and then "EDGES", list the edges, and end. You should keep going as long as you need to, but every node and edge needs to be valid JSON.
 """.strip()
 
+CHUNK_PROMPT = """
+The attached document is pages {first_page} to {last_page} of a {total_pages}-page document, which is being converted into a graph in parts. Only create nodes for concepts covered in these pages, and only create edges between nodes from these pages; another pass will connect concepts across parts. Number the nodes from 1 in the order they appear in these pages.
+""".strip()
+
+STITCH_PROMPT = """
+We are converting a long document into a graph of concepts. The nodes are concepts, and an edge from node A to node B means that B requires A to understand, or that any sensible path to learning these concepts puts A before B. The document was processed in parts, and edges within each part already exist. Your job is to add the prerequisite edges that cross between parts.
+
+Here are the nodes, as "order_index [part]: summary", in the order they appear in the document:
+{nodes}
+
+Edges that already exist, as "parent_index -> child_index":
+{edges}
+
+Only add edges between nodes in different parts, and only where there is a real prerequisite relationship (not just relatedness). Edges are transitive, so do not add an edge that is already implied by existing ones. You can think briefly first, but then output a single line saying "EDGES", followed by a JSON list of edges in the following format, and end:
+[
+    {{"parent_index": 1, "child_index": 12}}
+]
+""".strip()
+
+# The nodes and edges of the final prompt, as a tool so that the model's output is
+# held to a schema instead of being free-form JSON in text
+CONTENT_MAP_TOOL = {
+    "name": "save_content_map",
+    "description": "Save the nodes and prerequisite edges of the concept graph.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "nodes": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "order_index": {"type": "integer"},
+                        "summary": {"type": "string"},
+                        "content": {"type": "string"},
+                        "supporting_quotes": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                        },
+                    },
+                    "required": [
+                        "order_index",
+                        "summary",
+                        "content",
+                        "supporting_quotes",
+                    ],
+                },
+            },
+            "edges": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "parent_index": {"type": "integer"},
+                        "child_index": {"type": "integer"},
+                    },
+                    "required": ["parent_index", "child_index"],
+                },
+            },
+        },
+        "required": ["nodes", "edges"],
+    },
+}
+
+TOOL_OUTPUT_NOTE = """
+Instead of writing out the NODES and EDGES lists as text, call the save_content_map tool with them (first all the nodes, then all the edges).
+""".strip()
+
+REPAIR_PROMPT = """
+A concept graph was being saved with the save_content_map tool, but some of the nodes and edges were invalid. Nodes need an integer "order_index", a "summary", a "content" and a list of "supporting_quotes"; edges need a "parent_index" and a "child_index" that are the order_index of existing nodes.
+
+These are the problems:
+{problems}
+
+These are the valid nodes, as "order_index: summary":
+{nodes}
+
+Call save_content_map with ONLY corrected versions of the invalid nodes and edges above (keeping their content and order_index where possible), not the valid ones. Leave out any edge that can't be fixed.
+""".strip()
+
 
 def parse_graph_output(
     output: str,
@@ -96,7 +177,7 @@ def parse_graph_output(
     except json.JSONDecodeError as e:
         raise ValueError(f"Invalid JSON in edges section: {e}")
 
-    # Map order_index to actual IDs
+    # Map order_index to actual IDs, dropping edges that name a node that doesn't exist
     node_index_to_id = {node.order_index: node.id for node in nodes}
     edges = [
         ContentMapEdge(
@@ -104,51 +185,121 @@ def parse_graph_output(
             child_id=node_index_to_id[edge.child_index],
         )
         for edge in edges_pre
+        if edge.parent_index in node_index_to_id
+        and edge.child_index in node_index_to_id
     ]
 
     return nodes, edges
 
 
-def format_node_for_session_prompt(node: ContentMapNode) -> str:
-    node_dict = {
-        "id": node.order_index,
-        "content": node.content,
-        "summary": node.summary,
-        "supporting_quotes": node.supporting_quotes,
-    }
-    return json.dumps(node_dict, indent=2)
+# most tokens the nodes of a session prompt (or of a node_complete result) may take
+NODE_TOKEN_BUDGET = int(os.getenv("SESSION_NODE_TOKEN_BUDGET", "4000"))
+# quotes are cut to this many characters before they're dropped altogether
+SHORT_QUOTE_CHARS = 200
+
+# how much of its supporting quotes a serialized node keeps
+FULL_QUOTES, SHORT_QUOTES, NO_QUOTES = 0, 1, 2
+
+
+@lru_cache(maxsize=8192)
+def _encode_node(
+    order_index: int, summary: str, content: str, quotes: tuple[str, ...], detail: int
+) -> str:
+    if detail == SHORT_QUOTES:
+        quotes = tuple(
+            (
+                quote[:SHORT_QUOTE_CHARS].rstrip() + "..."
+                if len(quote) > SHORT_QUOTE_CHARS
+                else quote
+            )
+            for quote in quotes
+        )
+    elif detail == NO_QUOTES:
+        quotes = ()
+    node_dict = {"id": order_index, "summary": summary, "content": content}
+    if quotes:
+        node_dict["supporting_quotes"] = list(quotes)
+    return json.dumps(node_dict, ensure_ascii=False, separators=(",", ":"))
+
+
+def format_node_for_session_prompt(
+    node: ContentMapNode, detail: int = FULL_QUOTES
+) -> str:
+    """Compact JSON for a node (memoised: the same nodes are sent turn after turn)"""
+    return _encode_node(
+        node.order_index,
+        node.summary,
+        node.content,
+        tuple(node.supporting_quotes),
+        detail,
+    )
 
 
-async def get_session_system_prompt(chat_session_id: str, client: Client):
+def pack_nodes(
+    nodes: list[ContentMapNode], token_budget: int = NODE_TOKEN_BUDGET
+) -> list[str]:
     """
-    Get the system prompt for a chat session by using PyPDF to convert the document pdf
-    to text, and then formatting the nodes and edges into a prompt, and then formatting
-    the learning state and figuring out which nodes should be shown.
+    Serialize nodes, most urgent first, into at most token_budget tokens. Quotes give
+    way first: those of the least urgent nodes are shortened, then dropped, working up
+    the list. Only if that isn't enough are the least urgent nodes left out (the most
+    urgent one is always kept).
     """
+    details = [FULL_QUOTES] * len(nodes)
+    costs = [count_tokens(format_node_for_session_prompt(node)) for node in nodes]
+    total = sum(costs)
+    for detail in (SHORT_QUOTES, NO_QUOTES):
+        for i in reversed(range(len(nodes))):
+            if total <= token_budget:
+                break
+            cost = count_tokens(format_node_for_session_prompt(nodes[i], detail))
+            total += cost - costs[i]
+            costs[i] = cost
+            details[i] = detail
+
+    kept = len(nodes)
+    while kept > 1 and total > token_budget:
+        kept -= 1
+        total -= costs[kept]
+    if kept < len(nodes) or any(details):
+        print(
+            f"[DEBUG] Packed {kept} of {len(nodes)} nodes into {total} tokens "
+            f"({sum(1 for detail in details[:kept] if detail)} with shortened quotes)"
+        )
+    return [format_node_for_session_prompt(nodes[i], details[i]) for i in range(kept)]
 
-    # Get document_id from chat_sessions table
-    document_id = session_id_to_document_id(chat_session_id, client)
 
-    # Get document content
-    document_content = get_document_content(document_id, client)
-    base64_document_content = base64.b64encode(document_content).decode("utf-8")
-    string_document_content = convert_base64_pdf_to_text(base64_document_content)[:1000]
+@traced()
+async def get_session_system_prompt(
+    chat_session_id: str, storage: Storage, message: str = ""
+):
+    """
+    Get the system prompt for a chat session: the nodes the learner can work on next,
+    and the document passages most relevant to them and to the learner's message.
+    """
 
-    # Get learning state
-    unlocked_nodes = await get_unlocked_nodes(chat_session_id, client)
+    # Get document_id from chat_sessions table
+    document_id = await session_id_to_document_id(chat_session_id, storage)
 
-    formatted_nodes_to_address = "\n".join(
-        format_node_for_session_prompt(node) for node in unlocked_nodes
+    # Get learning state
+    unlocked_nodes = await get_unlocked_nodes(chat_session_id, storage)
+
+    query = "\n".join(
+        [message]
+        + [
+            f"{node.summary}\n{node.content}\n" + "\n".join(node.supporting_quotes)
+            for node in unlocked_nodes
+        ]
     )
+    document_content = await get_relevant_passages(document_id, query, storage)
+
+    formatted_nodes_to_address = "\n".join(pack_nodes(unlocked_nodes))
 
     return SESSION_SYSTEM_PROMPT.format(
         nodes_to_address=formatted_nodes_to_address,
-        document_content=string_document_content,
+        document_content=document_content,
     )
 
 
 def get_node_complete_prompt(nodes_to_address: list[ContentMapNode]) -> str:
-    formatted_nodes_to_address = "\n".join(
-        format_node_for_session_prompt(node) for node in nodes_to_address
-    )
+    formatted_nodes_to_address = "\n".join(pack_nodes(nodes_to_address))
     return TOOL_USE_ATTACHMENT.format(nodes_to_address=formatted_nodes_to_address)
@@ -0,0 +1,129 @@
+"""
+Targeted repair of content map output: when some nodes or edges of the final response
+don't validate, a small text-only request (no PDF, no brainstorm) asks for corrected
+versions of just those, instead of rerunning both expensive calls.
+"""
+
+import json
+from dataclasses import dataclass, field
+from threading import Lock
+
+from anthropic import Anthropic
+
+from src.api.ai.prompts import CONTENT_MAP_TOOL, REPAIR_PROMPT
+from src.api.ai.stream_parse import GraphStreamParser
+from src.api.ai.usage import UsageLog
+from src.api.models import ContentMapNode
+from src.services.metrics import LLMCallTimer
+
+# the calls a repair saves: without it, both of these would be rerun
+RERUN_STAGES = ("brainstorm", "final")
+
+
+@dataclass
+class RepairStats:
+    """Process-wide repair counters"""
+
+    outputs: int = 0  # content map outputs checked
+    repaired: int = 0  # outputs that needed a repair request
+    repair_tokens: int = 0
+    tokens_saved: int = 0  # tokens of the reruns the repairs replaced, minus their own
+    _lock: Lock = field(default_factory=Lock, repr=False)
+
+    @property
+    def repair_rate(self) -> float:
+        return self.repaired / self.outputs if self.outputs else 0.0
+
+
+repair_stats = RepairStats()
+
+
+def _stage_tokens(usage: UsageLog, stages: tuple[str, ...]) -> int:
+    return sum(
+        stage.prompt_tokens + stage.output_tokens
+        for stage in usage.stages
+        if stage.stage in stages
+    )
+
+
+def repair_problems(parser: GraphStreamParser) -> list[str]:
+    problems = [
+        f"invalid {invalid.section[:-1]} ({invalid.error}): {invalid.raw}"
+        for invalid in parser.invalid
+    ]
+    problems += [
+        f"edge names a node that doesn't exist: {edge.model_dump_json()}"
+        for edge in parser.dangling_edges()
+    ]
+    return problems
+
+
+def repair_content_map(
+    client: Anthropic,
+    model: str,
+    parser: GraphStreamParser,
+    usage: UsageLog,
+    rerun_stages: tuple[str, ...] = RERUN_STAGES,
+) -> list[ContentMapNode]:
+    """
+    Ask for corrected versions of the parser's invalid nodes and edges and merge them
+    into it. Returns the nodes the repair added. rerun_stages are the calls (by their
+    UsageLog stage) that would otherwise have been rerun.
+    """
+    problems = repair_problems(parser)
+    with repair_stats._lock:
+        repair_stats.outputs += 1
+    if not problems:
+        return []
+
+    print(f"[DEBUG] Repairing {len(problems)} invalid nodes/edges")
+    request = dict(
+        model=model,
+        max_tokens=4096,
+        tools=[CONTENT_MAP_TOOL],
+        tool_choice={"type": "tool", "name": CONTENT_MAP_TOOL["name"]},
+        messages=[
+            {
+                "role": "user",
+                "content": REPAIR_PROMPT.format(
+                    problems="\n".join(problems),
+                    nodes="\n".join(
+                        f"{node.order_index}: {node.summary}" for node in parser.nodes
+                    ),
+                ),
+            }
+        ],
+    )
+    timer = LLMCallTimer(model, request)
+    response = client.messages.create(**request)
+    repair = usage.record("repair", response.usage)
+    timer.finish(response.usage, response)
+
+    repaired = GraphStreamParser(tool_input=True)
+    for block in response.content:
+        if block.type == "tool_use":
+            repaired.feed(json.dumps(block.input))
+
+    indices = {node.order_index for node in parser.nodes}
+    added = [node for node in repaired.nodes if node.order_index not in indices]
+    parser.nodes += added
+    parser.nodes.sort(key=lambda node: node.order_index)
+    # edges that are still dangling once the repaired nodes are in can't be saved
+    dangling = {id(edge) for edge in parser.dangling_edges()}
+    parser.edges_pre = [edge for edge in parser.edges_pre if id(edge) not in dangling]
+    parser.edges_pre += repaired.edges_pre
+    parser.invalid = []
+
+    repair_tokens = repair.prompt_tokens + repair.output_tokens
+    with repair_stats._lock:
+        repair_stats.repaired += 1
+        repair_stats.repair_tokens += repair_tokens
+        repair_stats.tokens_saved += max(
+            _stage_tokens(usage, rerun_stages) - repair_tokens, 0
+        )
+    print(
+        f"[DEBUG] Repair added {len(added)} nodes and {len(repaired.edges_pre)} edges "
+        f"for {repair_tokens} tokens (repair rate {repair_stats.repair_rate:.1%}, "
+        f"{repair_stats.tokens_saved} tokens saved so far)"
+    )
+    return added
@@ -1,7 +1,9 @@
 import asyncio
 import os
 import traceback
+from contextlib import aclosing
 from datetime import datetime
+from typing import Optional
 
 import anthropic
 from fastapi import HTTPException
@@ -14,8 +16,15 @@ from src.api.data import (
 from src.api.graph import get_unlocked_nodes
 from src.api.learning_progress import update_learning_progress
 from src.api.models import LearningProgressUpdateData, LearningProgressUpdateRequest
-from src.services import get_supabase_client
+from src.services.metrics import CHAT_TURNS_CANCELLED, LLMCallTimer
 from src.services.security import get_user_id_from_token
+from src.services.tracing import span, start_trace, traced
+from src.storage import Storage, get_storage
+
+MODEL = "claude-3-5-sonnet-20241022"
+
+# pause after each streamed chunk (benchmarks set it to 0 to time the code itself)
+STREAM_CHUNK_DELAY = 0.1
 
 TOOLS = [
     {
@@ -36,15 +45,21 @@ TOOLS = [
 ]
 
 
+@traced()
 async def post_process_ai_response(
-    node_order_index: int, judgement: str, session_id: str, supabase, token: str
+    node_order_index: int,
+    judgement: str,
+    session_id: str,
+    storage: Storage,
+    token: str,
+    user_id: Optional[str] = None,
 ):
     # Get the graph id from the session id
-    graph_id = session_id_to_graph_id(session_id, supabase)
+    graph_id = await session_id_to_graph_id(session_id, storage)
 
     # Get the node id from the graph id and node order index
-    node_id = graph_id_and_node_order_index_to_node_id(
-        graph_id, node_order_index, supabase
+    node_id = await graph_id_and_node_order_index_to_node_id(
+        graph_id, node_order_index, storage
     )
 
     # Create a learning progress update request
@@ -53,11 +68,15 @@ async def post_process_ai_response(
         graph_id=graph_id,
         created_at=datetime.now(),
         update_data=LearningProgressUpdateData(quality=judgement),
-        user_id=get_user_id_from_token(token),
+        user_id=user_id or await get_user_id_from_token(token),
     )
 
     # Update the learning progress
-    await update_learning_progress(learning_progress_update_request, supabase)
+    await update_learning_progress(learning_progress_update_request, storage)
+
+
+def get_anthropic_client() -> anthropic.Anthropic:
+    return anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
 
 
 def wrap_message(session_id: str, message: str):
@@ -67,49 +86,112 @@ def wrap_message(session_id: str, message: str):
     }
 
 
-async def handle_chat_stream(message: str, session_id: str, token: str):
-    client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-    supabase = get_supabase_client()
-
-    # Get chat history
-    history_response = (
-        supabase.table("chat_messages")
-        .select("content")
-        .eq("session_id", session_id)
-        .order("created_at")
-        .execute()
-    )
-    if hasattr(history_response, "error") and history_response.error:
-        raise HTTPException(status_code=500, detail="Failed to fetch chat history")
-
-    # Get system prompt
-    system_prompt = await get_session_system_prompt(session_id, supabase)
+async def handle_chat_stream(
+    message: str,
+    session_id: str,
+    token: str,
+    client: anthropic.Anthropic = None,
+    user_id: Optional[str] = None,
+):
+    """
+    One chat turn: the reply's text chunks, a <tool_use> block when a node was
+    completed, then "[END]" (or an error message). Traced, see src/services/tracing.py;
+    src/api/ai/chat_turns.py turns this into a resumable SSE stream. Pass user_id
+    when the caller has already authenticated token.
+    """
+    with start_trace("chat.turn", session_id=session_id):
+        async with aclosing(
+            _stream_chat_turn(message, session_id, token, client, user_id)
+        ) as events:
+            async for event in events:
+                yield event
+
+
+async def _open_stream(client: anthropic.Anthropic, **request):
+    """
+    Start a model stream. The client is blocking, so the request is sent from a worker
+    thread; a stream that opens after the turn was cancelled is closed again.
+    """
+    manager = client.beta.prompt_caching.messages.stream(**request)
+    opening = asyncio.ensure_future(asyncio.to_thread(manager.__enter__))
+    try:
+        return await asyncio.shield(opening)
+    except asyncio.CancelledError:
+
+        def close(opened: asyncio.Future):
+            if not opened.cancelled() and opened.exception() is None:
+                opened.result().close()
+
+        opening.add_done_callback(close)
+        raise
+
+
+async def _in_thread(iterator):
+    """The items of a blocking iterator, each read in a worker thread"""
+    end = object()
+    while (item := await asyncio.to_thread(next, iterator, end)) is not end:
+        yield item
+
+
+async def _stream_response(stream, timer: LLMCallTimer, name: str):
+    """Yield a model stream's text chunks, read off the event loop"""
+    with span(name, model=MODEL) as current:
+        chunks = 0
+        async for text in _in_thread(iter(stream.text_stream)):
+            timer.first_token()
+            chunks += 1
+            yield text
+            await asyncio.sleep(STREAM_CHUNK_DELAY)
+        if current:
+            current.set(chunks=chunks)
+            if timer.first_token_at is not None:
+                current.set(
+                    first_token_ms=round((timer.first_token_at - timer.started) * 1000)
+                )
+
+
+async def _stream_chat_turn(
+    message: str,
+    session_id: str,
+    token: str,
+    client: anthropic.Anthropic = None,
+    user_id: Optional[str] = None,
+):
+    client = client or get_anthropic_client()
+    storage = get_storage()
+
+    # Get chat history and system prompt (independent, so fetch them concurrently)
+    with span("chat.context"):
+        history, system_prompt = await asyncio.gather(
+            storage.get_chat_messages(session_id),
+            get_session_system_prompt(session_id, storage, message),
+        )
     system_message = {"role": "user", "content": system_prompt}
 
     # Combine system prompt with chat history (so we dont have to add the long pdf content to the chat history)
-    messages = [system_message] + [msg["content"] for msg in history_response.data]
-
-    # Store user message
-    user_message = {"role": "user", "content": message}
-    user_msg_response = (
-        supabase.table("chat_messages")
-        .insert(wrap_message(session_id, user_message))
-        .execute()
-    )
-    if hasattr(user_msg_response, "error") and user_msg_response.error:
-        raise HTTPException(status_code=500, detail="Failed to store user message")
-
-    # Create AI message entry
-    ai_message = {"role": "assistant", "content": ""}
-    ai_msg_response = (
-        supabase.table("chat_messages")
-        .insert(wrap_message(session_id, ai_message))
-        .execute()
-    )
-    if hasattr(ai_msg_response, "error") and ai_msg_response.error:
+    # (replies interrupted before their first token have no content to send back)
+    messages = [system_message] + [
+        msg["content"] for msg in history if msg["content"]["content"]
+    ]
+
+    with span("chat.store_messages"):
+        # Store user message
+        user_message = {"role": "user", "content": message}
+        user_msg_row = await storage.insert_chat_message(
+            wrap_message(session_id, user_message)
+        )
+        if not user_msg_row:
+            raise HTTPException(status_code=500, detail="Failed to store user message")
+
+        # Create AI message entry
+        ai_message = {"role": "assistant", "content": ""}
+        ai_msg_row = await storage.insert_chat_message(
+            wrap_message(session_id, ai_message)
+        )
+    if not ai_msg_row:
         raise HTTPException(status_code=500, detail="Failed to create AI message entry")
 
-    ai_message_id = ai_msg_response.data[0]["id"]
+    ai_message_id = ai_msg_row["id"]
 
     for msg in messages:
         print(f"[DEBUG] Message: {msg}")
@@ -117,39 +199,44 @@ async def handle_chat_stream(message: str, session_id: str, token: str):
 
     print(f"[DEBUG] User message: {user_message}")
 
+    stream = None
+    timer: Optional[LLMCallTimer] = None
+    reply: list[str] = []  # the first reply's text so far
+    reply_saved = False
     try:
         # set up a stream
-        stream = client.beta.prompt_caching.messages.stream(
+        request = dict(
             max_tokens=1024,
             messages=[*messages, {"role": "user", "content": message}],
-            model="claude-3-5-sonnet-20241022",
+            model=MODEL,
             tools=TOOLS,
-        ).__enter__()
+        )
+        timer = LLMCallTimer(MODEL, request)
+        stream = await _open_stream(client, **request)
 
         # Stream the response
-        for text in stream.text_stream:
-            timestamp = datetime.now().isoformat()
-            print(f"[{timestamp}] Sending chunk: {text}")
-            # Replace newlines with escaped newlines and escape any existing escaped newlines
-            safe_text = text.replace("\n", "\\n").replace("\\n", "\\\\n")
-            yield f"data: {safe_text}\n\n"
-            await asyncio.sleep(0.1)
+        async for event in _stream_response(stream, timer, "llm.stream"):
+            reply.append(event)
+            yield event
 
         # Get the final message
         final_message = stream.get_final_message()
+        timer.finish(final_message.usage, final_message)
         print(f"[DEBUG] Final message: {final_message}")
         text_response = [x for x in final_message.content if x.type == "text"][0].text
         tool_use = [x for x in final_message.content if x.type == "tool_use"]
 
         # Update the AI message with complete response
-        supabase.table("chat_messages").update(
+        await storage.update_chat_message(
+            ai_message_id,
             {
                 "content": {
                     "role": "assistant",
                     "content": [x.model_dump() for x in final_message.content],
                 }
-            }
-        ).eq("id", ai_message_id).execute()
+            },
+        )
+        reply_saved = True
 
         # Update the chat history with the final message
         messages.append({"role": "assistant", "content": final_message.content})
@@ -162,12 +249,13 @@ async def handle_chat_stream(message: str, session_id: str, token: str):
             tool_use_input = tool_use.input
             node_id = int(tool_use_input["node_id"])
             judgement = tool_use_input["judgement"].lower()
-            await post_process_ai_response(
-                node_id, judgement, session_id, supabase, token
-            )
+            with span("chat.tool_use", judgement=judgement):
+                await post_process_ai_response(
+                    node_id, judgement, session_id, storage, token, user_id
+                )
 
-            unlocked_nodes = await get_unlocked_nodes(session_id, supabase)
-            node_complete_prompt = get_node_complete_prompt(unlocked_nodes)
+                unlocked_nodes = await get_unlocked_nodes(session_id, storage)
+                node_complete_prompt = get_node_complete_prompt(unlocked_nodes)
 
             # create a new user message with the node complete prompt
             user_message = {
@@ -182,40 +270,56 @@ async def handle_chat_stream(message: str, session_id: str, token: str):
             }
 
             # Store the user message
-            supabase.table("chat_messages").insert(
-                wrap_message(session_id, user_message)
-            ).execute()
+            await storage.insert_chat_message(wrap_message(session_id, user_message))
             messages.append(user_message)
 
             # stream the new user message
-            safe_text = node_complete_prompt.replace("\n", "\\n").replace(
-                "\\n", "\\\\n"
-            )
-            yield f"data: <tool_use>{safe_text}</tool_use>\n\n"
+            yield f"<tool_use>{node_complete_prompt}</tool_use>"
 
             for msg in messages:
                 print(f"[DEBUG] Message: {msg}")
                 print("\n\n")
 
             # stream ai responses to this in the same way we did before
-            stream = client.beta.prompt_caching.messages.stream(
-                max_tokens=1024,
-                messages=[*messages],
-                model="claude-3-5-sonnet-20241022",
-                tools=TOOLS,
-            ).__enter__()
-
-            for text in stream.text_stream:
-                timestamp = datetime.now().isoformat()
-                print(f"[{timestamp}] Sending chunk: {text}")
-                safe_text = text.replace("\n", "\\n").replace("\\n", "\\\\n")
-                yield f"data: {safe_text}\n\n"
-                await asyncio.sleep(0.1)
-
-        yield "data: [END]\n\n"
-
+            request = dict(
+                max_tokens=1024, messages=[*messages], model=MODEL, tools=TOOLS
+            )
+            timer = LLMCallTimer(MODEL, request)
+            stream = await _open_stream(client, **request)
+
+            async for event in _stream_response(
+                stream, timer, "llm.stream.tool_result"
+            ):
+                yield event
+            final_message = stream.get_final_message()
+            timer.finish(final_message.usage, final_message)
+
+        yield "[END]"
+
+    except (asyncio.CancelledError, GeneratorExit):
+        # the client went away (see src/api/ai/chat_turns.py): stop generating, and
+        # keep what the learner already saw of the reply
+        CHAT_TURNS_CANCELLED.inc(stage="tool_result" if reply_saved else "reply")
+        if not reply_saved:
+            await save_interrupted_reply(ai_message_id, "".join(reply), storage)
+        raise
     except Exception as e:
+        if timer is not None and not timer.finished:
+            # the model call failed (or its stream broke off)
+            timer.fail(e)
         print(f"[ERROR] Exception in generate: {str(e)}")
         print("[ERROR] Traceback:")
         print(traceback.format_exc())
-        yield f"data: Error occurred: {str(e)}\n\n"
+        yield f"Error occurred: {str(e)}"
+    finally:
+        if stream is not None:
+            # closes the HTTP response, so an unfinished generation stops upstream
+            stream.close()
+
+
+async def save_interrupted_reply(message_id: str, text: str, storage: Storage):
+    content = [{"type": "text", "text": text}] if text.strip() else ""
+    await storage.update_chat_message(
+        message_id,
+        {"content": {"role": "assistant", "content": content}, "interrupted": True},
+    )
@@ -0,0 +1,170 @@
+"""
+Incremental parser for content map output. It reads either the text format of the
+final prompt:
+
+    ...free-form brainstorming...
+    NODES
+    [{"order_index": 1, "summary": ..., "content": ..., "supporting_quotes": [...]}, ...]
+    EDGES
+    [{"parent_index": 1, "child_index": 2}, ...]
+
+or (tool_input=True) the JSON input of the save_content_map tool:
+
+    {"nodes": [{"order_index": 1, ...}, ...], "edges": [{"parent_index": 1, ...}, ...]}
+
+Fed the output as it streams in, it hands back each node as soon as its JSON object
+closes. It only ever looks at one object at a time, so a malformed or truncated
+object costs that object, not the whole graph; the invalid ones are kept so that a
+repair request can ask for just those again (see repair.py).
+"""
+
+import json
+from dataclasses import dataclass
+
+from pydantic import ValidationError
+
+from src.api.models import ContentMapEdge, ContentMapEdgePreID, ContentMapNode
+
+NODES_MARKER = "NODES"
+EDGES_MARKER = "EDGES"
+
+
+@dataclass
+class InvalidObject:
+    section: str  # "nodes" or "edges"
+    raw: str
+    error: str
+
+
+class GraphStreamParser:
+    def __init__(self, tool_input: bool = False):
+        self.tool_input = tool_input
+        self.text = ""
+        self.section = None  # None until the nodes start, then "nodes", then "edges"
+        self.nodes: list[ContentMapNode] = []
+        self.edges_pre: list[ContentMapEdgePreID] = []
+        # objects that closed but weren't a valid node or edge
+        self.invalid: list[InvalidObject] = []
+        # node and edge objects sit one level inside the tool input's outer object
+        self._base_depth = 1 if tool_input else 0
+        self._pos = 0
+        self._depth = 0
+        self._start = 0
+        self._key_start = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> list[ContentMapNode]:
+        """Add streamed text; returns the nodes it completed"""
+        self.text += text
+        new_nodes = []
+        text = self.text
+
+        if self.section is None and not self.tool_input:
+            found = text.find(NODES_MARKER, self._pos)
+            if found == -1:
+                # the marker may be split across chunks
+                self._pos = max(self._pos, len(text) - len(NODES_MARKER) + 1)
+                return new_nodes
+            self.section = "nodes"
+            self._pos = found + len(NODES_MARKER)
+
+        i = self._pos
+        while i < len(text):
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self.tool_input and self._depth == self._base_depth:
+                        key = text[self._key_start + 1 : i]
+                        if key in ("nodes", "edges"):
+                            self.section = key
+            elif c == '"' and self._depth > 0:
+                # (text outside the JSON, at depth 0, may have stray quotes)
+                self._in_string = True
+                self._key_start = i
+            elif self._depth < self._base_depth:
+                if c == "{":
+                    self._depth += 1
+            elif self._depth == self._base_depth:
+                if c == "{":
+                    self._start = i
+                    self._depth += 1
+                elif c == EDGES_MARKER[0] and self.section == "nodes":
+                    if len(text) - i < len(EDGES_MARKER):
+                        break  # wait for the rest of what may be the marker
+                    if text.startswith(EDGES_MARKER, i):
+                        self.section = "edges"
+                        i += len(EDGES_MARKER) - 1
+            elif c == "{":
+                self._depth += 1
+            elif c == "}":
+                self._depth -= 1
+                if self._depth == self._base_depth:
+                    node = self._emit(text[self._start : i + 1])
+                    if node is not None:
+                        new_nodes.append(node)
+            i += 1
+        self._pos = i
+        return new_nodes
+
+    def _emit(self, raw: str):
+        if self.section is None:
+            return None
+        try:
+            data = json.loads(raw)
+            if self.section == "nodes":
+                node = ContentMapNode(**data)
+                self.nodes.append(node)
+                return node
+            self.edges_pre.append(ContentMapEdgePreID(**data))
+        except (json.JSONDecodeError, TypeError, ValidationError) as e:
+            print(f"[DEBUG] Skipping malformed {self.section[:-1]}: {e}: {raw[:200]}")
+            self.invalid.append(InvalidObject(self.section, raw, str(e)))
+        return None
+
+    @property
+    def skipped(self) -> int:
+        return len(self.invalid)
+
+    @property
+    def truncated(self) -> bool:
+        """Whether the output stopped in the middle of an object"""
+        return self._depth > self._base_depth
+
+    def dangling_edges(self) -> list[ContentMapEdgePreID]:
+        """Edges that name an order_index no node has"""
+        indices = {node.order_index for node in self.nodes}
+        return [
+            edge
+            for edge in self.edges_pre
+            if edge.parent_index not in indices or edge.child_index not in indices
+        ]
+
+    def finish(self) -> tuple[list[ContentMapNode], list[ContentMapEdge]]:
+        """The nodes and the edges between them; whatever parsed, if the tail didn't"""
+        if not self.nodes:
+            raise ValueError("No valid nodes in content map output")
+        if self.truncated or self.skipped or self.section != "edges":
+            print(
+                f"[DEBUG] Recovered a partial content map: {len(self.nodes)} nodes, "
+                f"{len(self.edges_pre)} edges ({self.skipped} malformed objects "
+                f"skipped, truncated: {self.truncated}, edges section reached: "
+                f"{self.section == 'edges'})"
+            )
+
+        node_index_to_id = {node.order_index: node.id for node in self.nodes}
+        edges = [
+            ContentMapEdge(
+                parent_id=node_index_to_id[edge.parent_index],
+                child_id=node_index_to_id[edge.child_index],
+            )
+            for edge in self.edges_pre
+            if edge.parent_index in node_index_to_id
+            and edge.child_index in node_index_to_id
+        ]
+        return self.nodes, edges
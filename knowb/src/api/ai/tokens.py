@@ -0,0 +1,43 @@
+"""
+Token counts for prompt assembly. Claude's tokenizer isn't available offline, so this
+counts with tiktoken's cl100k_base (close enough for budgeting), loaded once per
+process, and falls back to a rough regex count when the encoding can't be loaded
+(it is downloaded on first use). Counts are memoised: the same node and passage
+strings are counted on every session turn.
+"""
+
+import math
+import re
+from functools import lru_cache
+
+ENCODING_NAME = "cl100k_base"
+
+_PIECE = re.compile(r"\w+|[^\w\s]")
+_encoding = None
+_encoding_unavailable = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_unavailable
+    if _encoding is None and not _encoding_unavailable:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding(ENCODING_NAME)
+        except Exception as e:
+            print(f"[DEBUG] Tokenizer unavailable, estimating token counts: {e}")
+            _encoding_unavailable = True
+    return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    """About one token per four characters of a word, and one per punctuation mark"""
+    return sum(math.ceil(len(piece) / 4) for piece in _PIECE.findall(text))
+
+
+@lru_cache(maxsize=16384)
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
@@ -0,0 +1,104 @@
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any
+
+# cache reads are billed at a tenth of the input token price, cache writes at 1.25x
+CACHE_READ_PRICE_RATIO = 0.1
+CACHE_WRITE_PRICE_RATIO = 1.25
+
+# USD per million (input, output) tokens, matched by model name prefix
+MODEL_PRICES = {
+    "claude-3-5-sonnet": (3.0, 15.0),
+    "claude-3-5-haiku": (0.8, 4.0),
+    "claude-3-opus": (15.0, 75.0),
+    "claude-3-haiku": (0.25, 1.25),
+}
+
+
+def usage_cost(model: str, usage: Any) -> float:
+    """Estimated USD cost of one Anthropic response's usage (0 for unknown models)"""
+    prices = next(
+        (price for prefix, price in MODEL_PRICES.items() if model.startswith(prefix)),
+        None,
+    )
+    if prices is None or usage is None:
+        return 0.0
+    input_price, output_price = prices
+    tokens = (
+        (getattr(usage, "input_tokens", 0) or 0) * input_price
+        + (getattr(usage, "output_tokens", 0) or 0) * output_price
+        + (getattr(usage, "cache_creation_input_tokens", 0) or 0)
+        * input_price
+        * CACHE_WRITE_PRICE_RATIO
+        + (getattr(usage, "cache_read_input_tokens", 0) or 0)
+        * input_price
+        * CACHE_READ_PRICE_RATIO
+    )
+    return tokens / 1_000_000
+
+
+@dataclass
+class StageUsage:
+    stage: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+
+    @property
+    def prompt_tokens(self) -> int:
+        """Every prompt token the stage sent, cached or not"""
+        return (
+            self.input_tokens
+            + self.cache_creation_input_tokens
+            + self.cache_read_input_tokens
+        )
+
+
+@dataclass
+class UsageLog:
+    """Token usage per LLM call of a multi-call pipeline (e.g. one content map)"""
+
+    stages: list[StageUsage] = field(default_factory=list)
+    _lock: Lock = field(default_factory=Lock, repr=False)
+
+    def record(self, stage: str, usage: Any) -> StageUsage:
+        """Record an Anthropic response's usage under a stage name (thread-safe)"""
+        entry = StageUsage(
+            stage=stage,
+            input_tokens=usage.input_tokens,
+            output_tokens=usage.output_tokens,
+            cache_creation_input_tokens=getattr(usage, "cache_creation_input_tokens", 0)
+            or 0,
+            cache_read_input_tokens=getattr(usage, "cache_read_input_tokens", 0) or 0,
+        )
+        with self._lock:
+            self.stages.append(entry)
+        return entry
+
+    def total(self) -> StageUsage:
+        total = StageUsage(stage="total")
+        for stage in self.stages:
+            total.input_tokens += stage.input_tokens
+            total.output_tokens += stage.output_tokens
+            total.cache_creation_input_tokens += stage.cache_creation_input_tokens
+            total.cache_read_input_tokens += stage.cache_read_input_tokens
+        return total
+
+    @property
+    def tokens_saved(self) -> int:
+        """Input tokens not billed at full price thanks to cache reads"""
+        return round(
+            self.total().cache_read_input_tokens * (1 - CACHE_READ_PRICE_RATIO)
+        )
+
+    def summary(self) -> str:
+        lines = [
+            f"{stage.stage}: {stage.prompt_tokens} prompt tokens "
+            f"({stage.cache_read_input_tokens} cache read, "
+            f"{stage.cache_creation_input_tokens} cache write), "
+            f"{stage.output_tokens} output tokens"
+            for stage in [*self.stages, self.total()]
+        ]
+        lines.append(f"tokens saved by prompt caching: {self.tokens_saved}")
+        return "\n".join(lines)
@@ -0,0 +1,166 @@
+"""
+Structure checks for a generated content map, run once at generation time so that
+request handlers can trust the stored graph:
+
+    cycles                 prerequisite edges must form a DAG; an edge closing a cycle
+                           is dropped (the one found latest by a DFS that visits nodes
+                           in document order, so edges pointing back in the text go)
+    transitive reduction   the prompt says edges are transitive, so A -> C is dropped
+                           when A -> B -> C exists (fewer parents to check per unlock)
+    topological levels     0 for nodes without prerequisites, otherwise one more than
+                           the highest level among the node's parents; stored as
+                           graph_nodes.topo_level
+"""
+
+from dataclasses import dataclass, field
+
+from src.api.models import ContentMapEdge, ContentMapNode
+
+Edge = tuple[str, str]
+
+
+@dataclass
+class DagAnalysis:
+    edges: list[Edge]  # the reduced, acyclic edge set
+    levels: dict[str, int]
+    cycle_edges: list[Edge] = field(default_factory=list)
+    redundant_edges: list[Edge] = field(default_factory=list)
+    invalid_edges: int = 0  # duplicates, self-loops, unknown nodes
+
+
+def _children(node_ids: list[str], edges: list[Edge]) -> dict[str, list[str]]:
+    children = {node_id: [] for node_id in node_ids}
+    for parent, child in edges:
+        children[parent].append(child)
+    return children
+
+
+def break_cycles(
+    node_ids: list[str], edges: list[Edge]
+) -> tuple[list[Edge], list[Edge]]:
+    """Returns (acyclic edges, removed edges); node_ids in document order"""
+    children = _children(node_ids, edges)
+    # 0 = unvisited, 1 = on the DFS stack, 2 = done
+    state = {node_id: 0 for node_id in node_ids}
+    removed: set[Edge] = set()
+    for root in node_ids:
+        if state[root]:
+            continue
+        state[root] = 1
+        # iterative DFS: generated graphs can be deeper than the recursion limit
+        stack = [(root, iter(children[root]))]
+        while stack:
+            node, remaining = stack[-1]
+            child = next(remaining, None)
+            if child is None:
+                state[node] = 2
+                stack.pop()
+            elif state[child] == 1:
+                removed.add((node, child))
+            elif state[child] == 0:
+                state[child] = 1
+                stack.append((child, iter(children[child])))
+    return [edge for edge in edges if edge not in removed], sorted(removed)
+
+
+def topological_order(node_ids: list[str], edges: list[Edge]) -> list[str]:
+    """Kahn's algorithm, taking ready nodes in document order; edges must be acyclic"""
+    children = _children(node_ids, edges)
+    position = {node_id: i for i, node_id in enumerate(node_ids)}
+    parents_left = {node_id: 0 for node_id in node_ids}
+    for _, child in edges:
+        parents_left[child] += 1
+    ready = sorted(
+        (node_id for node_id in node_ids if not parents_left[node_id]),
+        key=position.__getitem__,
+        reverse=True,
+    )
+    order = []
+    while ready:
+        node = ready.pop()
+        order.append(node)
+        for child in children[node]:
+            parents_left[child] -= 1
+            if not parents_left[child]:
+                ready.append(child)
+        ready.sort(key=position.__getitem__, reverse=True)
+    return order
+
+
+def transitive_reduction(
+    node_ids: list[str], edges: list[Edge]
+) -> tuple[list[Edge], list[Edge]]:
+    """Returns (reduced edges, redundant edges); edges must be acyclic"""
+    order = topological_order(node_ids, edges)
+    bit = {node_id: 1 << i for i, node_id in enumerate(order)}
+    children = _children(node_ids, edges)
+    # reach[n]: bitset of the nodes reachable from n through at least one edge
+    reach: dict[str, int] = {}
+    for node in reversed(order):
+        reachable = 0
+        for child in children[node]:
+            reachable |= bit[child] | reach[child]
+        reach[node] = reachable
+
+    redundant = set()
+    for node in order:
+        # a child that is also reachable through a child (necessarily another one, as
+        # the graph is acyclic) is implied already
+        through_children = 0
+        for child in children[node]:
+            through_children |= reach[child]
+        for child in children[node]:
+            if through_children & bit[child]:
+                redundant.add((node, child))
+    return [edge for edge in edges if edge not in redundant], sorted(redundant)
+
+
+def topological_levels(node_ids: list[str], edges: list[Edge]) -> dict[str, int]:
+    children = _children(node_ids, edges)
+    levels = {node_id: 0 for node_id in node_ids}
+    for node in topological_order(node_ids, edges):
+        for child in children[node]:
+            levels[child] = max(levels[child], levels[node] + 1)
+    return levels
+
+
+def analyse_dag(node_ids: list[str], edges: list[Edge]) -> DagAnalysis:
+    """Deduplicate, break cycles, reduce and level a graph; node_ids in document order"""
+    known = set(node_ids)
+    unique = list(
+        dict.fromkeys(
+            (parent, child)
+            for parent, child in edges
+            if parent in known and child in known and parent != child
+        )
+    )
+    acyclic, cycle_edges = break_cycles(node_ids, unique)
+    reduced, redundant = transitive_reduction(node_ids, acyclic)
+    return DagAnalysis(
+        edges=reduced,
+        levels=topological_levels(node_ids, reduced),
+        cycle_edges=cycle_edges,
+        redundant_edges=redundant,
+        invalid_edges=len(edges) - len(unique),
+    )
+
+
+def analyse_content_map(
+    nodes: list[ContentMapNode], edges: list[ContentMapEdge]
+) -> list[ContentMapEdge]:
+    """Set each node's topo_level and return the reduced, acyclic edges"""
+    node_ids = [node.id for node in sorted(nodes, key=lambda n: n.order_index)]
+    analysis = analyse_dag(node_ids, [(e.parent_id, e.child_id) for e in edges])
+    for node in nodes:
+        node.topo_level = analysis.levels[node.id]
+    print(
+        f"[DEBUG] Graph analysis: {len(edges)} edges -> {len(analysis.edges)} "
+        f"({analysis.invalid_edges} duplicate or invalid, "
+        f"{len(analysis.cycle_edges)} closing cycles, "
+        f"{len(analysis.redundant_edges)} transitive), "
+        f"{max(analysis.levels.values(), default=-1) + 1} levels"
+    )
+    return [
+        ContentMapEdge(parent_id=parent, child_id=child)
+        for parent, child in analysis.edges
+    ]
@@ -1,22 +1,89 @@
-from supabase import Client
+import logging
 
+from fastapi import HTTPException
 
-def session_id_to_document_id(session_id: str, client: Client) -> str:
+from src.services.tracing import traced
+from src.storage import Storage
+
+
+class InvalidDocumentError(ValueError):
+    """The stored document is not a usable PDF (retrying won't help)"""
+
+
+@traced()
+async def session_id_to_document_id(session_id: str, storage: Storage) -> str:
     """Get the document id for a session"""
-    document_id_result = client.table("chat_sessions").select("document_id").eq("id", session_id).execute()
-    return document_id_result.data[0]["document_id"]
+    session = await storage.get_chat_session(session_id)
+    return session["document_id"]
+
 
-def document_id_to_graph_id(document_id: str, client: Client) -> str:
+@traced()
+async def document_id_to_graph_id(document_id: str, storage: Storage) -> str:
     """Get the graph id for a document"""
-    graph_id_result = client.table("knowledge_graphs").select("id").eq("document_id", document_id).order("created_at", desc=True).execute()
-    return graph_id_result.data[0]["id"]
+    graph = await storage.get_latest_graph_for_document(document_id)
+    return graph["id"]
 
-def session_id_to_graph_id(session_id: str, client: Client) -> str:
+
+@traced()
+async def session_id_to_graph_id(session_id: str, storage: Storage) -> str:
     """Get the graph id for a session"""
-    document_id = session_id_to_document_id(session_id, client)
-    return document_id_to_graph_id(document_id, client)
+    document_id = await session_id_to_document_id(session_id, storage)
+    return await document_id_to_graph_id(document_id, storage)
+
 
-def graph_id_and_node_order_index_to_node_id(graph_id: str, node_order_index: int, client: Client) -> str:
+@traced()
+async def graph_id_and_node_order_index_to_node_id(
+    graph_id: str, node_order_index: int, storage: Storage
+) -> str:
     """Get the node id for a graph and node order index"""
-    node_id_result = client.table("graph_nodes").select("id").eq("graph_id", graph_id).eq("order_index", node_order_index).execute()
-    return node_id_result.data[0]["id"]
\ No newline at end of file
+    node = await storage.get_node_by_order_index(graph_id, node_order_index)
+    return node["id"]
+
+
+@traced()
+async def get_document_content(document_id: str, storage: Storage) -> bytes:
+    """Download a document's PDF bytes from storage"""
+    document = await storage.get_document(document_id)
+    if not document:
+        raise HTTPException(
+            status_code=404,
+            detail={"message": "Document not found", "document_id": document_id},
+        )
+
+    # download document
+    storage_path = document["storage_path"]
+    response = None
+
+    try:
+        response = await storage.download_document(storage_path)
+
+        logging.debug(f"Supabase response type: {type(response)}")
+
+        # Convert response to bytes if it isn't already
+        if isinstance(response, bytes):
+            content = response
+        elif hasattr(response, "read"):
+            content = response.read()
+        else:
+            raise ValueError(f"Unexpected response type: {type(response)}")
+
+        # Verify we got valid PDF content
+        logging.debug(f"Downloaded content length: {len(content)} bytes")
+        logging.debug(f"Content starts with: {content[:20]}")
+
+        if not content.startswith(b"%PDF"):
+            logging.error("Downloaded content is not a valid PDF!")
+            logging.debug(f"Content starts with: {content[:50]}")
+            raise InvalidDocumentError("Invalid PDF content")
+
+        return content
+
+    except InvalidDocumentError as e:
+        raise HTTPException(status_code=422, detail={"message": str(e)})
+    except Exception as e:
+        logging.error(f"Document download error: {str(e)}")
+        logging.error(f"Response type: {type(response)}")
+        raise HTTPException(
+            status_code=500,
+            detail={"message": f"Failed to download document: {str(e)}"},
+        )
@@ -1,9 +1,11 @@
+import asyncio
 from datetime import datetime
 from typing import Literal
-from supabase import Client
 from src.api.learning_progress import GraphLearningState, NodeState
 from src.api.data import document_id_to_graph_id, session_id_to_document_id
 from src.api.models import ContentMapNode, LearningProgress
+from src.services.tracing import traced
+from src.storage import Storage
 from pydantic import BaseModel
 
 
@@ -17,6 +19,7 @@ class GraphNode(BaseModel):
     children: list["GraphNode"]
     parents: list["GraphNode"]
     unlocked: bool = False
+    next_review: datetime | None = None
 
 
 def get_state(learning_progress: LearningProgress | None) -> State:
@@ -31,28 +34,31 @@ def get_state(learning_progress: LearningProgress | None) -> State:
         return "to_review"
 
 
-def build_graph(graph_id: str, client: Client) -> Graph:
+@traced()
+async def build_graph(graph_id: str, storage: Storage) -> Graph:
     # this is a bit cursed but it works
     
     graph: Graph = {}
 
-    # get learning progress
-    learning_progress_result = (
-        client.from_("learning_progress").select("*").eq("graph_id", graph_id).execute()
+    # get learning progress, nodes and edges (the three queries are independent)
+    learning_progress_rows, node_rows, edge_rows = await asyncio.gather(
+        storage.get_learning_progress_for_graph(graph_id),
+        storage.get_nodes(graph_id),
+        storage.get_edges(graph_id),
     )
     learning_progresses = [
-        LearningProgress.model_validate(item) for item in learning_progress_result.data
+        LearningProgress.model_validate(item) for item in learning_progress_rows
     ]
-
-    # get the nodes
-    nodes_result = client.from_("graph_nodes").select("*").eq("graph_id", graph_id).execute()
-    nodes = [ContentMapNode.model_validate(node) for node in nodes_result.data]
-
-    # Get the edges
-    edges_result = client.from_("graph_edges").select("*").eq("graph_id", graph_id).execute()
+    nodes = [ContentMapNode.model_validate(node) for node in node_rows]
+    # learning order: prerequisite depth (computed when the graph was generated, see
+    # src/api/dag.py) and then document order; graphs from before that have no levels
+    nodes.sort(key=lambda node: (node.topo_level or 0, node.order_index))
     
     # Create lookup dict for learning progress by node_id
     state_by_node_id = {lp.node_id: get_state(lp) for lp in learning_progresses} 
+    next_review_by_node_id = {
+        lp.node_id: lp.spaced_rep_state.next_review for lp in learning_progresses
+    }
     
     print(f"[DEBUG] State by node ID: {state_by_node_id.keys()}")
     
@@ -63,26 +69,15 @@ def build_graph(graph_id: str, client: Client) -> Graph:
 
     # create all nodes
     for node in nodes:
-        graph[node.id] = GraphNode(node=node, state=state_by_node_id.get(node.id, "not_yet_learned"), children=[], parents=[])
+        graph[node.id] = GraphNode(node=node, state=state_by_node_id.get(node.id, "not_yet_learned"), children=[], parents=[], next_review=next_review_by_node_id.get(node.id))
     
     # add all children
-    for edge in edges_result.data:
+    for edge in edge_rows:
         parent_id = edge["parent_id"]
         child_id = edge["child_id"]
         graph[parent_id].children.append(graph[child_id])
         graph[child_id].parents.append(graph[parent_id])
         
-    # # topological ordering
-    # topological_order = []
-    # visited = set()
-    # def dfs(node_id: str):
-    #     if node_id in visited:
-    #         return
-    #     visited.add(node_id)
-    #     for child_id in graph[node_id].children:
-    #         dfs(child_id)
-    #     topological_order.append(node_id)
-        
     # iterate over all nodes. mark them as unlocked if they either have no parent nodes or all their parent nodes have state "past", but if their state is "past" then they should not be unlocked
     for node_id in graph.keys():
         node = graph[node_id]
@@ -99,13 +94,28 @@ def build_graph(graph_id: str, client: Client) -> Graph:
     return graph
 
 
-async def get_unlocked_nodes(session_id: str, client: Client) -> list[ContentMapNode]:
-    """Get the list of valid nodes for a session"""
-    graph_id = document_id_to_graph_id(
-        session_id_to_document_id(session_id, client), 
-        client
+def rank_unlocked_nodes(graph: Graph) -> list[GraphNode]:
+    """
+    Unlocked nodes, most urgent first: reviews that are due (the most overdue first),
+    then the nodes not yet learned in learning order (the order of the graph)
+    """
+    unlocked = [node for node in graph.values() if node.unlocked]
+    due = sorted(
+        (node for node in unlocked if node.state == "to_review"),
+        key=lambda node: (node.next_review or datetime.min).replace(tzinfo=None),
+    )
+    return due + [node for node in unlocked if node.state != "to_review"]
+
+
+@traced()
+async def get_unlocked_nodes(session_id: str, storage: Storage) -> list[ContentMapNode]:
+    """Get the list of valid nodes for a session, most urgent first"""
+    graph_id = await document_id_to_graph_id(
+        await session_id_to_document_id(session_id, storage),
+        storage
     )
-    unlocked_nodes = [node.node for node in build_graph(graph_id, client).values() if node.unlocked]
+    graph = await build_graph(graph_id, storage)
+    unlocked_nodes = [node.node for node in rank_unlocked_nodes(graph)]
     print(f"[DEBUG] Unlocked node IDs: {[node.id for node in unlocked_nodes]}")
     return unlocked_nodes
 
@@ -119,21 +129,20 @@ Want to deprecate this but cant yet
 
 
 async def get_graph_learning_state(
-    graph_id: str, date: datetime, client: Client
+    graph_id: str, date: datetime, storage: Storage
 ) -> GraphLearningState:
     """Get learning state for all nodes in a graph"""
-    learning_progress_result = (
-        client.from_("learning_progress").select("*").eq("graph_id", graph_id).execute()
+    learning_progress_rows, node_rows = await asyncio.gather(
+        storage.get_learning_progress_for_graph(graph_id),
+        storage.get_nodes(graph_id),
     )
     # Use model_validate instead of manual conversion for converting SQL rows to LearningProgress
     learning_progresses = [
-        LearningProgress.model_validate(item) for item in learning_progress_result.data
+        LearningProgress.model_validate(item) for item in learning_progress_rows
     ]
 
-    # get the nodes
-    nodes_result = client.from_("graph_nodes").select("*").eq("graph_id", graph_id).execute()
     # Use model_validate for nodes too
-    nodes = [ContentMapNode.model_validate(node) for node in nodes_result.data]
+    nodes = [ContentMapNode.model_validate(node) for node in node_rows]
 
     # Create lookup dict for learning progress by node_id
     progress_by_node = {lp.node_id: lp for lp in learning_progresses}
@@ -1,5 +1,4 @@
 from typing import Optional
-from supabase import Client
 from fastapi import HTTPException
 from pydantic import BaseModel
 from src.api.spaced_repetition import apply_learning_update
@@ -10,6 +9,8 @@ from src.api.models import (
     SpacedRepState,
     ContentMapNode,
 )
+from src.services.tracing import traced
+from src.storage import Storage
 
 class NodeState(BaseModel):
     node: ContentMapNode
@@ -20,18 +21,14 @@ class GraphLearningState(BaseModel):
     to_review: list[NodeState]
     not_yet_learned: list[NodeState]
     
+@traced()
 async def learning_progress_update_from_request(
-    request: LearningProgressUpdateRequest, client: Client
+    request: LearningProgressUpdateRequest, storage: Storage
 ) -> LearningProgressUpdate:
     # 1. Check if there exists a LearningProgress with that node_id
-    progress_result = (
-        client.from_("learning_progress")
-        .select("*")
-        .eq("node_id", request.node_id)
-        .execute()
-    )
+    progress = await storage.get_learning_progress_for_node(request.node_id)
 
-    if not progress_result.data:
+    if not progress:
         print(f"Creating new LearningProgress entry for node {request.node_id}")
         # 1.1 Create new LearningProgress entry with default SpacedRepState
         new_progress = {
@@ -41,16 +38,12 @@ async def learning_progress_update_from_request(
             "version": 1,
             "spaced_rep_state": SpacedRepState().model_dump(mode="json"),
         }
-        progress_result = (
-            client.from_("learning_progress").insert(new_progress).execute()
-        )
-        if not progress_result.data:
+        progress = await storage.insert_learning_progress(new_progress)
+        if not progress:
             raise HTTPException(
                 status_code=500, detail="Failed to create learning progress"
             )
-        progress_id = progress_result.data[0]["id"]
-    else:
-        progress_id = progress_result.data[0]["id"]
+    progress_id = progress["id"]
 
     update = LearningProgressUpdate(
         learning_progress_id=progress_id,
@@ -60,24 +53,23 @@ async def learning_progress_update_from_request(
     )
 
     # 3. Log LearningProgressUpdate to database
-    update_result = (
-        client.from_("learning_progress_updates")
-        .insert(update.model_dump(mode="json"))
-        .execute()
+    update_row = await storage.insert_learning_progress_update(
+        update.model_dump(mode="json")
     )
-    if not update_result.data:
+    if not update_row:
         raise HTTPException(
             status_code=500, detail="Failed to log learning progress update"
         )
 
     # 4. Return the update and the learning_progress
     return LearningProgressUpdate.model_validate(
-        update_result.data[0]
-    ), LearningProgress.model_validate(progress_result.data[0])
+        update_row
+    ), LearningProgress.model_validate(progress)
 
 
+@traced()
 async def update_learning_progress(
-    request: LearningProgressUpdateRequest, client: Client
+    request: LearningProgressUpdateRequest, storage: Storage
 ) -> dict:
     """Update learning progress for a node from a LearningProgressUpdate"""
     print(
@@ -85,7 +77,7 @@ async def update_learning_progress(
     )
     # Get the LearningProgressUpdate and LearningProgress
     update, current_progress = await learning_progress_update_from_request(
-        request, client
+        request, storage
     )
 
     # Apply spaced repetition update
@@ -94,19 +86,15 @@ async def update_learning_progress(
     )
 
     # Update the learning progress entry
-    result = (
-        client.from_("learning_progress")
-        .update(
-            {
-                "spaced_rep_state": new_spaced_rep_state.model_dump(mode="json"),
-                "version": current_progress.version + 1,
-            }
-        )
-        .eq("id", update.learning_progress_id)
-        .execute()
+    result = await storage.update_learning_progress(
+        update.learning_progress_id,
+        {
+            "spaced_rep_state": new_spaced_rep_state.model_dump(mode="json"),
+            "version": current_progress.version + 1,
+        },
     )
 
-    if not result.data:
+    if not result:
         raise HTTPException(
             status_code=500, detail="Failed to update learning progress"
         )
@@ -114,32 +102,16 @@ async def update_learning_progress(
     return {"status": "success"}
 
 
-async def delete_learning_progress(learning_node_id: str, client: Client) -> dict:
+async def delete_learning_progress(learning_node_id: str, storage: Storage) -> dict:
     """Delete learning progress for a node"""
     # First, get the learning progress ID
-    learning_progress = (
-        client.table("learning_progress")
-        .select("id")
-        .eq("node_id", learning_node_id)
-        .single()
-        .execute()
-    ).data
+    learning_progress = await storage.get_learning_progress_for_node(learning_node_id)
 
     if learning_progress:
         # Delete related learning progress updates first
-        (
-            client.table("learning_progress_updates")
-            .delete()
-            .eq("learning_progress_id", learning_progress["id"])
-            .execute()
-        )
+        await storage.delete_learning_progress_updates(learning_progress["id"])
 
         # Then delete the learning progress itself
-        return (
-            client.table("learning_progress")
-            .delete()
-            .eq("node_id", learning_node_id)
-            .execute()
-        )
+        return await storage.delete_learning_progress(learning_node_id)
 
     return None
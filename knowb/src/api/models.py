@@ -13,6 +13,8 @@ class ContentMapNode(BaseModel):
     content: str
     supporting_quotes: list[str]
     order_index: int
+    # depth in the prerequisite DAG, set at generation time (see src/api/dag.py)
+    topo_level: int | None = None
 
     class Config:
         allow_population_by_field_name = True
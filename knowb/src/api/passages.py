@@ -0,0 +1,257 @@
+"""
+Passage retrieval for tutoring sessions. Instead of a fixed prefix of the document,
+each turn's prompt gets the passages most relevant to what is being taught.
+
+A document's passage index is built once, the first time a worker processes it (or
+lazily by the first session turn that needs it), and stored in document_passages:
+
+    passages   page-aware chunks of the extracted text: a passage never spans two
+               pages, and breaks fall between paragraphs or sentences where possible
+    postings   a BM25 inverted index, term -> [[passage, term frequency], ...]
+
+Each turn queries it with the unlocked nodes and the learner's last message, and takes
+the best PASSAGE_TOP_K passages that fit in PASSAGE_TOKEN_BUDGET.
+"""
+
+import asyncio
+import math
+import os
+import re
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from src.api.ai.tokens import count_tokens
+from src.api.data import get_document_content
+from src.api.pdf2text import pdf_to_page_texts
+from src.jobs.cache import content_hash
+from src.services.tracing import span, traced
+from src.storage import Storage
+from src.storage.base import Row
+
+PASSAGE_CHARS = int(os.getenv("SESSION_PASSAGE_CHARS", "800"))
+PASSAGE_TOP_K = int(os.getenv("SESSION_PASSAGE_TOP_K", "6"))
+PASSAGE_TOKEN_BUDGET = int(os.getenv("SESSION_PASSAGE_TOKEN_BUDGET", "1500"))
+# loaded indexes kept in this process, so a session doesn't refetch one every turn
+LOADED_INDEXES = 32
+
+INDEX_VERSION = 1
+# BM25 parameters (the usual defaults)
+K1 = 1.5
+B = 0.75
+
+STOPWORDS = frozenset(
+    """a an and are as at be but by can do does for from has have how if in into is
+    it its not of on or so such that the their then there these they this to was
+    were what when which while who will with would you your""".split()
+)
+_TOKEN = re.compile(r"[a-z0-9]+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def tokenize(text: str) -> list[str]:
+    return [
+        token
+        for token in _TOKEN.findall(text.lower())
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+
+@dataclass
+class Passage:
+    page: int  # 1-based
+    text: str
+
+
+def _pieces(page_text: str, max_chars: int) -> list[str]:
+    """Paragraphs, split into sentences (and those into slices) where they're too long"""
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", page_text):
+        paragraph = " ".join(paragraph.split())
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            pieces += [
+                sentence[i : i + max_chars] for i in range(0, len(sentence), max_chars)
+            ]
+    return [piece for piece in pieces if piece]
+
+
+def chunk_pages(pages: list[str], max_chars: int = PASSAGE_CHARS) -> list[Passage]:
+    passages = []
+    for page_number, page_text in enumerate(pages, start=1):
+        current = ""
+        for piece in _pieces(page_text, max_chars):
+            if current and len(current) + 1 + len(piece) > max_chars:
+                passages.append(Passage(page_number, current))
+                current = ""
+            current = f"{current} {piece}" if current else piece
+        if current:
+            passages.append(Passage(page_number, current))
+    return passages
+
+
+class PassageIndex:
+    def __init__(
+        self,
+        passages: list[Passage],
+        postings: dict[str, list[list[int]]],
+        lengths: list[int],
+    ):
+        self.passages = passages
+        self.postings = postings
+        self.lengths = lengths
+        self.average_length = sum(lengths) / len(lengths) if lengths else 0.0
+
+    @classmethod
+    def build(cls, passages: list[Passage]) -> "PassageIndex":
+        postings: dict[str, list[list[int]]] = {}
+        lengths = []
+        for i, passage in enumerate(passages):
+            terms = Counter(tokenize(passage.text))
+            lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                postings.setdefault(term, []).append([i, frequency])
+        return cls(passages, postings, lengths)
+
+    def to_dict(self) -> dict:
+        return {
+            "version": INDEX_VERSION,
+            "passages": [[passage.page, passage.text] for passage in self.passages],
+            "postings": self.postings,
+            "lengths": self.lengths,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PassageIndex":
+        return cls(
+            [Passage(page, text) for page, text in data["passages"]],
+            data["postings"],
+            data["lengths"],
+        )
+
+    def search(self, query: str, k: int) -> list[tuple[float, int]]:
+        """The best k (score, passage index) pairs for the query, best first"""
+        n = len(self.passages)
+        scores: dict[int, float] = {}
+        for term, query_frequency in Counter(tokenize(query)).items():
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, frequency in postings:
+                norm = K1 * (1 - B + B * self.lengths[i] / self.average_length)
+                scores[i] = scores.get(i, 0.0) + query_frequency * idf * (
+                    frequency * (K1 + 1) / (frequency + norm)
+                )
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [(score, i) for i, score in best]
+
+    def select(
+        self,
+        query: str,
+        k: int = PASSAGE_TOP_K,
+        token_budget: int = PASSAGE_TOKEN_BUDGET,
+    ) -> list[Passage]:
+        """
+        The best passages for the query that fit in the budget, in document order.
+        Without any match (e.g. an empty query), the document's opening passages.
+        """
+        ranked = [i for _, i in self.search(query, k)] or range(len(self.passages))
+        chosen = []
+        used = 0
+        for i in ranked:
+            cost = count_tokens(self.passages[i].text)
+            if used + cost > token_budget:
+                continue
+            chosen.append(i)
+            used += cost
+            if len(chosen) == k:
+                break
+        return [self.passages[i] for i in sorted(chosen)]
+
+
+def format_passages(passages: list[Passage]) -> str:
+    return "\n\n".join(f"[page {passage.page}] {passage.text}" for passage in passages)
+
+
+def build_passage_index(pdf_content: bytes) -> PassageIndex:
+    return PassageIndex.build(chunk_pages(pdf_to_page_texts(pdf_content)))
+
+
+#
+# STORAGE
+#
+
+_loaded: "OrderedDict[str, PassageIndex]" = OrderedDict()
+
+
+def _remember(document_id: str, index: PassageIndex):
+    _loaded[document_id] = index
+    _loaded.move_to_end(document_id)
+    while len(_loaded) > LOADED_INDEXES:
+        _loaded.popitem(last=False)
+
+
+def _is_current(stored: Optional[Row], pdf_hash: Optional[str] = None) -> bool:
+    return (
+        stored is not None
+        and stored["passage_index"].get("version") == INDEX_VERSION
+        and (pdf_hash is None or stored["content_hash"] == pdf_hash)
+    )
+
+
+async def save_passage_index(
+    document_id: str, pdf_content: bytes, pdf_hash: str, storage: Storage
+) -> PassageIndex:
+    """Build and store a document's index unless it has one for this content"""
+    stored = await storage.get_document_passages(document_id)
+    if _is_current(stored, pdf_hash):
+        index = PassageIndex.from_dict(stored["passage_index"])
+    else:
+        # PDF text extraction is slow and CPU-bound, so keep it off the event loop
+        with span("passages.extract", pdf_bytes=len(pdf_content)) as current:
+            index = await asyncio.to_thread(build_passage_index, pdf_content)
+            if current:
+                current.set(passages=len(index.passages))
+        await storage.delete_document_passages(document_id)
+        await storage.insert_document_passages(
+            {
+                "document_id": document_id,
+                "content_hash": pdf_hash,
+                "passage_index": index.to_dict(),
+            }
+        )
+        print(
+            f"[DEBUG] Indexed document {document_id}: {len(index.passages)} passages, "
+            f"{len(index.postings)} terms"
+        )
+    _remember(document_id, index)
+    return index
+
+
+@traced()
+async def get_passage_index(document_id: str, storage: Storage) -> PassageIndex:
+    """The document's index: from this process, the database, or built now"""
+    if document_id in _loaded:
+        _loaded.move_to_end(document_id)
+        return _loaded[document_id]
+
+    stored = await storage.get_document_passages(document_id)
+    if _is_current(stored):
+        index = PassageIndex.from_dict(stored["passage_index"])
+        _remember(document_id, index)
+        return index
+
+    # documents no worker has processed yet (e.g. their graph came from the cache)
+    pdf_content = await get_document_content(document_id, storage)
+    return await save_passage_index(
+        document_id, pdf_content, content_hash(pdf_content), storage
+    )
+
+
+@traced()
+async def get_relevant_passages(document_id: str, query: str, storage: Storage) -> str:
+    index = await get_passage_index(document_id, storage)
+    return format_passages(index.select(query))
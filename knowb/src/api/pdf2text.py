@@ -42,6 +42,15 @@ def convert_base64_pdf_to_text(base64_string: str) -> str:
         raise Exception(f"Error processing PDF: {str(e)}")
 
 
+def pdf_to_page_texts(pdf_bytes: bytes) -> list[str]:
+    """The extracted text of each page of a PDF, in order"""
+    try:
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        return [page.extract_text() or "" for page in reader.pages]
+    except Exception as e:
+        raise Exception(f"Error processing PDF: {str(e)}")
+
+
 # Example usage
 def example_usage():
     # Example of how to use the function
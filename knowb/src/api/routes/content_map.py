@@ -1,78 +1,108 @@
-import traceback
-import traceback
-from supabase import Client
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from postgrest import APIResponse
-from src.api.routes.documents import get_document_content
-from src.services import get_supabase_client
+import asyncio
+import json
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from src.services.security import security, get_user_id_from_token
-from src.api.ai.make_map import make_content_map
+from src.api.ai.make_map import MODEL
+from src.jobs.cache import cache_key, clone_graph, get_cached_graph_id
+from src.jobs.events import (
+    KEEPALIVE_SECONDS,
+    TERMINAL_EVENTS,
+    TERMINAL_STATUSES,
+    broker,
+    ensure_relay,
+)
+from src.jobs.queue import enqueue_content_map_job, job_progress
+from src.jobs.worker import in_process_worker_running, wake_workers
+from src.services.metrics import track_stream
+from src.storage import Storage, get_storage
 from src.users.user_settings import get_user_prompt
 
 router = APIRouter()
 
+# "auto": relay job status from the database for the event stream unless a worker runs
+# in this process (whose events reach listeners directly); "always" when workers run
+# in other processes too, "never" to rely on pushed events alone
+EVENTS_RELAY = os.getenv("CONTENT_MAP_EVENTS_RELAY", "auto")
 
-def graph_exists_for_document(document_id: str, client: Client) -> bool:
-    result = (
-        client.from_("knowledge_graphs")
-        .select("*")
-        .eq("document_id", document_id)
-        .execute()
-    )
-    return len(result.data) > 0
 
+async def graph_exists_for_document(document_id: str, storage: Storage) -> bool:
+    return await storage.get_latest_graph_for_document(document_id) is not None
 
 
-def insert_new_knowledge_graph(document_id: str, client: Client) -> str:
-    graph_result = (
-        client.from_("knowledge_graphs").insert({"document_id": document_id}).execute()
-    )
-    if not graph_result.data:
+async def insert_new_knowledge_graph(document_id: str, storage: Storage) -> str:
+    graph = await storage.insert_graph({"document_id": document_id})
+    if not graph:
         raise HTTPException(status_code=500, detail="Failed to create knowledge graph")
-    return graph_result.data[0]["id"]
-
-
-def check_data_and_cleanup_on_fail(
-    client: Client, graph_id: str, result: APIResponse, name: str
-):
-    if not result.data:
-        client.from_("knowledge_graphs").delete().eq("id", graph_id).execute()
-        raise HTTPException(status_code=500, detail=f"Failed to create {name}")
+    return graph["id"]
+
+
+async def copy_cached_content_map(
+    document_id: str, prompt_id: str, graph_id: str, storage: Storage
+) -> bool:
+    """Fill the graph from the cache if this document was mapped with this prompt before"""
+    document = await storage.get_document(document_id)
+    if not document or not document["content_hash"]:
+        # the hash is recorded the first time a worker downloads the document
+        return False
+    key = cache_key(document["content_hash"], prompt_id, MODEL)
+    # cache entries and the graphs they point at may belong to other users
+    admin_storage = get_storage()
+    source_graph_id = await get_cached_graph_id(key, admin_storage)
+    if not source_graph_id:
+        return False
+
+    nodes = await admin_storage.get_nodes(source_graph_id)
+    edges = await admin_storage.get_edges(source_graph_id)
+    await clone_graph(source_graph_id, graph_id, storage, nodes, edges)
+    await storage.update_graph(graph_id, {"status": "complete"})
+    print(f"[DEBUG] Copied cached content map {source_graph_id} to {graph_id}")
+    return True
 
 
 @router.post("/run/{document_id}")
-async def run_content_map(
-    document_id: str, background_tasks: BackgroundTasks, token: str = Depends(security)
-):
+async def run_content_map(document_id: str, token: str = Depends(security)):
     try:
-        client = get_supabase_client(token)
-        user_id = get_user_id_from_token(token)
+        storage = get_storage(token)
+        user_id = await get_user_id_from_token(token)
 
         # Get prompt info once
         user_prompt = await get_user_prompt(user_id)
 
         # Insert new knowledge graph with prompt_id
-        graph_result = (
-            client.from_("knowledge_graphs")
-            .insert(
-                {
-                    "document_id": document_id,
-                    "status": "processing",
-                    "prompt_id": user_prompt.id,  # Store which prompt was used
-                }
-            )
-            .execute()
+        graph = await storage.insert_graph(
+            {
+                "document_id": document_id,
+                "status": "processing",
+                "prompt_id": user_prompt.id,  # Store which prompt was used
+            }
         )
 
-        if not graph_result.data:
+        if not graph:
             raise HTTPException(
                 status_code=500, detail="Failed to create knowledge graph"
             )
 
-        graph_id = graph_result.data[0]["id"]
+        graph_id = graph["id"]
+
+        if await copy_cached_content_map(
+            document_id, user_prompt.id, graph_id, storage
+        ):
+            return {"status": "complete", "graph_id": graph_id}
 
-        # Queue the background task
-        background_tasks.add_task(process_content_map, document_id, graph_id, token)
+        # Queue the job; a content map worker picks it up (see src/jobs/worker.py)
+        job = await enqueue_content_map_job(
+            graph_id, document_id, user_id, user_prompt.id, storage
+        )
+        if not job:
+            await storage.delete_graph(graph_id)
+            raise HTTPException(
+                status_code=500, detail="Failed to queue content map job"
+            )
+        wake_workers()
 
         return {"status": "processing", "graph_id": graph_id}
 
@@ -83,40 +113,110 @@ async def run_content_map(
         )
 
 
-async def process_content_map(document_id: str, graph_id: str, token: str):
+async def graph_progress(graph_id: str, storage: Storage) -> Optional[dict]:
+    """The status payload for a graph, or None if it doesn't exist (for this user)"""
+    job = await storage.get_content_map_job(graph_id)
+    graph = await storage.get_graph(graph_id)
+    if job:
+        progress = job_progress(job)
+    elif graph:
+        # graphs generated before the job queue existed have no job row
+        progress = {
+            "graph_id": graph_id,
+            "status": graph["status"],
+            "stage": graph["status"],
+            "error_message": graph["error_message"],
+        }
+    else:
+        return None
+
+    if graph:
+        # nodes saved so far, while the content map streams in
+        progress["node_count"] = graph["node_count"] or 0
+        progress["edge_count"] = graph["edge_count"] or 0
+    return progress
+
+
+async def user_owns_graph(graph_id: str, user_id: str, storage: Storage) -> bool:
+    """Whether the graph is of one of the user's documents"""
+    graph = await storage.get_graph(graph_id)
+    if not graph:
+        return False
+    document = await storage.get_document(graph["document_id"])
+    return bool(document) and document["user_id"] == user_id
+
+
+@router.get("/status/{graph_id}")
+async def get_content_map_status(graph_id: str, token: str = Depends(security)):
+    """Cheap progress check for a graph that is being generated"""
+    storage = get_storage(token)
+    # the storage client doesn't act as the user, so their access is checked here
+    user_id = await get_user_id_from_token(token)
+    if not await user_owns_graph(graph_id, user_id, storage):
+        raise HTTPException(status_code=404, detail="Knowledge graph not found")
+    progress = await graph_progress(graph_id, storage)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Knowledge graph not found")
+    return progress
+
+
+def format_event(event: dict) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+
+@router.get("/events/{graph_id}")
+async def stream_content_map_events(graph_id: str, token: str = Depends(security)):
+    """
+    Server-sent events for a graph being generated (see src/jobs/events.py): a
+    "snapshot" with the current status, then each transition until complete or error
+    """
+    storage = get_storage(token)
+    # the storage client doesn't act as the user, so their access is checked here
+    user_id = await get_user_id_from_token(token)
+    if not await user_owns_graph(graph_id, user_id, storage):
+        raise HTTPException(status_code=404, detail="Knowledge graph not found")
+
+    # subscribe before reading the snapshot, so nothing between the two is missed
+    queue = broker.subscribe(graph_id)
     try:
-        client = get_supabase_client(token)
-        doc = get_document_content(document_id, client)
-        user_id = get_user_id_from_token(token)
-
-        user_prompt = await get_user_prompt(user_id)
-        nodes, edges = make_content_map(doc, user_prompt)
-
-        # Insert nodes and edges
-        nodes_data = [{**vars(node), "graph_id": graph_id} for node in nodes]
-        edges_data = [
-            {
-                "parent_id": edge.parent_id,
-                "child_id": edge.child_id,
-                "graph_id": graph_id,
-            }
-            for edge in edges
-        ]
-
-        nodes_result = client.from_("graph_nodes").insert(nodes_data).execute()
-        check_data_and_cleanup_on_fail(client, graph_id, nodes_result, "nodes")
-
-        edges_result = client.from_("graph_edges").insert(edges_data).execute()
-        check_data_and_cleanup_on_fail(client, graph_id, edges_result, "edges")
-
-        # Update graph status to complete
-        client.from_("knowledge_graphs").update({"status": "complete"}).eq(
-            "id", graph_id
-        ).execute()
+        snapshot = await graph_progress(graph_id, storage)
+    except Exception:
+        broker.unsubscribe(graph_id, queue)
+        raise
+    if snapshot is None:
+        broker.unsubscribe(graph_id, queue)
+        raise HTTPException(status_code=404, detail="Knowledge graph not found")
+    if EVENTS_RELAY == "always" or (
+        EVENTS_RELAY == "auto" and not in_process_worker_running()
+    ):
+        # the relay is shared by every listener, so it reads with the admin client
+        # (this listener's access was checked above)
+        ensure_relay(
+            graph_id, lambda graph_id: graph_progress(graph_id, get_storage()), snapshot
+        )
 
-    except Exception as e:
-        print(f"[DEBUG] Background task error: {str(e)}\n{traceback.format_exc()}")
-        # Update graph status to error
-        client.from_("knowledge_graphs").update(
-            {"status": "error", "error_message": str(e)}
-        ).eq("id", graph_id).execute()
+    async def event_generator():
+        try:
+            yield format_event({"event": "snapshot", **snapshot})
+            if snapshot["status"] in TERMINAL_STATUSES:
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_event(event)
+                if event["event"] in TERMINAL_EVENTS:
+                    return
+        finally:
+            broker.unsubscribe(graph_id, queue)
+
+    return StreamingResponse(
+        track_stream("content_map_events", event_generator()),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        },
+    )
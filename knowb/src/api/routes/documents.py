@@ -1,10 +1,7 @@
 from io import BytesIO
-import logging
 from fastapi import APIRouter, Depends, HTTPException, Header
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from supabase import Client
-from src.services import get_supabase_client, supabase
 from src.services.security import security, get_user_id_from_token
 
 router = APIRouter()
@@ -94,51 +91,6 @@ class KnowledgeMapRequest(BaseModel):
 
 @router.get("/debug/user_id")
 async def get_user_id(token: str = Depends(security)):
-    user_id = get_user_id_from_token(token)
+    user_id = await get_user_id_from_token(token)
     return {"user_id": user_id}
 
-
-def get_document_content(document_id: str, client: Client) -> bytes:
-    # Get the document
-    doc_result = client.from_("documents").select("*").eq("id", document_id).execute()
-    if not doc_result.data:
-        raise HTTPException(
-            status_code=404,
-            detail={"message": "Document not found", "document_id": document_id},
-        )
-
-    # download document
-    document = doc_result.data[0]
-    storage_path = document["storage_path"]
-
-    try:
-        response = client.storage.from_("documents").download(storage_path)
-
-        logging.debug(f"Supabase response type: {type(response)}")
-
-        # Convert response to bytes if it isn't already
-        if isinstance(response, bytes):
-            content = response
-        elif hasattr(response, "read"):
-            content = response.read()
-        else:
-            raise ValueError(f"Unexpected response type: {type(response)}")
-
-        # Verify we got valid PDF content
-        logging.debug(f"Downloaded content length: {len(content)} bytes")
-        logging.debug(f"Content starts with: {content[:20]}")
-
-        if not content.startswith(b"%PDF"):
-            logging.error("Downloaded content is not a valid PDF!")
-            logging.debug(f"Content starts with: {content[:50]}")
-            raise ValueError("Invalid PDF content")
-
-        return content
-
-    except Exception as e:
-        logging.error(f"Document download error: {str(e)}")
-        logging.error(f"Response type: {type(response)}")
-        raise HTTPException(
-            status_code=500,
-            detail={"message": f"Failed to download document: {str(e)}"},
-        )
@@ -2,8 +2,9 @@ from datetime import datetime
 import traceback
 from fastapi import APIRouter, Depends, HTTPException
 from src.api.graph import get_graph_learning_state
-from src.services import get_supabase_client
+from src.storage import get_storage
 from src.services.security import get_user_id_from_token, security
+from src.services.tracing import start_trace
 from src.api.models import (
     LearningProgressUpdateRequest,
 )
@@ -20,8 +21,8 @@ async def get_graph_learning_state_route(
     graph_id: str, date: datetime, token: str = Depends(security)
 ):
     try:
-        client = get_supabase_client(token)
-        return await get_graph_learning_state(graph_id, date, client)
+        storage = get_storage(token)
+        return await get_graph_learning_state(graph_id, date, storage)
     except Exception as e:
         print("Full error traceback:")
         traceback.print_exc()
@@ -41,10 +42,11 @@ async def learning_update_route(
 ):
     print(f"Received learning update: {update}")
     try:
-        client = get_supabase_client(token)
-        user_id = get_user_id_from_token(token)
+        storage = get_storage(token)
+        user_id = await get_user_id_from_token(token)
         update.user_id = user_id  # get this from authentication, since we need it to build the LearningProgress later on
-        return await update_learning_progress(update, client)
+        with start_trace("learning.update", node_id=update.node_id, slow_seconds=2):
+            return await update_learning_progress(update, storage)
     except Exception as e:
         print("Full error traceback:")
         traceback.print_exc()
@@ -61,8 +63,8 @@ async def learning_update_route(
 @router.delete("/learning_delete/{learning_node_id}")
 async def learning_delete_route(learning_node_id: str, token: str = Depends(security)):
     try:
-        client = get_supabase_client(token)
-        return await delete_learning_progress(learning_node_id, client)
+        storage = get_storage(token)
+        return await delete_learning_progress(learning_node_id, storage)
     except Exception as e:
         print("Full error traceback:")
         traceback.print_exc()
@@ -1,8 +1,14 @@
-from fastapi import APIRouter, Depends
+import uuid
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, WebSocket
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from src.api.ai.chat_socket import serve_chat_socket
+from src.api.ai.chat_turns import get_or_start_turn, parse_last_event_id
 from src.api.ai.session import handle_chat_stream
-from src.services.security import security
+from src.services.metrics import track_stream
+from src.services.security import get_user_id_from_token, security
 
 router = APIRouter()
 
@@ -13,12 +19,38 @@ class ChatMessage(BaseModel):
 
 
 @router.get("/stream")
-async def stream_chat(message: str, session_id: str, token: str = Depends(security)):
+async def stream_chat(
+    message: str,
+    session_id: str,
+    turn_id: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
+    token: str = Depends(security),
+):
+    """
+    Stream a chat turn (see src/api/ai/chat_turns.py). Retrying with the same turn_id
+    (or Idempotency-Key header) resumes the turn instead of starting another one; a
+    reconnecting EventSource sends Last-Event-ID to skip what it already has.
+    """
+    user_id = await get_user_id_from_token(token)
+    turn = get_or_start_turn(
+        session_id,
+        turn_id or idempotency_key or uuid.uuid4().hex,
+        lambda: handle_chat_stream(message, session_id, token, user_id=user_id),
+        user_id=user_id,
+        message=message,
+    )
     return StreamingResponse(
-        handle_chat_stream(message, session_id, token),
+        track_stream("chat", turn.events(parse_last_event_id(last_event_id))),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
         },
     )
+
+
+@router.websocket("/ws")
+async def chat_socket(websocket: WebSocket):
+    """One connection for all of a learner's chat turns (see src/api/ai/chat_socket.py)"""
+    await serve_chat_socket(websocket)
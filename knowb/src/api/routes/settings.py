@@ -0,0 +1,14 @@
+from fastapi import APIRouter, Depends
+from src.services.security import get_user_id_from_token, security
+from src.users.user_settings import invalidate_user_prompts
+
+router = APIRouter()
+
+
+# The settings page writes prompts and user_settings straight to Supabase, then calls
+# this so the next content map doesn't use a cached selection (see user_settings.py)
+@router.post("/prompts_changed")
+async def prompts_changed(token: str = Depends(security)):
+    user_id = await get_user_id_from_token(token)
+    invalidate_user_prompts(user_id)
+    return {"status": "ok"}
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
-import base64
-import os
-import requests
+import asyncio
+import json
+import httpx
+from src.api.ai.chat_socket import authenticate
+from src.api.stt import get_recognizer, recognize
 from src.services.security import security
 
 router = APIRouter()
@@ -16,53 +18,77 @@ class SpeechRequest(BaseModel):
 @router.post("/speech-to-text")
 async def speech_to_text(request: SpeechRequest, token: str = Depends(security)):
     try:
-        # Decode base64 audio
-        audio_bytes = base64.b64decode(request.audio)
-
-        # Google Speech-to-Text API endpoint
-        url = "https://speech.googleapis.com/v1/speech:recognize"
-
-        # Request payload
-        payload = {
-            "config": {
-                "encoding": "WEBM_OPUS",
-                "sampleRateHertz": 48000,
-                "languageCode": "en-GB",
-                "model": "default",
-            },
-            "audio": {"content": base64.b64encode(audio_bytes).decode("utf-8")},
-        }
+        # The transcript will be sent back to the frontend
+        # where it will be automatically fed into the chat flow
+        transcript = await recognize(request.audio)
+        print(f"[DEBUG] Transcript: {transcript}")
+        return {"text": transcript}
 
-        # Make request to Google API
-        api_key = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-        print("API Key:", api_key)
-        response = requests.post(
-            url,
-            json=payload,
-            params={"key": api_key},
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(
+            status_code=e.response.status_code,
+            detail=f"Google API error: {e.response.text}",
         )
+    except Exception as e:
+        print(f"Error in speech-to-text: {str(e)}")  # For debugging
+        raise HTTPException(status_code=500, detail=str(e))
 
-        if not response.ok:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Google API error: {response.text}",
-            )
 
-        result = response.json()
-        print("Result:", result)
+# Streaming speech-to-text. The client authenticates with its first message, as on
+# the chat socket ({"type": "auth", "token"}), then sends the recording's chunks as
+# binary messages while it records, and {"type": "end"} when it stops:
+#
+#     {"type": "ready"}
+#     {"type": "transcript", "text", "final"}   interim guesses, then final phrases
+#     {"type": "end", "text"}                   the whole transcript
+#     {"type": "error", "detail"}
+@router.websocket("/speech-to-text/ws")
+async def speech_to_text_stream(websocket: WebSocket):
+    await websocket.accept()
+    if await authenticate(websocket) is None:
+        return
+    await websocket.send_json({"type": "ready"})
 
-        # Extract transcript
-        transcript = ""
-        if "results" in result:
-            for result in result["results"]:
-                if "alternatives" in result and result["alternatives"]:
-                    transcript += result["alternatives"][0]["transcript"]
+    chunks: asyncio.Queue = asyncio.Queue()
 
-        # The transcript will be sent back to the frontend
-        # where it will be automatically fed into the chat flow
-        print("Transcript:", transcript)
-        return {"text": transcript}
+    async def receive_audio():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    await chunks.put(message["bytes"])
+                elif message.get("text"):
+                    if json.loads(message["text"]).get("type") == "end":
+                        break
+        finally:
+            await chunks.put(None)
+
+    async def audio():
+        while (chunk := await chunks.get()) is not None:
+            yield chunk
 
+    receiver = asyncio.create_task(receive_audio())
+    final_text = []
+    try:
+        async for transcript in get_recognizer().stream(audio()):
+            if transcript.is_final:
+                final_text.append(transcript.text.strip())
+            await websocket.send_json(
+                {
+                    "type": "transcript",
+                    "text": transcript.text,
+                    "final": transcript.is_final,
+                }
+            )
+        await websocket.send_json({"type": "end", "text": " ".join(final_text)})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
-        print(f"Error in speech-to-text: {str(e)}")  # For debugging
-        raise HTTPException(status_code=500, detail=str(e))
+        print(f"Error in streaming speech-to-text: {str(e)}")
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close()
+    finally:
+        receiver.cancel()
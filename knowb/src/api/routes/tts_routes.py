@@ -1,32 +1,54 @@
-from fastapi import APIRouter, WebSocket
-from src.api.tts.google_tts import TTSService
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from src.api.tts import get_tts_service, speak
+import asyncio
 import json
 
 router = APIRouter()
-# tts_service = TTSService()
 
 
-# Route for TTS through Google cloud
+# Route for TTS through Google cloud. The client sends text as it gets it,
+# {"text": chunk}, with "end": true on the last chunk of an utterance; each
+# sentence's audio comes back as a binary message, in order, as soon as it is ready
+# (see src/api/tts/pipeline.py).
 @router.websocket("/ws/tts")
 async def websocket_endpoint(websocket: WebSocket):
     print("[TTS] New WebSocket connection established")
     await websocket.accept()
 
-    try:
-        while True:
-            data = await websocket.receive_text()
-            text_chunk = json.loads(data)["text"]
-            print(
-                f"[TTS] Received text chunk for TTS: {text_chunk[:50]}..."
-            )  # First 50 chars
+    # text chunks; None ends an utterance, and a connection that went away
+    texts: asyncio.Queue = asyncio.Queue()
+    closed = False
+
+    async def receive_text():
+        nonlocal closed
+        try:
+            while True:
+                data = json.loads(await websocket.receive_text())
+                if data.get("text"):
+                    await texts.put(data["text"])
+                if data.get("end"):
+                    await texts.put(None)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            closed = True
+            await texts.put(None)
 
-            print("[TTS] Calling Google TTS API")
-            audio_content = await tts_service.stream_text_to_speech(text_chunk)
-            print(f"[TTS] Received audio content of size: {len(audio_content)} bytes")
+    async def utterance():
+        while (text := await texts.get()) is not None:
+            yield text
 
-            await websocket.send_bytes(audio_content)
-            print("[TTS] Sent audio content to client")
+    receiver = asyncio.create_task(receive_text())
+    try:
+        while not closed:
+            async for sentence, audio_content in speak(utterance(), get_tts_service()):
+                print(
+                    f"[TTS] Sending {len(audio_content)} bytes for: {sentence[:50]}..."
+                )
+                await websocket.send_bytes(audio_content)
 
     except Exception as e:
         print(f"[TTS] WebSocket error: {str(e)}")
         await websocket.close()
+    finally:
+        receiver.cancel()
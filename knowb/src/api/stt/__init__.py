@@ -0,0 +1,3 @@
+from .google_stt import GoogleRecognizer, Transcript, get_recognizer, recognize
+
+__all__ = ["GoogleRecognizer", "Transcript", "get_recognizer", "recognize"]
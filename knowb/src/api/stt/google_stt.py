@@ -0,0 +1,146 @@
+"""
+Speech-to-text through Google Cloud Speech.
+
+recognize() transcribes a whole recording with one REST call. GoogleRecognizer.stream
+transcribes audio while it is still being recorded: chunks go up a gRPC stream as
+they arrive, and interim transcripts come back as the speech is recognized, so the
+final transcript is ready soon after the learner stops talking.
+
+Both keep one client for the process (an HTTP connection pool, a gRPC channel), so
+requests don't pay for a new TLS handshake each time.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+import httpx
+from dotenv import load_dotenv
+from google.api_core import client_options
+from google.cloud import speech_v1
+
+load_dotenv()
+
+RECOGNIZE_URL = "https://speech.googleapis.com/v1/speech:recognize"
+LANGUAGE_CODE = "en-GB"
+# what MediaRecorder produces in the browser ("audio/webm;codecs=opus")
+SAMPLE_RATE_HERTZ = 48000
+RECOGNIZE_TIMEOUT_SECONDS = 30
+# Google takes at most 25 KB of audio per streaming request
+MAX_CHUNK_BYTES = 25 * 1024
+
+
+def _api_key() -> Optional[str]:
+    return os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+
+
+@dataclass
+class Transcript:
+    text: str
+    # False for an interim guess, which later transcripts replace
+    is_final: bool
+
+
+#
+# WHOLE RECORDINGS
+#
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=RECOGNIZE_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+    return _http_client
+
+
+def _joined_transcript(results: list) -> str:
+    return "".join(
+        result["alternatives"][0]["transcript"]
+        for result in results
+        if result.get("alternatives")
+    )
+
+
+async def recognize(audio_base64: str) -> str:
+    """
+    The transcript of a whole recording, given base64-encoded as Google takes it;
+    raises httpx.HTTPStatusError on failure
+    """
+    payload = {
+        "config": {
+            "encoding": "WEBM_OPUS",
+            "sampleRateHertz": SAMPLE_RATE_HERTZ,
+            "languageCode": LANGUAGE_CODE,
+            "model": "default",
+        },
+        "audio": {"content": audio_base64},
+    }
+    response = await get_http_client().post(
+        RECOGNIZE_URL, json=payload, params={"key": _api_key()}
+    )
+    response.raise_for_status()
+    return _joined_transcript(response.json().get("results", []))
+
+
+#
+# STREAMING
+#
+
+
+class GoogleRecognizer:
+    """Streaming recognition. Create it inside the event loop it will be used in."""
+
+    def __init__(self):
+        self.client = speech_v1.SpeechAsyncClient(
+            client_options=client_options.ClientOptions(api_key=_api_key())
+        )
+        self.config = speech_v1.StreamingRecognitionConfig(
+            config=speech_v1.RecognitionConfig(
+                encoding=speech_v1.RecognitionConfig.AudioEncoding.WEBM_OPUS,
+                sample_rate_hertz=SAMPLE_RATE_HERTZ,
+                language_code=LANGUAGE_CODE,
+                enable_automatic_punctuation=True,
+            ),
+            interim_results=True,
+        )
+
+    async def _requests(
+        self, chunks: AsyncIterator[bytes]
+    ) -> AsyncIterator[speech_v1.StreamingRecognizeRequest]:
+        yield speech_v1.StreamingRecognizeRequest(streaming_config=self.config)
+        async for chunk in chunks:
+            for start in range(0, len(chunk), MAX_CHUNK_BYTES):
+                yield speech_v1.StreamingRecognizeRequest(
+                    audio_content=chunk[start : start + MAX_CHUNK_BYTES]
+                )
+
+    async def stream(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[Transcript]:
+        """Transcripts of the audio in chunks, interim ones included, until it ends"""
+        responses = await self.client.streaming_recognize(
+            requests=self._requests(chunks)
+        )
+        async for response in responses:
+            # the first result is the stable part, the rest is still being guessed
+            text = "".join(
+                result.alternatives[0].transcript
+                for result in response.results
+                if result.alternatives
+            )
+            if text:
+                is_final = all(result.is_final for result in response.results)
+                yield Transcript(text, is_final)
+
+
+_recognizer: Optional[GoogleRecognizer] = None
+
+
+def get_recognizer() -> GoogleRecognizer:
+    global _recognizer
+    if _recognizer is None:
+        _recognizer = GoogleRecognizer()
+    return _recognizer
@@ -1,3 +1,10 @@
-from .google_tts import TTSService
+from .google_tts import TTSService, get_tts_service
+from .pipeline import SentenceSegmenter, SpeakableText, speak
 
-__all__ = ['TTSService']
\ No newline at end of file
+__all__ = [
+    "TTSService",
+    "get_tts_service",
+    "SentenceSegmenter",
+    "SpeakableText",
+    "speak",
+]
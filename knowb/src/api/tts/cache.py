@@ -0,0 +1,171 @@
+"""
+Synthesized audio, cached by content. Tutor replies repeat a lot of phrasing (review
+prompts, the node-complete scaffolding), so a sentence is often spoken many times.
+
+The key is a sha256 of the text and everything that shapes the audio (voice, language,
+audio config), so changing the voice can't serve stale audio. There are two tiers:
+
+    memory   an LRU of up to TTS_CACHE_MEMORY_BYTES of audio, in this process
+    disk     TTS_CACHE_DIR/<key[:2]>/<key>.mp3, shared by the processes on a host;
+             when it grows past TTS_CACHE_DISK_BYTES the least recently used files
+             (by mtime, refreshed on every hit) are deleted
+
+Files are written to a temporary file and renamed into place, so a reader never sees
+a partial file. Lookups are counted in tts_cache_lookups_total{tier}.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+from src.services.metrics import TTS_CACHE_BYTES, TTS_CACHE_LOOKUPS
+
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", str(32 * 1024**2)))
+TTS_CACHE_DISK_BYTES = int(os.getenv("TTS_CACHE_DISK_BYTES", str(512 * 1024**2)))
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join("cache", "tts"))
+# eviction takes the disk tier down to this share of its limit, so it runs rarely
+EVICT_TO = 0.9
+
+
+def audio_cache_key(text: str, **settings) -> str:
+    """sha256 of the text and the settings that shape its audio (JSON-serializable)"""
+    data = json.dumps({"text": text, **settings}, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    def __init__(
+        self,
+        directory: Optional[str] = TTS_CACHE_DIR,
+        memory_bytes: int = TTS_CACHE_MEMORY_BYTES,
+        disk_bytes: int = TTS_CACHE_DISK_BYTES,
+    ):
+        """directory=None keeps the cache in memory only"""
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_used = 0
+        # bytes on disk; None until the directory has been scanned
+        self._disk_used: Optional[int] = None
+        self._disk_lock = Lock()
+
+    #
+    # MEMORY
+    #
+
+    def _remember(self, key: str, audio: bytes):
+        if len(audio) > self.memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_used -= len(previous)
+        self._memory[key] = audio
+        self._memory_used += len(audio)
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= len(evicted)
+        TTS_CACHE_BYTES.set(self._memory_used, tier="memory")
+
+    #
+    # DISK
+    #
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.mp3")
+
+    def _files(self) -> list[tuple[float, int, str]]:
+        """(mtime, size, path) of every cached file"""
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".mp3"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _read(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            # recently used, as far as eviction is concerned
+            os.utime(path)
+            return audio
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key: str, audio: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(
+            dir=os.path.dirname(path), suffix=".tmp"
+        )
+        try:
+            with os.fdopen(descriptor, "wb") as f:
+                f.write(audio)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+        with self._disk_lock:
+            if self._disk_used is None:
+                self._disk_used = sum(size for _, size, _ in self._files())
+            else:
+                self._disk_used += len(audio)
+            if self._disk_used > self.disk_bytes:
+                self._evict()
+            TTS_CACHE_BYTES.set(self._disk_used, tier="disk")
+
+    def _evict(self):
+        """Delete the least recently used files (call with _disk_lock held)"""
+        files = sorted(self._files())
+        used = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if used <= self.disk_bytes * EVICT_TO:
+                break
+            try:
+                os.unlink(path)
+                used -= size
+            except FileNotFoundError:
+                pass
+        self._disk_used = used
+
+    #
+    # LOOKUPS
+    #
+
+    async def get(self, key: str) -> Optional[bytes]:
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+            TTS_CACHE_LOOKUPS.inc(tier="memory")
+            return audio
+        if self.directory is not None:
+            audio = await asyncio.to_thread(self._read, key)
+            if audio is not None:
+                self._remember(key, audio)
+                TTS_CACHE_LOOKUPS.inc(tier="disk")
+                return audio
+        TTS_CACHE_LOOKUPS.inc(tier="miss")
+        return None
+
+    async def put(self, key: str, audio: bytes):
+        self._remember(key, audio)
+        if self.directory is not None:
+            try:
+                await asyncio.to_thread(self._write, key, audio)
+            except OSError as e:
+                # the memory tier still has it; a full or read-only disk isn't fatal
+                print(f"[DEBUG] Could not write TTS cache entry {key}: {e}")
@@ -1,15 +1,22 @@
+from typing import Optional
+
 from google.cloud import texttospeech
 from google.api_core import client_options
 import os
 from dotenv import load_dotenv
 
+from src.api.tts.cache import AudioCache, audio_cache_key
+
 load_dotenv()
 
 
-# This is a temporary class for testing the TTS through Google.
-# Note that appropriate API keys are still not configured
+# Text-to-speech through Google. Note that appropriate API keys are still not configured
 class TTSService:
-    def __init__(self):
+    def __init__(
+        self,
+        client: Optional[texttospeech.TextToSpeechAsyncClient] = None,
+        cache: Optional[AudioCache] = None,
+    ):
         api_key = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 
         # if not api_key:
@@ -20,26 +27,58 @@ class TTSService:
         # Configure client with API key
         options = client_options.ClientOptions(api_key=api_key)
 
-        self.client = texttospeech.TextToSpeechClient(client_options=options)
-
-    async def stream_text_to_speech(self, text: str):
-        synthesis_input = texttospeech.SynthesisInput(text=text)
+        # the async client, so synthesis doesn't block the event loop (and several
+        # sentences can be synthesized at once, see src/api/tts/pipeline.py)
+        self.client = client or texttospeech.TextToSpeechAsyncClient(
+            client_options=options
+        )
+        self.cache = cache or AudioCache()
 
-        voice = texttospeech.VoiceSelectionParams(
+        self.voice = texttospeech.VoiceSelectionParams(
             language_code="en-US",
             name="en-US-Standard-A",
             ssml_gender=texttospeech.SsmlVoiceGender.FEMALE,
         )
 
-        audio_config = texttospeech.AudioConfig(
+        self.audio_config = texttospeech.AudioConfig(
             audio_encoding=texttospeech.AudioEncoding.MP3, speaking_rate=1.0, pitch=0.0
         )
 
+    def cache_key(self, text: str) -> str:
+        return audio_cache_key(
+            text,
+            voice=texttospeech.VoiceSelectionParams.to_json(self.voice, sort_keys=True),
+            audio_config=texttospeech.AudioConfig.to_json(
+                self.audio_config, sort_keys=True
+            ),
+        )
+
+    async def synthesize(self, text: str) -> bytes:
+        # repeated phrasing comes from the cache, without a call to Google
+        key = self.cache_key(text)
+        audio_content = await self.cache.get(key)
+        if audio_content is not None:
+            return audio_content
+
+        synthesis_input = texttospeech.SynthesisInput(text=text)
+
         try:
-            response = self.client.synthesize_speech(
-                input=synthesis_input, voice=voice, audio_config=audio_config
+            response = await self.client.synthesize_speech(
+                input=synthesis_input, voice=self.voice, audio_config=self.audio_config
             )
-            return response.audio_content
         except Exception as e:
             print(f"Error in TTS synthesis: {e}")
             raise
+        await self.cache.put(key, response.audio_content)
+        return response.audio_content
+
+
+_tts_service: Optional[TTSService] = None
+
+
+def get_tts_service() -> TTSService:
+    """The process's TTSService, created on first use (inside the event loop)"""
+    global _tts_service
+    if _tts_service is None:
+        _tts_service = TTSService()
+    return _tts_service
@@ -0,0 +1,210 @@
+"""
+Speech for text that is still being written, e.g. a tutor reply streaming from the model.
+
+The text is cut into sentences as it arrives (SentenceSegmenter), and each sentence is
+synthesized as soon as it is complete, up to TTS_CONCURRENCY at a time, while the
+model keeps writing. Audio comes out in sentence order, so the first sentence can play
+long before the reply is finished:
+
+    async for sentence, audio in speak(text_chunks, synthesizer):
+        ...
+
+A synthesizer is anything with `async synthesize(text) -> bytes` (TTSService, or
+the FakeSynthesizer of test/conftest.py).
+"""
+
+import asyncio
+import os
+import re
+from typing import AsyncIterator, Optional, Protocol
+
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "3"))
+# shorter sentences are joined to the next one (fewer, more natural sounding requests)
+MIN_SENTENCE_CHARS = int(os.getenv("TTS_MIN_SENTENCE_CHARS", "20"))
+# longer ones are cut at a comma or space, so a run-on sentence doesn't hold up audio
+MAX_SENTENCE_CHARS = int(os.getenv("TTS_MAX_SENTENCE_CHARS", "300"))
+
+# a sentence ends at ., ! or ? (and any closing quotes or brackets) before whitespace,
+# or at a line break
+_BOUNDARY = re.compile(r"[.!?]+[\"')\]]*\s+|\n+")
+# abbreviations whose full stop doesn't end a sentence
+ABBREVIATIONS = frozenset(
+    "e.g i.e etc vs cf dr mr mrs ms prof fig eq no approx".split()
+)
+
+
+THINKING_OPEN, THINKING_CLOSE = "<thinking>", "</thinking>"
+# an XML-style tag, e.g. <thinking> or </answer>; "a < b" is not one
+_TAG = re.compile(r"</?[A-Za-z_][\w-]*[^<>]*>")
+_TAG_START = re.compile(r"</?([A-Za-z_]|$)")
+# the longest a tag may run before its "<" is taken as plain text
+MAX_TAG_CHARS = 64
+# markdown emphasis and code marks, which the chat UI renders rather than shows
+_MARKDOWN = re.compile(r"[*`]+")
+
+
+class SpeakableText:
+    """
+    The part of a streamed reply that should be read out, like the frontend's
+    StreamParser: <thinking> blocks are dropped, other tags and markdown marks are
+    removed. A tag split across chunks is held back until it is complete.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.in_thinking = False
+
+    def feed(self, text: str) -> str:
+        self.buffer += text
+        speakable = []
+        while self.buffer:
+            if self.in_thinking:
+                end = self.buffer.find(THINKING_CLOSE)
+                if end == -1:
+                    # keep what could be the start of the closing tag
+                    self.buffer = self.buffer[-(len(THINKING_CLOSE) - 1) :]
+                    break
+                self.buffer = self.buffer[end + len(THINKING_CLOSE) :]
+                self.in_thinking = False
+                continue
+
+            start = self.buffer.find("<")
+            if start == -1:
+                speakable.append(self.buffer)
+                self.buffer = ""
+                break
+            speakable.append(self.buffer[:start])
+            self.buffer = self.buffer[start:]
+            if len(self.buffer) > 1 and not _TAG_START.match(self.buffer):
+                # e.g. "a < b"
+                speakable.append("<")
+                self.buffer = self.buffer[1:]
+                continue
+            close = self.buffer.find(">")
+            if close == -1 and len(self.buffer) <= MAX_TAG_CHARS:
+                # maybe a tag that the next chunk completes
+                break
+            tag = _TAG.match(self.buffer)
+            if tag is None or (close != -1 and tag.end() != close + 1):
+                speakable.append("<")
+                self.buffer = self.buffer[1:]
+                continue
+            self.in_thinking = tag.group() == THINKING_OPEN
+            self.buffer = self.buffer[tag.end() :]
+        return _MARKDOWN.sub("", "".join(speakable))
+
+    def flush(self) -> str:
+        """What is left once the reply has ended"""
+        rest = "" if self.in_thinking else self.buffer
+        self.buffer, self.in_thinking = "", False
+        return _MARKDOWN.sub("", rest)
+
+
+class Synthesizer(Protocol):
+    async def synthesize(self, text: str) -> bytes: ...
+
+
+class SentenceSegmenter:
+    def __init__(
+        self,
+        min_chars: int = MIN_SENTENCE_CHARS,
+        max_chars: int = MAX_SENTENCE_CHARS,
+    ):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.buffer = ""
+
+    def _ends_in_abbreviation(self, text: str) -> bool:
+        words = text.rstrip(".").split()
+        return bool(words) and words[-1].lower().strip("(\"'") in ABBREVIATIONS
+
+    def feed(self, text: str) -> list[str]:
+        """The sentences that text completes"""
+        self.buffer += text
+        sentences = []
+        start = 0
+        for boundary in _BOUNDARY.finditer(self.buffer):
+            candidate = self.buffer[start : boundary.end()]
+            if boundary.group().strip() and self._ends_in_abbreviation(
+                candidate.rstrip()
+            ):
+                continue
+            if len(candidate.strip()) < self.min_chars:
+                continue
+            sentences.append(candidate.strip())
+            start = boundary.end()
+        self.buffer = self.buffer[start:]
+
+        while len(self.buffer) > self.max_chars:
+            head = self.buffer[: self.max_chars]
+            cut = head.rfind(", ")
+            if cut < self.min_chars:
+                cut = head.rfind(" ")
+            cut = cut + 1 if cut > 0 else self.max_chars
+            sentences.append(self.buffer[:cut].strip())
+            self.buffer = self.buffer[cut:]
+        return [sentence for sentence in sentences if sentence]
+
+    def flush(self) -> Optional[str]:
+        """What is left once the text has ended"""
+        rest, self.buffer = self.buffer.strip(), ""
+        return rest or None
+
+
+async def sentences(texts: AsyncIterator[str]) -> AsyncIterator[str]:
+    """The sentences of a stream of text chunks, each as soon as it is complete"""
+    segmenter = SentenceSegmenter()
+    async for text in texts:
+        for sentence in segmenter.feed(text):
+            yield sentence
+    rest = segmenter.flush()
+    if rest:
+        yield rest
+
+
+async def synthesize_in_order(
+    sentence_stream: AsyncIterator[str],
+    synthesizer: Synthesizer,
+    concurrency: int = TTS_CONCURRENCY,
+) -> AsyncIterator[tuple[str, bytes]]:
+    """
+    (sentence, audio) in the order of the sentences. At most `concurrency` sentences
+    are being synthesized or waiting to be taken, so a slow reader holds up synthesis
+    instead of piling up audio.
+    """
+    slots = asyncio.Semaphore(concurrency)
+    pending: asyncio.Queue = asyncio.Queue()
+
+    async def start_synthesis():
+        try:
+            async for sentence in sentence_stream:
+                await slots.acquire()
+                task = asyncio.create_task(synthesizer.synthesize(sentence))
+                await pending.put((sentence, task))
+        finally:
+            await pending.put(None)
+
+    producer = asyncio.create_task(start_synthesis())
+    try:
+        while (item := await pending.get()) is not None:
+            sentence, task = item
+            audio = await task
+            slots.release()
+            yield sentence, audio
+        # surface a failure of the text stream itself
+        await producer
+    finally:
+        producer.cancel()
+        while not pending.empty():
+            item = pending.get_nowait()
+            if item is not None:
+                item[1].cancel()
+
+
+def speak(
+    texts: AsyncIterator[str],
+    synthesizer: Synthesizer,
+    concurrency: int = TTS_CONCURRENCY,
+) -> AsyncIterator[tuple[str, bytes]]:
+    """(sentence, audio) for streamed text, in order, while the text is still coming"""
+    return synthesize_in_order(sentences(texts), synthesizer, concurrency)
@@ -0,0 +1,139 @@
+"""
+Content maps are cached by (sha256 of the PDF, prompt id, model): mapping the same
+document with the same prompt again clones the nodes and edges of the graph that was
+generated first instead of making the LLM calls again.
+
+The content_map_cache table has one entry per key, pointing at the graph that holds
+(or is generating) the result:
+
+    pending   the graph's job is generating it; other jobs with the key wait for it
+    complete  the graph is done, copy it
+
+The entry doubles as the lock that coalesces concurrent duplicate runs: the job that
+inserts the first entry for a key generates, the others follow while it runs. If the
+leader's job stops running (it failed, or is waiting to retry), a follower takes the
+entry over with a compare-and-set update.
+"""
+
+import asyncio
+import hashlib
+import os
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from src.jobs.persist import GraphSaveResult, save_graph
+from src.storage import Storage
+from src.storage.base import Row
+from src.storage.schema import utc_now
+
+# how often a job waiting on a duplicate run checks whether it has finished
+COALESCE_POLL_SECONDS = float(os.getenv("CONTENT_MAP_COALESCE_POLL_SECONDS", "2"))
+
+
+def content_hash(pdf_content: bytes) -> str:
+    return hashlib.sha256(pdf_content).hexdigest()
+
+
+def cache_key(pdf_hash: str, prompt_id: Optional[str], model: str) -> str:
+    return f"{pdf_hash}:{prompt_id}:{model}"
+
+
+async def get_cached_graph_id(key: str, storage: Storage) -> Optional[str]:
+    """The id of a completed graph for the key, if there is one"""
+    for entry in await storage.get_content_map_cache_entries(key):
+        if entry["status"] == "complete":
+            return entry["graph_id"]
+    return None
+
+
+async def clone_graph(
+    source_graph_id: str,
+    graph_id: str,
+    storage: Storage,
+    nodes: Optional[list[Row]] = None,
+    edges: Optional[list[Row]] = None,
+) -> GraphSaveResult:
+    """
+    Copy a graph's nodes and edges (with new node ids) into another graph. Pass the
+    source nodes and edges if `storage` can't read them (they belong to another user).
+    """
+    if nodes is None:
+        nodes = await storage.get_nodes(source_graph_id)
+    if edges is None:
+        edges = await storage.get_edges(source_graph_id)
+    # node ids are primary keys, so every copy needs its own
+    new_ids = {node["id"]: f"node_{uuid.uuid4().hex}" for node in nodes}
+
+    nodes_data = [
+        {
+            "id": new_ids[node["id"]],
+            "content": node["content"],
+            "supporting_quotes": node["supporting_quotes"],
+            "summary": node["summary"],
+            "order_index": node["order_index"],
+            "topo_level": node.get("topo_level"),
+        }
+        for node in nodes
+    ]
+    edges_data = [
+        {"parent_id": new_ids[edge["parent_id"]], "child_id": new_ids[edge["child_id"]]}
+        for edge in edges
+    ]
+    return await save_graph(graph_id, nodes_data, edges_data, storage)
+
+
+async def _claim_entry(key: str, graph_id: str, storage: Storage) -> Row:
+    """The key's entry, inserting one that makes us the leader if there is none"""
+    entries = await storage.get_content_map_cache_entries(key)
+    if not entries:
+        await storage.insert_content_map_cache_entry(
+            {"cache_key": key, "graph_id": graph_id}
+        )
+        entries = await storage.get_content_map_cache_entries(key)
+    # two jobs inserting at once both see both entries: the oldest one wins and the
+    # loser removes its own
+    for entry in entries[1:]:
+        if entry["graph_id"] == graph_id:
+            await storage.delete_content_map_cache_entry(entry["id"])
+    return entries[0]
+
+
+async def lead_or_follow(
+    key: str,
+    graph_id: str,
+    storage: Storage,
+    set_stage: Callable[[str], Awaitable[None]],
+) -> Row:
+    """
+    Returns the key's entry once this graph should either generate the content map
+    (entry["graph_id"] == graph_id) or copy it (entry["status"] == "complete").
+    """
+    while True:
+        entry = await _claim_entry(key, graph_id, storage)
+        if entry["graph_id"] == graph_id or entry["status"] == "complete":
+            return entry
+
+        leader = await storage.get_content_map_job(entry["graph_id"])
+        if leader is None or leader["status"] != "running":
+            # the leader failed, or is waiting to retry (waiting on it could deadlock
+            # when both jobs need the same slot under the per-user cap): take over
+            rows = await storage.update_content_map_cache_entry(
+                entry["id"],
+                {"graph_id": graph_id, "updated_at": utc_now()},
+                expected={"graph_id": entry["graph_id"], "status": "pending"},
+            )
+            if rows:
+                return rows[0]
+            continue
+
+        await set_stage("waiting_for_duplicate")
+        await asyncio.sleep(COALESCE_POLL_SECONDS)
+
+
+async def complete_entry(entry: Row, graph_id: str, storage: Storage) -> bool:
+    rows = await storage.update_content_map_cache_entry(
+        entry["id"],
+        {"status": "complete", "updated_at": utc_now()},
+        expected={"graph_id": graph_id},
+    )
+    return bool(rows)
@@ -0,0 +1,142 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from fastapi import HTTPException
+
+from src.api.ai.make_map import MODEL, make_content_map
+from src.api.dag import analyse_content_map
+from src.api.passages import save_passage_index
+from src.api.data import InvalidDocumentError, get_document_content
+from src.jobs.cache import (
+    cache_key,
+    clone_graph,
+    complete_entry,
+    content_hash,
+    lead_or_follow,
+)
+from src.jobs.events import publish_graph_event
+from src.jobs.persist import edge_rows, level_rows, node_rows, save_graph
+from src.storage import Storage
+from src.storage.base import Row
+from src.users.user_settings import get_prompt_by_id, get_user_prompt
+
+SetStage = Callable[[str], Awaitable[None]]
+
+# most nodes staged in one batch while the final response streams in
+NODE_BATCH_SIZE = 25
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    A missing document or an invalid PDF won't fix itself; anything else might,
+    including a ValueError when the model output has no valid nodes at all.
+    """
+    if isinstance(error, HTTPException):
+        return error.status_code >= 500
+    return not isinstance(error, InvalidDocumentError)
+
+
+async def process_content_map_job(job: Row, storage: Storage, set_stage: SetStage):
+    """Generate the content map for a claimed job and save its nodes and edges"""
+    graph_id = job["graph_id"]
+
+    await set_stage("loading_document")
+    doc = await get_document_content(job["document_id"], storage)
+    # the prompt resolved when the run was requested, as recorded on the job and the
+    # graph (older jobs didn't record it), so a settings change since can't swap it
+    prompt_id = job["prompt_id"]
+    if not prompt_id:
+        graph = await storage.get_graph(graph_id)
+        prompt_id = graph["prompt_id"] if graph else None
+    if prompt_id:
+        user_prompt = await get_prompt_by_id(prompt_id, storage)
+    else:
+        user_prompt = await get_user_prompt(job["user_id"], storage)
+
+    pdf_hash = content_hash(doc)
+    # lets the next run of this document check the cache without downloading it
+    await storage.update_document(job["document_id"], {"content_hash": pdf_hash})
+    try:
+        # the document is in hand, so index it for tutoring sessions now
+        await save_passage_index(job["document_id"], doc, pdf_hash, storage)
+    except Exception as e:
+        # sessions build the index themselves if it's missing
+        print(f"[DEBUG] Failed to index document {job['document_id']}: {e}")
+    key = cache_key(pdf_hash, user_prompt.id, MODEL)
+    entry = await lead_or_follow(key, graph_id, storage, set_stage)
+    if entry["graph_id"] == graph_id and entry["status"] == "complete":
+        # an earlier attempt saved everything but died before completing the job
+        return
+
+    # rows an earlier attempt staged but never committed
+    await storage.discard_staged_graph(graph_id)
+
+    if entry["graph_id"] != graph_id:
+        await set_stage("copying_cached")
+        await clone_graph(entry["graph_id"], graph_id, storage)
+        return
+
+    await set_stage("generating")
+    # nodes stream in from the generation thread and are staged as they arrive
+    loop = asyncio.get_running_loop()
+    streamed: asyncio.Queue = asyncio.Queue()
+    stager = asyncio.create_task(stage_streamed_nodes(streamed, graph_id, storage))
+    try:
+        # make_content_map makes blocking LLM calls, so keep it off the event loop
+        nodes, edges = await asyncio.to_thread(
+            make_content_map,
+            doc,
+            user_prompt,
+            on_node=lambda node: loop.call_soon_threadsafe(streamed.put_nowait, node),
+        )
+    finally:
+        streamed.put_nowait(None)
+        staged, staged_batches = await stager
+
+    await set_stage("saving")
+    edges = analyse_content_map(nodes, edges)
+    # the chunked path returns all its nodes at the end, without streaming them
+    remaining = [node for node in nodes if node.id not in staged]
+    await save_graph(
+        graph_id,
+        node_rows(remaining),
+        edge_rows(edges),
+        storage,
+        staged_batches=staged_batches,
+        levels=level_rows([node for node in nodes if node.id in staged]),
+    )
+    await complete_entry(entry, graph_id, storage)
+
+
+async def stage_streamed_nodes(
+    streamed: asyncio.Queue, graph_id: str, storage: Storage
+) -> tuple[set[str], int]:
+    """
+    Stage nodes from the queue until it yields None; returns the ids staged and the
+    number of batches. Each batch takes whatever arrived while the previous one was
+    staged (up to NODE_BATCH_SIZE), and the running count goes into
+    knowledge_graphs.node_count and a "nodes" event.
+    """
+    staged: set[str] = set()
+    batches = 0
+    done = False
+    while not done:
+        batch = [await streamed.get()]
+        while len(batch) < NODE_BATCH_SIZE and not streamed.empty():
+            batch.append(streamed.get_nowait())
+        if batch[-1] is None:
+            done = True
+            batch.pop()
+        if not batch:
+            continue
+        try:
+            await storage.stage_graph_rows(graph_id, "nodes", node_rows(batch))
+        except Exception as e:
+            # leave them to the final save rather than lose the rest of the stream
+            print(f"[DEBUG] Failed to stage streamed nodes: {e}")
+            continue
+        staged.update(node.id for node in batch)
+        batches += 1
+        await storage.update_graph(graph_id, {"node_count": len(staged)})
+        publish_graph_event(graph_id, "nodes", node_count=len(staged))
+    return staged, batches
@@ -0,0 +1,149 @@
+"""
+Push updates for graphs that are being generated, so the frontend can listen on
+/api/content_map/events/{graph_id} (server-sent events) instead of polling.
+
+The job pipeline publishes an event on each transition:
+
+    stage      the job moved to a new stage (loading_document, generating, ...)
+    nodes      node_count nodes are saved so far
+    edges      the edges are saved (edge_count)
+    retrying   the attempt failed and the job is queued again
+    complete   the graph is ready
+    error      the job failed for good
+
+Events go through a broker with one channel per graph id. LocalBroker fans them out
+inside this process, which covers the web app with an in-process worker. Stand-alone
+worker processes can't reach it, so while a graph has listeners and no in-process
+worker is running, one relay task per graph reads the job row every
+CONTENT_MAP_RELAY_POLL_SECONDS and publishes what changed: one query per graph being
+watched, however many clients are watching it. A cross-process broker (Redis pub/sub,
+Postgres LISTEN/NOTIFY) with the same publish/subscribe/unsubscribe methods would
+replace both.
+"""
+
+import asyncio
+import os
+from threading import Lock
+from typing import Awaitable, Callable, Optional
+
+from src.storage.base import Row
+
+RELAY_POLL_SECONDS = float(os.getenv("CONTENT_MAP_RELAY_POLL_SECONDS", "2"))
+# SSE comment lines sent while nothing happens, so proxies don't close the connection
+KEEPALIVE_SECONDS = float(os.getenv("CONTENT_MAP_EVENTS_KEEPALIVE_SECONDS", "15"))
+
+TERMINAL_EVENTS = ("complete", "error")
+# job statuses (and, for graphs without a job, graph statuses) nothing follows
+TERMINAL_STATUSES = ("complete", "failed", "error")
+
+GraphEvent = dict
+
+
+class LocalBroker:
+    """In-process fan-out: every subscriber to a channel gets its own queue"""
+
+    def __init__(self):
+        self._subscribers: dict[
+            str, list[tuple[asyncio.AbstractEventLoop, asyncio.Queue]]
+        ] = {}
+        self._lock = Lock()
+
+    def subscribe(self, channel: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(
+                (asyncio.get_running_loop(), queue)
+            )
+        return queue
+
+    def unsubscribe(self, channel: str, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = [
+                subscriber
+                for subscriber in self._subscribers.get(channel, [])
+                if subscriber[1] is not queue
+            ]
+            if subscribers:
+                self._subscribers[channel] = subscribers
+            else:
+                self._subscribers.pop(channel, None)
+
+    def subscriber_count(self, channel: str) -> int:
+        with self._lock:
+            return len(self._subscribers.get(channel, []))
+
+    def publish(self, channel: str, event: GraphEvent):
+        """Safe to call from any thread or event loop"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, []))
+        for loop, queue in subscribers:
+            if loop.is_closed():
+                continue
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+
+broker = LocalBroker()
+
+
+def publish_graph_event(graph_id: str, event: str, **values):
+    broker.publish(graph_id, {"event": event, "graph_id": graph_id, **values})
+
+
+#
+# RELAY
+#
+
+FetchProgress = Callable[[str], Awaitable[Optional[Row]]]
+
+_relays: dict[str, asyncio.Task] = {}
+
+
+def progress_events(previous: Optional[Row], progress: Row) -> list[GraphEvent]:
+    """The events that take a listener from one status snapshot to the next"""
+    previous = previous or {}
+    events = []
+    terminal = progress["status"] in TERMINAL_STATUSES
+    if progress.get("stage") != previous.get("stage") and not terminal:
+        event = "retrying" if progress["stage"] == "waiting_to_retry" else "stage"
+        events.append({"event": event, **progress})
+    if progress.get("node_count") != previous.get("node_count"):
+        events.append({"event": "nodes", **progress})
+    if progress.get("edge_count") != previous.get("edge_count"):
+        events.append({"event": "edges", **progress})
+    if terminal and progress["status"] != previous.get("status"):
+        event = "complete" if progress["status"] == "complete" else "error"
+        events.append({"event": event, **progress})
+    return events
+
+
+async def _relay(
+    graph_id: str, fetch: FetchProgress, previous: Optional[Row], poll_seconds: float
+):
+    try:
+        while broker.subscriber_count(graph_id):
+            progress = await fetch(graph_id)
+            if progress is not None:
+                for event in progress_events(previous, progress):
+                    broker.publish(graph_id, event)
+                previous = progress
+            await asyncio.sleep(poll_seconds)
+    except Exception as e:
+        print(f"[DEBUG] Status relay for graph {graph_id} stopped: {e}")
+    finally:
+        _relays.pop(graph_id, None)
+
+
+def ensure_relay(
+    graph_id: str,
+    fetch: FetchProgress,
+    snapshot: Optional[Row] = None,
+    poll_seconds: Optional[float] = None,
+):
+    """
+    Start the graph's relay unless one is running; it stops with its last listener.
+    Changes are published relative to `snapshot`, the status the listener has seen.
+    """
+    if graph_id not in _relays:
+        _relays[graph_id] = asyncio.create_task(
+            _relay(graph_id, fetch, snapshot, poll_seconds or RELAY_POLL_SECONDS)
+        )
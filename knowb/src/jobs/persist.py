@@ -0,0 +1,99 @@
+"""
+Saving a generated graph. Nodes and edges are staged in content_map_staging in
+batches of at most GRAPH_BATCH_SIZE rows (so no single request carries a whole large
+graph), then commit_graph swaps them in for the graph's old rows in one transaction:
+a graph is never left half-saved, whatever fails along the way.
+"""
+
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from src.api.models import ContentMapEdge, ContentMapNode
+from src.jobs.events import publish_graph_event
+from src.storage import Storage
+from src.storage.base import Row
+
+GRAPH_BATCH_SIZE = int(os.getenv("CONTENT_MAP_SAVE_BATCH_SIZE", "200"))
+
+
+@dataclass
+class GraphSaveResult:
+    nodes: int
+    edges: int
+    batches: int
+    seconds: float
+
+
+def node_rows(nodes: list[ContentMapNode]) -> list[Row]:
+    return [
+        {
+            "id": node.id,
+            "content": node.content,
+            "supporting_quotes": node.supporting_quotes,
+            "summary": node.summary,
+            "order_index": node.order_index,
+            "topo_level": node.topo_level,
+        }
+        for node in nodes
+    ]
+
+
+def level_rows(nodes: list[ContentMapNode]) -> list[Row]:
+    return [{"id": node.id, "topo_level": node.topo_level} for node in nodes]
+
+
+def edge_rows(edges: list[ContentMapEdge]) -> list[Row]:
+    return [{"parent_id": edge.parent_id, "child_id": edge.child_id} for edge in edges]
+
+
+async def stage_in_batches(
+    graph_id: str,
+    kind: str,
+    rows: list[Row],
+    storage: Storage,
+    batch_size: int = GRAPH_BATCH_SIZE,
+) -> int:
+    """Stage "nodes", "edges" or "levels" rows; returns the number of batches"""
+    for start in range(0, len(rows), batch_size):
+        await storage.stage_graph_rows(graph_id, kind, rows[start : start + batch_size])
+    return -(-len(rows) // batch_size)
+
+
+async def save_graph(
+    graph_id: str,
+    nodes: list[Row],
+    edges: list[Row],
+    storage: Storage,
+    batch_size: int = GRAPH_BATCH_SIZE,
+    staged_batches: int = 0,
+    levels: Optional[list[Row]] = None,
+) -> GraphSaveResult:
+    """
+    Stage the rows and commit everything staged for the graph (including
+    staged_batches batches staged earlier, e.g. while the output streamed in).
+    Pass level_rows() for nodes that were staged before their level was known.
+    """
+    start = time.perf_counter()
+    batches = staged_batches
+    batches += await stage_in_batches(graph_id, "nodes", nodes, storage, batch_size)
+    batches += await stage_in_batches(graph_id, "edges", edges, storage, batch_size)
+    if levels:
+        batches += await stage_in_batches(
+            graph_id, "levels", levels, storage, batch_size
+        )
+    counts = await storage.commit_graph(graph_id)
+    await storage.update_graph(
+        graph_id, {"node_count": counts["nodes"], "edge_count": counts["edges"]}
+    )
+    publish_graph_event(graph_id, "nodes", node_count=counts["nodes"])
+    publish_graph_event(graph_id, "edges", edge_count=counts["edges"])
+    result = GraphSaveResult(
+        counts["nodes"], counts["edges"], batches, time.perf_counter() - start
+    )
+    print(
+        f"[DEBUG] Saved graph {graph_id}: {result.nodes} nodes, {result.edges} edges "
+        f"in {result.batches} batches, {result.seconds * 1000:.0f}ms"
+    )
+    return result
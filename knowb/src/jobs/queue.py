@@ -0,0 +1,231 @@
+"""
+The content_map_jobs table is the queue for content map generation.
+
+Each knowledge graph that is being generated has one job row, which moves through
+
+    queued -> running -> complete
+                      -> queued (retry after a backoff) -> running -> ...
+                      -> failed
+
+Workers claim jobs with a compare-and-set update, so two workers never both win the
+same job, and keep heartbeat_at fresh while they work. A running job whose heartbeat
+goes stale (the worker crashed or was redeployed) is put back in the queue by
+whichever worker notices first. The knowledge_graphs row keeps the status the
+frontend already understands ("processing" until the job completes or fails for good).
+"""
+
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from src.jobs.events import publish_graph_event
+from src.storage import Storage
+from src.storage.base import Row
+from src.storage.schema import utc_now
+
+MAX_ATTEMPTS = int(os.getenv("CONTENT_MAP_MAX_ATTEMPTS", "3"))
+RETRY_BASE_SECONDS = float(os.getenv("CONTENT_MAP_RETRY_BASE_SECONDS", "30"))
+RETRY_MAX_SECONDS = float(os.getenv("CONTENT_MAP_RETRY_MAX_SECONDS", "600"))
+HEARTBEAT_SECONDS = float(os.getenv("CONTENT_MAP_HEARTBEAT_SECONDS", "15"))
+# a running job whose heartbeat is older than this is presumed abandoned
+STALE_AFTER_SECONDS = float(os.getenv("CONTENT_MAP_STALE_AFTER_SECONDS", "90"))
+
+
+def parse_timestamp(value: str) -> datetime:
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+
+def retry_delay(attempts: int, rng: random.Random = random) -> float:
+    """Exponential backoff with +-20% jitter, so failed jobs don't retry in lockstep"""
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0))
+    return delay * rng.uniform(0.8, 1.2)
+
+
+async def enqueue_content_map_job(
+    graph_id: str,
+    document_id: str,
+    user_id: str,
+    prompt_id: Optional[str],
+    storage: Storage,
+) -> Optional[Row]:
+    return await storage.insert_content_map_job(
+        {
+            "graph_id": graph_id,
+            "document_id": document_id,
+            "user_id": user_id,
+            "prompt_id": prompt_id,
+            "max_attempts": MAX_ATTEMPTS,
+        }
+    )
+
+
+async def claim_job(job: Row, worker_id: str, storage: Storage) -> Optional[Row]:
+    """Try to take a queued job; returns the running job, or None if we lost the race"""
+    now = utc_now()
+    rows = await storage.update_content_map_job(
+        job["id"],
+        {
+            "status": "running",
+            "stage": "starting",
+            "attempts": job["attempts"] + 1,
+            "locked_by": worker_id,
+            "heartbeat_at": now,
+            "updated_at": now,
+        },
+        expected={"status": "queued", "attempts": job["attempts"]},
+    )
+    return rows[0] if rows else None
+
+
+async def heartbeat(
+    job: Row, worker_id: str, storage: Storage, stage: Optional[str] = None
+) -> bool:
+    """Refresh the heartbeat (and optionally the stage); False if the job was taken away"""
+    now = utc_now()
+    values = {"heartbeat_at": now, "updated_at": now}
+    if stage:
+        values["stage"] = stage
+    rows = await storage.update_content_map_job(
+        job["id"], values, expected={"status": "running", "locked_by": worker_id}
+    )
+    if rows and stage:
+        publish_graph_event(job["graph_id"], "stage", status="processing", stage=stage)
+    return bool(rows)
+
+
+async def complete_job(job: Row, worker_id: str, storage: Storage) -> bool:
+    rows = await storage.update_content_map_job(
+        job["id"],
+        {
+            "status": "complete",
+            "stage": "complete",
+            "locked_by": None,
+            "error_message": None,
+            "updated_at": utc_now(),
+        },
+        expected={"status": "running", "locked_by": worker_id},
+    )
+    if rows:
+        await storage.update_graph(job["graph_id"], {"status": "complete"})
+        publish_graph_event(
+            job["graph_id"], "complete", status="complete", stage="complete"
+        )
+    return bool(rows)
+
+
+async def _release(
+    job: Row, expected: dict, error: str, retryable: bool, storage: Storage
+) -> Optional[str]:
+    """Requeue the job with a backoff, or fail it for good; returns the new status"""
+    now = datetime.now(timezone.utc)
+    if retryable and job["attempts"] < job["max_attempts"]:
+        values = {
+            "status": "queued",
+            "stage": "waiting_to_retry",
+            "run_after": (
+                now + timedelta(seconds=retry_delay(job["attempts"]))
+            ).isoformat(),
+        }
+    else:
+        values = {"status": "failed", "stage": "failed"}
+    values.update(
+        {"locked_by": None, "error_message": error, "updated_at": now.isoformat()}
+    )
+
+    rows = await storage.update_content_map_job(job["id"], values, expected=expected)
+    if not rows:
+        return None
+    if values["status"] == "failed":
+        await storage.update_graph(
+            job["graph_id"], {"status": "error", "error_message": error}
+        )
+        publish_graph_event(
+            job["graph_id"],
+            "error",
+            status="error",
+            stage="failed",
+            error_message=error,
+        )
+    else:
+        publish_graph_event(
+            job["graph_id"],
+            "retrying",
+            status="processing",
+            stage="waiting_to_retry",
+            error_message=error,
+        )
+    return values["status"]
+
+
+async def fail_job(
+    job: Row, worker_id: str, error: str, storage: Storage, retryable: bool = True
+) -> Optional[str]:
+    return await _release(
+        job,
+        {"status": "running", "locked_by": worker_id},
+        error,
+        retryable,
+        storage,
+    )
+
+
+async def requeue_job(job: Row, worker_id: str, storage: Storage) -> bool:
+    """Hand a job back without counting the attempt, e.g. when the worker shuts down"""
+    rows = await storage.update_content_map_job(
+        job["id"],
+        {
+            "status": "queued",
+            "stage": "queued",
+            "attempts": job["attempts"] - 1,
+            "run_after": utc_now(),
+            "locked_by": None,
+            "updated_at": utc_now(),
+        },
+        expected={"status": "running", "locked_by": worker_id},
+    )
+    return bool(rows)
+
+
+async def recover_stale_jobs(
+    running: list[Row], storage: Storage, now: Optional[datetime] = None
+) -> list[Row]:
+    """Requeue (or fail) running jobs whose worker stopped heartbeating"""
+    now = now or datetime.now(timezone.utc)
+    cutoff = now - timedelta(seconds=STALE_AFTER_SECONDS)
+    recovered = []
+    for job in running:
+        if job["heartbeat_at"] and parse_timestamp(job["heartbeat_at"]) > cutoff:
+            continue
+        status = await _release(
+            job,
+            # the attempts check stops us releasing a job someone has since re-claimed
+            {
+                "status": "running",
+                "locked_by": job["locked_by"],
+                "attempts": job["attempts"],
+            },
+            f"Worker {job['locked_by']} stopped responding",
+            True,
+            storage,
+        )
+        if status:
+            print(f"[DEBUG] Recovered stale content map job {job['id']} -> {status}")
+            recovered.append(job)
+    return recovered
+
+
+def job_progress(job: Row) -> dict:
+    """The small status payload of the status endpoint and event stream"""
+    return {
+        "graph_id": job["graph_id"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "attempts": job["attempts"],
+        "max_attempts": job["max_attempts"],
+        "error_message": job["error_message"],
+        "updated_at": job["updated_at"],
+    }
@@ -0,0 +1,237 @@
+"""
+Worker pool for content map jobs. Run it next to the web app:
+
+    python -m src.jobs.worker
+
+Any number of worker processes can share the queue. Each runs up to
+CONTENT_MAP_WORKER_CONCURRENCY jobs at once, and across all workers there are at most
+CONTENT_MAP_GLOBAL_LIMIT running jobs and CONTENT_MAP_PER_USER_LIMIT per user. The
+caps are checked against the running jobs just before claiming, so two workers
+claiming in the same instant can overshoot them by one each.
+"""
+
+import asyncio
+import os
+import signal
+import socket
+import traceback
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional
+
+from src.jobs.content_map import is_retryable, process_content_map_job
+from src.jobs.queue import (
+    HEARTBEAT_SECONDS,
+    claim_job,
+    complete_job,
+    fail_job,
+    heartbeat,
+    parse_timestamp,
+    recover_stale_jobs,
+    requeue_job,
+)
+from src.storage import Storage, get_storage
+from src.storage.base import Row
+
+WORKER_CONCURRENCY = int(os.getenv("CONTENT_MAP_WORKER_CONCURRENCY", "4"))
+GLOBAL_LIMIT = int(os.getenv("CONTENT_MAP_GLOBAL_LIMIT", "8"))
+PER_USER_LIMIT = int(os.getenv("CONTENT_MAP_PER_USER_LIMIT", "1"))
+POLL_SECONDS = float(os.getenv("CONTENT_MAP_POLL_SECONDS", "2"))
+# how many queued jobs one query fetches while a poll looks for runnable ones
+QUEUE_PAGE_SIZE = 50
+
+ProcessJob = Callable[[Row, Storage, Callable[[str], Awaitable[None]]], Awaitable]
+
+
+class ContentMapWorker:
+    def __init__(
+        self,
+        storage: Optional[Storage] = None,
+        concurrency: int = WORKER_CONCURRENCY,
+        global_limit: int = GLOBAL_LIMIT,
+        per_user_limit: int = PER_USER_LIMIT,
+        poll_seconds: float = POLL_SECONDS,
+        heartbeat_seconds: float = HEARTBEAT_SECONDS,
+        process: ProcessJob = process_content_map_job,
+        worker_id: Optional[str] = None,
+    ):
+        self.storage = storage or get_storage()
+        self.concurrency = concurrency
+        self.global_limit = global_limit
+        self.per_user_limit = per_user_limit
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.process = process
+        self.worker_id = worker_id or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self.tasks: dict[str, asyncio.Task] = {}
+        self.jobs: dict[str, Row] = {}
+        self.wakeup = asyncio.Event()
+        self.stopping = False
+
+    async def poll(self) -> int:
+        """Recover stale jobs, then claim as many runnable jobs as the caps allow"""
+        now = datetime.now(timezone.utc)
+        running = await self.storage.get_content_map_jobs("running")
+        recovered = {
+            job["id"] for job in await recover_stale_jobs(running, self.storage, now)
+        }
+        running = [job for job in running if job["id"] not in recovered]
+
+        free = self.concurrency - len(self.tasks)
+        if free <= 0 or len(running) >= self.global_limit:
+            return 0
+
+        per_user = Counter(job["user_id"] for job in running)
+        total = len(running)
+        claimed = 0
+        offset = 0
+        # page through the queue, so users at their cap can't starve everyone behind them
+        while free > 0 and total < self.global_limit:
+            page = await self.storage.get_content_map_jobs(
+                "queued", limit=QUEUE_PAGE_SIZE, offset=offset
+            )
+            offset += len(page)
+            for job in page:
+                if free == 0 or total >= self.global_limit:
+                    break
+                if parse_timestamp(job["run_after"]) > now:
+                    continue
+                if per_user[job["user_id"]] >= self.per_user_limit:
+                    continue
+                job = await claim_job(job, self.worker_id, self.storage)
+                if job is None:
+                    continue
+                # a claimed job leaves the queued list, so later pages shift back by one
+                offset -= 1
+                per_user[job["user_id"]] += 1
+                total += 1
+                free -= 1
+                claimed += 1
+                self._start(job)
+            if len(page) < QUEUE_PAGE_SIZE:
+                break
+        return claimed
+
+    def _start(self, job: Row):
+        task = asyncio.create_task(self._run(job))
+        self.tasks[job["id"]] = task
+        self.jobs[job["id"]] = job
+        # a done callback also fires for a task cancelled before it ever started running
+        task.add_done_callback(lambda _, job_id=job["id"]: self._finished(job_id))
+
+    def _finished(self, job_id: str):
+        self.tasks.pop(job_id, None)
+        self.jobs.pop(job_id, None)
+        self.wakeup.set()
+
+    async def _run(self, job: Row):
+        async def set_stage(stage: str):
+            await heartbeat(job, self.worker_id, self.storage, stage)
+
+        beat = asyncio.create_task(self._heartbeat(job, asyncio.current_task()))
+        try:
+            await self.process(job, self.storage, set_stage)
+            await complete_job(job, self.worker_id, self.storage)
+        except asyncio.CancelledError:
+            # either we are shutting down (stop() requeues the job) or another worker
+            # took the job over
+            pass
+        except Exception as e:
+            print(
+                f"[DEBUG] Content map job {job['id']} failed (attempt "
+                f"{job['attempts']}/{job['max_attempts']}): {e}\n{traceback.format_exc()}"
+            )
+            await fail_job(job, self.worker_id, str(e), self.storage, is_retryable(e))
+        finally:
+            beat.cancel()
+
+    async def _heartbeat(self, job: Row, task: asyncio.Task):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            if not await heartbeat(job, self.worker_id, self.storage):
+                print(f"[DEBUG] Lost content map job {job['id']}, abandoning it")
+                task.cancel()
+                return
+
+    async def run_forever(self):
+        print(f"[DEBUG] Content map worker {self.worker_id} started")
+        while not self.stopping:
+            try:
+                await self.poll()
+            except Exception as e:
+                print(f"[DEBUG] Content map worker poll failed: {e}")
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+    async def drain(self):
+        """Wait for the jobs this worker is running"""
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks.values()), return_exceptions=True)
+
+    async def stop(self):
+        """Stop polling; jobs still running go back in the queue"""
+        self.stopping = True
+        self.wakeup.set()
+        held = list(self.jobs.values())
+        for task in list(self.tasks.values()):
+            task.cancel()
+        await self.drain()
+        # only jobs we still hold are requeued; finished ones no longer match
+        for job in held:
+            await requeue_job(job, self.worker_id, self.storage)
+
+
+#
+# IN-PROCESS WORKER
+#
+# Set CONTENT_MAP_WORKER_IN_PROCESS=true to run a worker inside the web app (handy in
+# development, where a separate worker process is one more thing to start).
+
+_in_process_worker: Optional[ContentMapWorker] = None
+_in_process_task: Optional[asyncio.Task] = None
+
+
+def start_in_process_worker() -> ContentMapWorker:
+    global _in_process_worker, _in_process_task
+    _in_process_worker = ContentMapWorker()
+    _in_process_task = asyncio.create_task(_in_process_worker.run_forever())
+    return _in_process_worker
+
+
+async def stop_in_process_worker():
+    global _in_process_worker, _in_process_task
+    if _in_process_worker is not None:
+        await _in_process_worker.stop()
+        await _in_process_task
+    _in_process_worker = _in_process_task = None
+
+
+def in_process_worker_running() -> bool:
+    return _in_process_worker is not None
+
+
+def wake_workers():
+    """Poll now instead of at the next interval (only reaches an in-process worker)"""
+    if _in_process_worker is not None:
+        _in_process_worker.wakeup.set()
+
+
+async def serve():
+    worker = ContentMapWorker()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: asyncio.create_task(worker.stop()))
+    await worker.run_forever()
+    await worker.drain()
+
+
+def main():
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
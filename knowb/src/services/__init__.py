@@ -21,12 +21,22 @@ def get_supabase_client(access_token: str = None) -> Client:
     return client
 
 
-# Default admin client
-supabase = get_supabase_client()
+_admin_client: Client | None = None
+
+
+def __getattr__(name: str):
+    # Default admin client, created on first use so that importing the app doesn't
+    # need Supabase credentials (e.g. with STORAGE_BACKEND=memory)
+    global _admin_client
+    if name == "supabase":
+        if _admin_client is None:
+            _admin_client = get_supabase_client()
+        return _admin_client
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def verify_token(token: str) -> dict:
     try:
-        return supabase.auth.get_user(token)
+        return __getattr__("supabase").auth.get_user(token)
     except Exception as e:
         raise HTTPException(status_code=401, detail="Invalid token")
@@ -0,0 +1,20 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+# The supabase client is synchronous, so every query runs on this bounded pool
+# instead of on the event loop. The bound keeps a burst of requests from opening
+# an unbounded number of connections to the database.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+
+
+async def run_db(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking database call on the db thread pool and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(fn, *args, **kwargs))
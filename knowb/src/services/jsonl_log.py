@@ -0,0 +1,129 @@
+"""
+Append-only JSON lines files written off the request path: log() puts the entry on a
+queue, and a background thread (a logging QueueListener) serializes and writes it, so
+callers on the event loop never wait for the disk. Used for the LLM call log
+(src/api/ai/logging.py) and exported traces (src/services/tracing.py).
+
+A file rotates when it reaches max_bytes or gets rotate_seconds old, keeping `backups`
+old files. Entries may carry a "deferred" dict of key -> function; the functions are
+called on the writer thread and their results stored under their keys.
+"""
+
+import json
+import logging
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+MAX_BYTES = 50 * 1024 * 1024
+ROTATE_SECONDS = 24 * 60 * 60
+BACKUP_COUNT = 14
+# entries waiting to be written; beyond this they are dropped rather than block a caller
+QUEUE_SIZE = 10000
+
+
+class SizeAndTimeRotatingFileHandler(RotatingFileHandler):
+    """Rolls the file over when it would grow past max_bytes or is interval seconds old"""
+
+    def __init__(self, filename: str, max_bytes: int, interval: float, backups: int):
+        super().__init__(
+            filename,
+            maxBytes=max_bytes,
+            backupCount=backups,
+            encoding="utf-8",
+            delay=True,
+        )
+        self.interval = interval
+        self.rollover_at = time.time() + interval
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if time.time() >= self.rollover_at and os.path.exists(self.baseFilename):
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = time.time() + self.interval
+
+
+def resolve(record: logging.LogRecord) -> dict:
+    """The record's entry, with the parts deferred to the writer thread computed (once)"""
+    if not hasattr(record, "entry"):
+        entry = dict(record.msg)
+        for key, compute in entry.pop("deferred", {}).items():
+            try:
+                entry[key] = compute()
+            except Exception as e:
+                entry[key] = f"<unavailable: {e}>"
+        record.entry = entry
+    return record.entry
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        # the rotating handler formats a record twice (to check its size, then to write)
+        if not hasattr(record, "json_line"):
+            record.json_line = json.dumps(
+                resolve(record), default=str, ensure_ascii=False, separators=(",", ":")
+            )
+        return record.json_line
+
+
+class _RecordQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the default prepare() formats the record, on the calling thread
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+class JsonLinesLog:
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = MAX_BYTES,
+        rotate_seconds: float = ROTATE_SECONDS,
+        backups: int = BACKUP_COUNT,
+        console: Optional[logging.Formatter] = None,
+    ):
+        """console: also print each entry to stderr, formatted with this"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        file_handler = SizeAndTimeRotatingFileHandler(
+            path, max_bytes, rotate_seconds, backups
+        )
+        file_handler.setFormatter(JsonLinesFormatter())
+        handlers: list[logging.Handler] = [file_handler]
+        if console:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(console)
+            handlers.append(console_handler)
+
+        self.queue: queue.Queue = queue.Queue(QUEUE_SIZE)
+        self.handler = _RecordQueueHandler(self.queue)
+        self.listener = QueueListener(self.queue, *handlers)
+        self.listener.start()
+
+    def log(self, entry: dict):
+        record = logging.LogRecord(
+            "jsonl", logging.INFO, __file__, 0, entry, None, None
+        )
+        self.handler.handle(record)
+
+    def flush(self):
+        """Wait until everything logged so far is written"""
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.flush()
+        self.listener.start()
+
+    def close(self):
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
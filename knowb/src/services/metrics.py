@@ -0,0 +1,340 @@
+"""
+In-process metrics, served in the Prometheus text format at /metrics:
+
+    http_request_duration_seconds      per router, method and status (streaming
+                                       responses count until the stream ends)
+    db_query_duration_seconds          per table and operation (the _count series
+                                       counts the queries)
+    llm_time_to_first_token_seconds    per model, for streamed calls
+    llm_request_duration_seconds       per model
+    llm_output_tokens_per_second       per model, after the first token for streams
+    llm_tokens_total                   per model and kind (input, output,
+                                       cache_creation, cache_read)
+    llm_cost_usd_total                 per model (see src/api/ai/usage.py for prices)
+    sse_active_streams                 per stream (chat, content_map_events)
+    chat_turns_cancelled_total         per stage (reply, tool_result) the chat turn
+                                       was in when its client went away
+
+Recording a value is a dict lookup and a few additions under a lock, so this stays
+on in production. Values are per process: with several workers, scrape each one.
+"""
+
+import time
+from bisect import bisect_left
+from threading import Lock
+from typing import Any, AsyncIterator, Callable, Optional
+
+# seconds; from fast queries to a long content map call
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+TOKEN_RATE_BUCKETS = (5, 10, 20, 35, 50, 75, 100, 150, 200, 300)
+
+_registry: list["Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], **extra) -> str:
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(v))}"' for name, v in pairs) + "}"
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple[str, ...], Any] = {}
+        self._lock = Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return "\n".join(
+            [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+            + self.samples()
+        )
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_number(value)}"
+            for key, value in values
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        # the first bucket whose upper bound (le) is >= value; len(buckets) is +Inf
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._values.get(self._key(labels))
+        return series[2] if series else 0
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = [
+                (key, list(counts), total, count)
+                for key, (counts, total, count) in self._values.items()
+            ]
+        lines = []
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, key, le=_format_number(bound))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+#
+# METRICS
+#
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency",
+    ("router", "method", "status"),
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Database and storage call latency",
+    ("table", "operation"),
+)
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds",
+    "Time until a streamed LLM call produced its first token",
+    ("model",),
+)
+LLM_REQUEST_DURATION = Histogram(
+    "llm_request_duration_seconds", "LLM call latency", ("model",)
+)
+LLM_OUTPUT_TOKENS_PER_SECOND = Histogram(
+    "llm_output_tokens_per_second",
+    "LLM output speed",
+    ("model",),
+    buckets=TOKEN_RATE_BUCKETS,
+)
+LLM_TOKENS = Counter("llm_tokens_total", "LLM tokens by kind", ("model", "kind"))
+LLM_COST = Counter("llm_cost_usd_total", "Estimated LLM spend in USD", ("model",))
+SSE_ACTIVE_STREAMS = Gauge(
+    "sse_active_streams", "Server-sent event streams open now", ("stream",)
+)
+CHAT_TURNS_CANCELLED = Counter(
+    "chat_turns_cancelled_total",
+    "Chat turns stopped because the client disconnected",
+    ("stage",),
+)
+TTS_CACHE_LOOKUPS = Counter(
+    "tts_cache_lookups_total",
+    "TTS audio cache lookups by the tier that answered (memory, disk or miss)",
+    ("tier",),
+)
+TTS_CACHE_BYTES = Gauge("tts_cache_bytes", "TTS audio cached, by tier", ("tier",))
+
+
+#
+# HELPERS
+#
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request, labelled by the router it hit"""
+
+    def __init__(self, app, routers: dict[str, str]):
+        self.app = app
+        # longest prefix first, so nested prefixes resolve to the most specific router
+        self.routers = sorted(routers.items(), key=lambda item: -len(item[0]))
+
+    def router_for(self, path: str) -> str:
+        for prefix, name in self.routers:
+            if path == prefix or path.startswith(prefix.rstrip("/") + "/"):
+                return name
+        return "other"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_DURATION.observe(
+                time.perf_counter() - started,
+                router=self.router_for(scope["path"]),
+                method=scope["method"],
+                status=status,
+            )
+
+
+def timed_db_call(fn: Callable, table: str, operation: str) -> Callable:
+    """fn, recording how long each call takes (where it runs, after any pool wait)"""
+
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            DB_QUERY_DURATION.observe(
+                time.perf_counter() - started, table=table, operation=operation
+            )
+
+    return timed
+
+
+async def track_stream(stream: str, events: AsyncIterator) -> AsyncIterator:
+    """Wrap a streaming response body, counting it in sse_active_streams while open"""
+    SSE_ACTIVE_STREAMS.inc(stream=stream)
+    try:
+        async for event in events:
+            yield event
+    finally:
+        SSE_ACTIVE_STREAMS.dec(stream=stream)
+
+
+class LLMCallTimer:
+    """
+    Times one LLM call; call first_token() as a stream starts, then finish(usage), or
+    fail(error). Either also records the call in the LLM call log (src/api/ai/logging.py),
+    with request (the call's arguments) when given.
+    """
+
+    def __init__(self, model: str, request: Optional[dict] = None):
+        self.model = model
+        self.request = request
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.finished = False
+
+    def first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            LLM_TIME_TO_FIRST_TOKEN.observe(
+                self.first_token_at - self.started, model=self.model
+            )
+
+    def finish(self, usage: Any, response: Any = None):
+        # imported here: src.api.ai depends on this module, not the other way around
+        from src.api.ai.logging import log_call
+        from src.api.ai.usage import usage_cost
+
+        self.finished = True
+        finished = time.perf_counter()
+        LLM_REQUEST_DURATION.observe(finished - self.started, model=self.model)
+        generating = finished - (self.first_token_at or self.started)
+        output_tokens = getattr(usage, "output_tokens", 0) or 0
+        if output_tokens and generating > 0:
+            LLM_OUTPUT_TOKENS_PER_SECOND.observe(
+                output_tokens / generating, model=self.model
+            )
+        for kind in ("input", "output", "cache_creation_input", "cache_read_input"):
+            tokens = getattr(usage, f"{kind}_tokens", 0) or 0
+            if tokens:
+                LLM_TOKENS.inc(
+                    tokens, model=self.model, kind=kind.removesuffix("_input")
+                )
+        LLM_COST.inc(usage_cost(self.model, usage), model=self.model)
+        log_call(self.model, self.started, self.request, response, usage)
+
+    def fail(self, error: Exception):
+        from src.api.ai.logging import log_call
+
+        self.finished = True
+        log_call(self.model, self.started, self.request, error=error)
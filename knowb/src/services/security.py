@@ -1,18 +1,22 @@
 from fastapi.security import HTTPBearer
 from fastapi import HTTPException
 from src.services import get_supabase_client
+from src.services.db import run_db
 
 security = HTTPBearer()
 
 
-def get_user_id_from_token(token: str) -> str:
+def _get_user(token):
+    # Get Supabase client with the token
+    client = get_supabase_client(token)
+    return client.auth.get_user(token.credentials)
+
+
+async def get_user_id_from_token(token: str) -> str:
     """Extract user_id from a Supabase JWT token using the Supabase client."""
     try:
-        # Get Supabase client with the token
-        client = get_supabase_client(token)
-
-        # Get user data from Supabase
-        user = client.auth.get_user(token.credentials)
+        # Get user data from Supabase (an HTTP call, so keep it off the event loop)
+        user = await run_db(_get_user, token)
 
         if not user or not user.user.id:
             raise HTTPException(
@@ -0,0 +1,257 @@
+"""
+Lightweight tracing for a request's pipeline (e.g. one chat turn). start_trace opens
+the root span; span and @traced open nested spans under whatever span is current, and
+do nothing outside a trace. The current trace and span live in context variables, so
+they follow the request through awaits and into tasks started with asyncio.gather.
+
+A finished trace is exported as one JSON line to logs/traces.jsonl (TRACE_EXPORTER=file,
+the default) or as an indented tree on stdout (console) when it took longer than
+SLOW_TRACE_SECONDS, and for a TRACE_SAMPLE_RATE share of the rest. The file is written
+and rotated by a background thread (src/services/jsonl_log.py), so exporting a trace
+doesn't hold up the event loop:
+
+    {"trace_id", "name", "duration_ms", "spans": [{"name", "span_id", "parent_id",
+     "start_ms", "duration_ms", "attributes", "error"}, ...]}
+"""
+
+import atexit
+import functools
+import os
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Any, Iterator, Optional
+
+from src.services.jsonl_log import JsonLinesLog
+
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "file")  # file | console | none
+TRACE_FILE = os.path.join(os.getenv("TRACE_DIR", "logs"), "traces.jsonl")
+SLOW_TRACE_SECONDS = float(os.getenv("SLOW_TRACE_SECONDS", "15"))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    started: float
+    attributes: dict[str, Any] = field(default_factory=dict)
+    duration: Optional[float] = None
+    error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+@dataclass
+class Trace:
+    name: str
+    trace_id: str
+    started: float
+    ts: str
+    spans: list[Span] = field(default_factory=list)
+    root: Optional[Span] = None
+    _lock: Lock = field(default_factory=Lock, repr=False)
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> dict:
+        root = self.root
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "ts": self.ts,
+            "duration_ms": round(root.duration * 1000, 2),
+            "spans": [
+                {
+                    "name": span.name,
+                    "span_id": span.span_id,
+                    "parent_id": span.parent_id,
+                    "start_ms": round((span.started - self.started) * 1000, 2),
+                    "duration_ms": round(span.duration * 1000, 2),
+                    "attributes": span.attributes,
+                    "error": span.error,
+                }
+                for span in sorted(self.spans, key=lambda span: span.started)
+            ],
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("span", default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+
+#
+# EXPORT
+#
+
+# TRACE_FILE -> its writer, started with the first trace exported to it
+_trace_logs: dict[str, JsonLinesLog] = {}
+_trace_logs_lock = Lock()
+
+
+def _trace_log() -> JsonLinesLog:
+    with _trace_logs_lock:
+        log = _trace_logs.get(TRACE_FILE)
+        if log is None:
+            log = _trace_logs[TRACE_FILE] = JsonLinesLog(TRACE_FILE)
+            atexit.register(log.close)
+        return log
+
+
+def flush():
+    """Wait until the traces exported so far are written"""
+    for log in list(_trace_logs.values()):
+        log.flush()
+
+
+def format_tree(trace: dict) -> str:
+    children: dict[Optional[str], list[dict]] = {}
+    for span in trace["spans"]:
+        children.setdefault(span["parent_id"], []).append(span)
+
+    lines = [f"[TRACE] {trace['name']} {trace['trace_id']} {trace['duration_ms']}ms"]
+
+    def walk(parent_id: Optional[str], depth: int):
+        for span in children.get(parent_id, []):
+            attributes = " ".join(f"{k}={v}" for k, v in span["attributes"].items())
+            error = f" ERROR {span['error']}" if span["error"] else ""
+            lines.append(
+                f"{'  ' * depth}{span['name']} +{span['start_ms']}ms "
+                f"{span['duration_ms']}ms {attributes}{error}".rstrip()
+            )
+            walk(span["span_id"], depth + 1)
+
+    walk(None, 1)
+    return "\n".join(lines)
+
+
+def export(trace: Trace):
+    if TRACE_EXPORTER == "none":
+        return
+    data = trace.to_dict()
+    if TRACE_EXPORTER == "console":
+        print(format_tree(data))
+        return
+    _trace_log().log(data)
+
+
+def _should_export(trace: Trace, slow_seconds: float) -> bool:
+    root = trace.root
+    return (
+        root.duration >= slow_seconds
+        or root.error is not None
+        or random.random() < TRACE_SAMPLE_RATE
+    )
+
+
+#
+# SPANS
+#
+
+
+def _reset(var: ContextVar, token):
+    try:
+        var.reset(token)
+    except ValueError:
+        # an async generator closed from another context (the client went away)
+        pass
+
+
+@contextmanager
+def _open_span(trace: Trace, name: str, attributes: dict) -> Iterator[Span]:
+    parent = _current_span.get()
+    span = Span(
+        name=name,
+        span_id=uuid.uuid4().hex[:16],
+        parent_id=parent.span_id if parent else None,
+        started=time.perf_counter(),
+        attributes=attributes,
+    )
+    token = _current_span.set(span)
+    try:
+        yield span
+    except GeneratorExit:
+        span.error = "cancelled"
+        raise
+    except BaseException as e:
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        span.duration = time.perf_counter() - span.started
+        trace.add(span)
+        _reset(_current_span, token)
+
+
+@contextmanager
+def start_trace(
+    name: str, slow_seconds: Optional[float] = None, **attributes
+) -> Iterator[Span]:
+    """
+    Open a trace's root span (or, inside a trace already, an ordinary span). The trace
+    is exported when it ends, if it is slow (see the module docstring).
+    """
+    if _current_trace.get() is not None:
+        with span(name, **attributes) as current:
+            yield current
+        return
+
+    trace = Trace(
+        name=name,
+        trace_id=uuid.uuid4().hex,
+        started=time.perf_counter(),
+        ts=datetime.now(timezone.utc).isoformat(),
+    )
+    token = _current_trace.set(trace)
+    try:
+        with _open_span(trace, name, attributes) as root:
+            trace.root = root
+            yield root
+    finally:
+        _reset(_current_trace, token)
+        threshold = SLOW_TRACE_SECONDS if slow_seconds is None else slow_seconds
+        if _should_export(trace, threshold):
+            try:
+                export(trace)
+            except Exception as e:
+                print(f"[DEBUG] Could not export trace {trace.trace_id}: {e}")
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """A span under the current one; outside a trace this records nothing (yields None)"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    with _open_span(trace, name, attributes) as current:
+        yield current
+
+
+def traced(name: Optional[str] = None):
+    """Decorator: run an async function in a span named after it"""
+
+    def decorator(func):
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(span_name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
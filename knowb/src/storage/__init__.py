@@ -0,0 +1,50 @@
+import os
+
+from src.services import get_supabase_client
+from src.storage.base import Storage
+from src.storage.memory_storage import MemoryStorage
+from src.storage.sqlite_storage import SQLiteStorage
+from src.storage.supabase_storage import SupabaseStorage
+
+# Which backend get_storage() hands out: "supabase" (default), "memory" or "sqlite".
+# The local backends need no network, for tests, benchmarks and load tests.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
+SQLITE_PATH = os.getenv("STORAGE_SQLITE_PATH", ":memory:")
+
+_local_storage: Storage | None = None
+
+
+def get_storage(access_token: str = None) -> Storage:
+    """Get the async data-access layer - either admin or user-context"""
+    global _local_storage
+
+    if _local_storage is not None:
+        return _local_storage
+
+    if STORAGE_BACKEND == "supabase":
+        return SupabaseStorage(get_supabase_client(access_token))
+
+    # local backends hold their data in the process, so there is only ever one
+    if STORAGE_BACKEND == "memory":
+        _local_storage = MemoryStorage()
+    elif STORAGE_BACKEND == "sqlite":
+        _local_storage = SQLiteStorage(SQLITE_PATH)
+    else:
+        raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return _local_storage
+
+
+def set_storage(storage: Storage | None):
+    """Make get_storage() return this instance (None resets it), e.g. for a benchmark"""
+    global _local_storage
+    _local_storage = storage
+
+
+__all__ = [
+    "Storage",
+    "SupabaseStorage",
+    "MemoryStorage",
+    "SQLiteStorage",
+    "get_storage",
+    "set_storage",
+]
@@ -0,0 +1,324 @@
+from typing import Any, Callable, Optional, TypeVar
+
+from src.services.db import run_db
+from src.services.metrics import timed_db_call
+from src.services.tracing import span
+
+# see .cursorrules for the schema
+
+Row = dict[str, Any]
+Filters = dict[str, Any]
+T = TypeVar("T")
+
+
+class Storage:
+    """
+    Async data access for every table the backend touches.
+
+    Backends implement the blocking query primitives below; the table-level methods
+    are shared, so call sites never see which backend they are talking to. Filters
+    are equality filters; a value of None means "IS NULL".
+    """
+
+    #
+    # QUERY PRIMITIVES (implemented by each backend)
+    #
+
+    def _select(
+        self,
+        table: str,
+        filters: Optional[Filters] = None,
+        columns: str = "*",
+        order_by: Optional[str] = None,
+        desc: bool = False,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> list[Row]:
+        raise NotImplementedError
+
+    def _insert(self, table: str, rows: Row | list[Row]) -> list[Row]:
+        raise NotImplementedError
+
+    def _update(self, table: str, values: Row, filters: Filters) -> list[Row]:
+        raise NotImplementedError
+
+    def _delete(self, table: str, filters: Filters) -> list[Row]:
+        raise NotImplementedError
+
+    def _download(self, bucket: str, path: str) -> bytes:
+        raise NotImplementedError
+
+    def _upload(self, bucket: str, path: str, data: bytes) -> None:
+        raise NotImplementedError
+
+    def _commit_graph(self, graph_id: str) -> Row:
+        """
+        In one transaction, replace the graph's nodes and edges with the rows staged in
+        content_map_staging and clear them; returns {"nodes": count, "edges": count}.
+        Staged "levels" rows ({"id", "topo_level"}) set the topo_level of staged nodes.
+        """
+        raise NotImplementedError
+
+    async def _run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run a primitive; blocking backends go through the db thread pool."""
+        operation = fn.__name__.lstrip("_")
+        # every primitive but commit_graph takes the table (or bucket) first
+        table = "commit_content_map" if operation == "commit_graph" else args[0]
+        with span(f"db.{operation}", table=table):
+            return await run_db(timed_db_call(fn, table, operation), *args, **kwargs)
+
+    async def _first(self, table: str, filters: Filters, **kwargs) -> Optional[Row]:
+        rows = await self._run(self._select, table, filters, limit=1, **kwargs)
+        return rows[0] if rows else None
+
+    #
+    # DOCUMENTS
+    #
+
+    async def get_document(self, document_id: str) -> Optional[Row]:
+        return await self._first("documents", {"id": document_id})
+
+    async def insert_document(self, document: Row) -> Optional[Row]:
+        rows = await self._run(self._insert, "documents", document)
+        return rows[0] if rows else None
+
+    async def update_document(self, document_id: str, values: Row) -> list[Row]:
+        return await self._run(self._update, "documents", values, {"id": document_id})
+
+    async def download_document(self, storage_path: str) -> bytes:
+        return await self._run(self._download, "documents", storage_path)
+
+    async def upload_document(self, storage_path: str, data: bytes) -> None:
+        await self._run(self._upload, "documents", storage_path, data)
+
+    #
+    # CHAT SESSIONS & MESSAGES
+    #
+
+    async def get_chat_session(self, session_id: str) -> Optional[Row]:
+        return await self._first("chat_sessions", {"id": session_id})
+
+    async def insert_chat_session(self, session: Row) -> Optional[Row]:
+        rows = await self._run(self._insert, "chat_sessions", session)
+        return rows[0] if rows else None
+
+    async def get_chat_messages(self, session_id: str) -> list[Row]:
+        return await self._run(
+            self._select,
+            "chat_messages",
+            {"session_id": session_id},
+            order_by="created_at",
+        )
+
+    async def insert_chat_message(self, message: Row) -> Optional[Row]:
+        rows = await self._run(self._insert, "chat_messages", message)
+        return rows[0] if rows else None
+
+    async def update_chat_message(self, message_id: str, values: Row) -> list[Row]:
+        return await self._run(
+            self._update, "chat_messages", values, {"id": message_id}
+        )
+
+    #
+    # KNOWLEDGE GRAPHS
+    #
+
+    async def get_graph(self, graph_id: str) -> Optional[Row]:
+        return await self._first("knowledge_graphs", {"id": graph_id})
+
+    async def get_latest_graph_for_document(self, document_id: str) -> Optional[Row]:
+        return await self._first(
+            "knowledge_graphs",
+            {"document_id": document_id},
+            order_by="created_at",
+            desc=True,
+        )
+
+    async def insert_graph(self, graph: Row) -> Optional[Row]:
+        rows = await self._run(self._insert, "knowledge_graphs", graph)
+        return rows[0] if rows else None
+
+    async def update_graph(self, graph_id: str, values: Row) -> list[Row]:
+        return await self._run(
+            self._update, "knowledge_graphs", values, {"id": graph_id}
+        )
+
+    async def delete_graph(self, graph_id: str) -> list[Row]:
+        return await self._run(self._delete, "knowledge_graphs", {"id": graph_id})
+
+    async def get_nodes(self, graph_id: str) -> list[Row]:
+        return await self._run(self._select, "graph_nodes", {"graph_id": graph_id})
+
+    async def get_node_by_order_index(
+        self, graph_id: str, order_index: int
+    ) -> Optional[Row]:
+        return await self._first(
+            "graph_nodes", {"graph_id": graph_id, "order_index": order_index}
+        )
+
+    async def insert_nodes(self, nodes: list[Row]) -> list[Row]:
+        return await self._run(self._insert, "graph_nodes", nodes)
+
+    async def get_edges(self, graph_id: str) -> list[Row]:
+        return await self._run(self._select, "graph_edges", {"graph_id": graph_id})
+
+    async def insert_edges(self, edges: list[Row]) -> list[Row]:
+        return await self._run(self._insert, "graph_edges", edges)
+
+    async def delete_nodes(self, graph_id: str) -> list[Row]:
+        return await self._run(self._delete, "graph_nodes", {"graph_id": graph_id})
+
+    async def delete_edges(self, graph_id: str) -> list[Row]:
+        return await self._run(self._delete, "graph_edges", {"graph_id": graph_id})
+
+    async def stage_graph_rows(self, graph_id: str, kind: str, rows: list[Row]):
+        """Stage a batch of "nodes", "edges" or "levels" rows for commit_graph"""
+        await self._run(
+            self._insert,
+            "content_map_staging",
+            {"graph_id": graph_id, "kind": kind, "rows": rows},
+        )
+
+    async def commit_graph(self, graph_id: str) -> Row:
+        return await self._run(self._commit_graph, graph_id)
+
+    async def discard_staged_graph(self, graph_id: str) -> list[Row]:
+        return await self._run(
+            self._delete, "content_map_staging", {"graph_id": graph_id}
+        )
+
+    #
+    # CONTENT MAP JOBS
+    #
+
+    async def insert_content_map_job(self, job: Row) -> Optional[Row]:
+        rows = await self._run(self._insert, "content_map_jobs", job)
+        return rows[0] if rows else None
+
+    async def get_content_map_job(self, graph_id: str) -> Optional[Row]:
+        return await self._first("content_map_jobs", {"graph_id": graph_id})
+
+    async def get_content_map_jobs(
+        self, status: str, limit: Optional[int] = None, offset: int = 0
+    ) -> list[Row]:
+        return await self._run(
+            self._select,
+            "content_map_jobs",
+            {"status": status},
+            order_by="created_at",
+            limit=limit,
+            offset=offset,
+        )
+
+    async def update_content_map_job(
+        self, job_id: str, values: Row, expected: Optional[Filters] = None
+    ) -> list[Row]:
+        """
+        Compare-and-set: only updates the job if its columns still match `expected`,
+        so an empty result means another worker got there first.
+        """
+        return await self._run(
+            self._update,
+            "content_map_jobs",
+            values,
+            {"id": job_id, **(expected or {})},
+        )
+
+    #
+    # CONTENT MAP CACHE
+    #
+
+    async def get_content_map_cache_entries(self, cache_key: str) -> list[Row]:
+        """Entries for a key, oldest first (concurrent inserts can leave more than one)"""
+        return await self._run(
+            self._select,
+            "content_map_cache",
+            {"cache_key": cache_key},
+            order_by="created_at",
+        )
+
+    async def insert_content_map_cache_entry(self, entry: Row) -> Optional[Row]:
+        rows = await self._run(self._insert, "content_map_cache", entry)
+        return rows[0] if rows else None
+
+    async def update_content_map_cache_entry(
+        self, entry_id: str, values: Row, expected: Optional[Filters] = None
+    ) -> list[Row]:
+        """Compare-and-set, like update_content_map_job"""
+        return await self._run(
+            self._update,
+            "content_map_cache",
+            values,
+            {"id": entry_id, **(expected or {})},
+        )
+
+    async def delete_content_map_cache_entry(self, entry_id: str) -> list[Row]:
+        return await self._run(self._delete, "content_map_cache", {"id": entry_id})
+
+    #
+    # DOCUMENT PASSAGES
+    #
+
+    async def get_document_passages(self, document_id: str) -> Optional[Row]:
+        return await self._first("document_passages", {"document_id": document_id})
+
+    async def insert_document_passages(self, row: Row) -> Optional[Row]:
+        rows = await self._run(self._insert, "document_passages", row)
+        return rows[0] if rows else None
+
+    async def delete_document_passages(self, document_id: str) -> list[Row]:
+        return await self._run(
+            self._delete, "document_passages", {"document_id": document_id}
+        )
+
+    #
+    # LEARNING PROGRESS
+    #
+
+    async def get_learning_progress_for_graph(self, graph_id: str) -> list[Row]:
+        return await self._run(
+            self._select, "learning_progress", {"graph_id": graph_id}
+        )
+
+    async def get_learning_progress_for_node(self, node_id: str) -> Optional[Row]:
+        return await self._first("learning_progress", {"node_id": node_id})
+
+    async def insert_learning_progress(self, progress: Row) -> Optional[Row]:
+        rows = await self._run(self._insert, "learning_progress", progress)
+        return rows[0] if rows else None
+
+    async def update_learning_progress(
+        self, progress_id: str, values: Row
+    ) -> list[Row]:
+        return await self._run(
+            self._update, "learning_progress", values, {"id": progress_id}
+        )
+
+    async def delete_learning_progress(self, node_id: str) -> list[Row]:
+        return await self._run(self._delete, "learning_progress", {"node_id": node_id})
+
+    async def insert_learning_progress_update(self, update: Row) -> Optional[Row]:
+        rows = await self._run(self._insert, "learning_progress_updates", update)
+        return rows[0] if rows else None
+
+    async def delete_learning_progress_updates(
+        self, learning_progress_id: str
+    ) -> list[Row]:
+        return await self._run(
+            self._delete,
+            "learning_progress_updates",
+            {"learning_progress_id": learning_progress_id},
+        )
+
+    #
+    # PROMPTS & USER SETTINGS
+    #
+
+    async def get_user_settings(self, user_id: str) -> Optional[Row]:
+        return await self._first("user_settings", {"user_id": user_id})
+
+    async def get_prompt(self, prompt_id: str) -> Optional[Row]:
+        return await self._first("prompts", {"id": prompt_id})
+
+    async def get_default_prompt(self) -> Optional[Row]:
+        return await self._first("prompts", {"user_id": None})
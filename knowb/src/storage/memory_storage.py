@@ -0,0 +1,105 @@
+import copy
+from collections import defaultdict
+from typing import Any, Callable, Optional, TypeVar
+
+from src.storage.base import Filters, Row, Storage
+from src.storage.schema import CASCADES, TABLES, apply_staged_levels, with_defaults
+
+T = TypeVar("T")
+
+
+class MemoryStorage(Storage):
+    """
+    Storage that keeps every table in process memory.
+
+    Meant for tests, benchmarks and load tests: there is no network or disk I/O, so
+    primitives run directly on the event loop instead of on the db thread pool.
+    """
+
+    def __init__(self):
+        self.tables: dict[str, list[Row]] = {table: [] for table in TABLES}
+        self.files: dict[str, dict[str, bytes]] = defaultdict(dict)
+
+    async def _run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        return fn(*args, **kwargs)
+
+    def _matching(self, table: str, filters: Optional[Filters]) -> list[Row]:
+        filters = filters or {}
+        return [
+            row
+            for row in self.tables[table]
+            if all(row.get(column) == value for column, value in filters.items())
+        ]
+
+    def _select(
+        self,
+        table: str,
+        filters: Optional[Filters] = None,
+        columns: str = "*",
+        order_by: Optional[str] = None,
+        desc: bool = False,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> list[Row]:
+        rows = self._matching(table, filters)
+        if order_by:
+            rows = sorted(rows, key=lambda row: row[order_by], reverse=desc)
+        if offset or limit is not None:
+            rows = rows[offset : None if limit is None else offset + limit]
+        if columns != "*":
+            wanted = [column.strip() for column in columns.split(",")]
+            return [{column: row[column] for column in wanted} for row in rows]
+        return [dict(row) for row in rows]
+
+    def _insert(self, table: str, rows: Row | list[Row]) -> list[Row]:
+        rows = rows if isinstance(rows, list) else [rows]
+        inserted = [with_defaults(table, copy.deepcopy(row)) for row in rows]
+        self.tables[table].extend(inserted)
+        return [dict(row) for row in inserted]
+
+    def _update(self, table: str, values: Row, filters: Filters) -> list[Row]:
+        rows = self._matching(table, filters)
+        for row in rows:
+            row.update(copy.deepcopy(values))
+        return [dict(row) for row in rows]
+
+    def _delete(self, table: str, filters: Filters) -> list[Row]:
+        deleted = self._matching(table, filters)
+        deleted_ids = {id(row) for row in deleted}
+        self.tables[table] = [
+            row for row in self.tables[table] if id(row) not in deleted_ids
+        ]
+        for child_table, column in CASCADES.get(table, []):
+            for row in deleted:
+                self._delete(child_table, {column: row["id"]})
+        return deleted
+
+    def _commit_graph(self, graph_id: str) -> Row:
+        # nothing else runs while this does, so building the new rows before touching
+        # the tables is all the atomicity it needs
+        staged = self._matching("content_map_staging", {"graph_id": graph_id})
+        new_rows = {
+            kind: [
+                with_defaults(table, {**copy.deepcopy(row), "graph_id": graph_id})
+                for batch in staged
+                if batch["kind"] == kind
+                for row in batch["rows"]
+            ]
+            for kind, table in (("nodes", "graph_nodes"), ("edges", "graph_edges"))
+        }
+        apply_staged_levels(new_rows["nodes"], staged)
+        self._delete("graph_edges", {"graph_id": graph_id})
+        self._delete("graph_nodes", {"graph_id": graph_id})
+        self.tables["graph_nodes"].extend(new_rows["nodes"])
+        self.tables["graph_edges"].extend(new_rows["edges"])
+        self._delete("content_map_staging", {"graph_id": graph_id})
+        return {"nodes": len(new_rows["nodes"]), "edges": len(new_rows["edges"])}
+
+    def _download(self, bucket: str, path: str) -> bytes:
+        try:
+            return self.files[bucket][path]
+        except KeyError:
+            raise FileNotFoundError(f"{bucket}/{path} not found")
+
+    def _upload(self, bucket: str, path: str, data: bytes) -> None:
+        self.files[bucket][path] = data
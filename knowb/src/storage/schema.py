@@ -0,0 +1,217 @@
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Literal
+
+# Mirror of the tables in .cursorrules, used by the local (memory / sqlite) backends.
+# Supabase owns the real schema; keep this in sync when a migration changes it.
+
+ColumnKind = Literal["text", "integer", "float", "boolean", "timestamp", "json"]
+
+TABLES: dict[str, dict[str, ColumnKind]] = {
+    "user_settings": {
+        "user_id": "text",
+        "current_prompt_id": "text",
+        "created_at": "timestamp",
+        "updated_at": "timestamp",
+    },
+    "documents": {
+        "id": "text",
+        "user_id": "text",
+        "title": "text",
+        "file_size": "integer",
+        "storage_path": "text",
+        "content_hash": "text",
+        "created_at": "timestamp",
+    },
+    "knowledge_graphs": {
+        "id": "text",
+        "document_id": "text",
+        "status": "text",
+        "error_message": "text",
+        "prompt_id": "text",
+        "node_count": "integer",
+        "edge_count": "integer",
+        "created_at": "timestamp",
+    },
+    "prompts": {
+        "id": "text",
+        "user_id": "text",
+        "name": "text",
+        "prompt_type": "text",
+        "prompt_texts": "json",
+        "is_active": "boolean",
+        "created_at": "timestamp",
+        "updated_at": "timestamp",
+    },
+    "graph_nodes": {
+        "id": "text",
+        "graph_id": "text",
+        "content": "text",
+        "supporting_quotes": "json",
+        "summary": "text",
+        "order_index": "integer",
+        "topo_level": "integer",
+        "created_at": "timestamp",
+    },
+    "graph_edges": {
+        "parent_id": "text",
+        "child_id": "text",
+        "graph_id": "text",
+        "created_at": "timestamp",
+    },
+    "learning_progress": {
+        "id": "text",
+        "user_id": "text",
+        "node_id": "text",
+        "graph_id": "text",
+        "version": "integer",
+        "spaced_rep_state": "json",
+        "created_at": "timestamp",
+    },
+    "chat_sessions": {
+        "id": "text",
+        "user_id": "text",
+        "document_id": "text",
+        "created_at": "timestamp",
+    },
+    "chat_messages": {
+        "id": "text",
+        "session_id": "text",
+        "is_ai": "boolean",
+        "content": "json",
+        "interrupted": "boolean",
+        "created_at": "timestamp",
+    },
+    "learning_progress_updates": {
+        "id": "text",
+        "message_id": "text",
+        "learning_progress_id": "text",
+        "learning_progress_version": "integer",
+        "update_data": "json",
+        "created_at": "timestamp",
+    },
+    "content_map_jobs": {
+        "id": "text",
+        "graph_id": "text",
+        "document_id": "text",
+        "user_id": "text",
+        "prompt_id": "text",
+        "status": "text",
+        "stage": "text",
+        "attempts": "integer",
+        "max_attempts": "integer",
+        "run_after": "timestamp",
+        "locked_by": "text",
+        "heartbeat_at": "timestamp",
+        "error_message": "text",
+        "created_at": "timestamp",
+        "updated_at": "timestamp",
+    },
+    "content_map_staging": {
+        "id": "text",
+        "graph_id": "text",
+        "kind": "text",
+        "rows": "json",
+        "created_at": "timestamp",
+    },
+    "document_passages": {
+        "id": "text",
+        "document_id": "text",
+        "content_hash": "text",
+        "passage_index": "json",
+        "created_at": "timestamp",
+    },
+    "content_map_cache": {
+        "id": "text",
+        "cache_key": "text",
+        "graph_id": "text",
+        "status": "text",
+        "created_at": "timestamp",
+        "updated_at": "timestamp",
+    },
+}
+
+# Columns the database fills in when an insert leaves them out.
+# (ids of graph_nodes are generated by ContentMapNode, so they have no default here)
+DEFAULTS: dict[str, dict[str, Any]] = {
+    "knowledge_graphs": {"status": "processing"},
+    "prompts": {"prompt_type": "pair", "is_active": True},
+    "learning_progress": {"version": 1},
+    "chat_messages": {"interrupted": False},
+    "content_map_jobs": {
+        "status": "queued",
+        "stage": "queued",
+        "attempts": 0,
+        "max_attempts": 3,
+    },
+    "content_map_cache": {"status": "pending"},
+}
+
+UUID_PRIMARY_KEY_TABLES = {
+    "documents",
+    "knowledge_graphs",
+    "prompts",
+    "learning_progress",
+    "chat_sessions",
+    "chat_messages",
+    "learning_progress_updates",
+    "content_map_jobs",
+    "content_map_cache",
+    "content_map_staging",
+    "document_passages",
+}
+
+# ON DELETE CASCADE foreign keys: table -> [(child table, referencing column)]
+CASCADES: dict[str, list[tuple[str, str]]] = {
+    "documents": [
+        ("knowledge_graphs", "document_id"),
+        ("document_passages", "document_id"),
+    ],
+    "knowledge_graphs": [
+        ("graph_nodes", "graph_id"),
+        ("graph_edges", "graph_id"),
+        ("content_map_jobs", "graph_id"),
+        ("content_map_cache", "graph_id"),
+        ("content_map_staging", "graph_id"),
+    ],
+}
+
+
+def utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def with_defaults(table: str, row: dict[str, Any]) -> dict[str, Any]:
+    """Fill in the columns the database would default, returning a new row."""
+    columns = TABLES[table]
+    filled = {column: None for column in columns}
+    filled.update(DEFAULTS.get(table, {}))
+    if table in UUID_PRIMARY_KEY_TABLES:
+        filled["id"] = str(uuid.uuid4())
+    if "created_at" in columns:
+        filled["created_at"] = utc_now()
+    if "run_after" in columns:
+        filled["run_after"] = filled["created_at"]
+    if "updated_at" in columns:
+        filled["updated_at"] = filled["created_at"]
+    unknown = set(row) - set(columns)
+    if unknown:
+        raise ValueError(f"Unknown columns for {table}: {sorted(unknown)}")
+    filled.update(row)
+    return filled
+
+
+def apply_staged_levels(node_rows: list[dict[str, Any]], staged: list[dict[str, Any]]):
+    """
+    Set topo_level on node rows from the staged "levels" batches, which are staged
+    after the nodes (nodes stream in before the graph can be analysed).
+    """
+    levels = {
+        row["id"]: row["topo_level"]
+        for batch in staged
+        if batch["kind"] == "levels"
+        for row in batch["rows"]
+    }
+    for row in node_rows:
+        if row["id"] in levels:
+            row["topo_level"] = levels[row["id"]]
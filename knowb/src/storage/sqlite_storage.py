@@ -0,0 +1,257 @@
+import json
+import sqlite3
+import threading
+from contextlib import nullcontext
+from typing import Any, Optional
+
+from src.storage.base import Filters, Row, Storage
+from src.storage.schema import (
+    CASCADES,
+    TABLES,
+    ColumnKind,
+    apply_staged_levels,
+    with_defaults,
+)
+
+SQLITE_TYPES: dict[ColumnKind, str] = {
+    "text": "TEXT",
+    "integer": "INTEGER",
+    "float": "REAL",
+    "boolean": "INTEGER",
+    "timestamp": "TEXT",
+    "json": "TEXT",
+}
+
+
+def _encode(kind: ColumnKind, value: Any) -> Any:
+    if value is None:
+        return None
+    if kind == "json":
+        return json.dumps(value)
+    if kind == "boolean":
+        return int(value)
+    return value
+
+
+def _decode(kind: ColumnKind, value: Any) -> Any:
+    if value is None:
+        return None
+    if kind == "json":
+        return json.loads(value)
+    if kind == "boolean":
+        return bool(value)
+    return value
+
+
+class SQLiteStorage(Storage):
+    """
+    Storage in a local SQLite file (or ":memory:"), with the .cursorrules tables.
+
+    JSONB and array columns are stored as JSON text. Each db pool thread gets its own
+    connection; writes are serialised with a lock since SQLite allows one writer. A
+    file database runs in WAL mode so reads don't wait on writes; the shared-cache
+    in-memory database can't, so its reads take the lock too.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        # a shared-cache URI lets every thread see the same in-memory database
+        if path == ":memory:":
+            self.uri = f"file:knowb_{id(self)}?mode=memory&cache=shared"
+            self._read_lock = self._write_lock
+        else:
+            self.uri = f"file:{path}"
+            self._read_lock = nullcontext()
+        # keep one connection open so an in-memory database outlives pool threads
+        self._keepalive = self._connection()
+        if path != ":memory:":
+            self._keepalive.execute("PRAGMA journal_mode=WAL")
+        self._create_tables()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            self._local.connection = connection
+        return connection
+
+    def _create_tables(self):
+        connection = self._connection()
+        with self._write_lock, connection:
+            for table, columns in TABLES.items():
+                column_sql = ", ".join(
+                    f"{column} {SQLITE_TYPES[kind]}" for column, kind in columns.items()
+                )
+                connection.execute(f"CREATE TABLE IF NOT EXISTS {table} ({column_sql})")
+                for column in ("id", "graph_id", "node_id", "session_id"):
+                    if column in columns:
+                        connection.execute(
+                            f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} "
+                            f"ON {table}({column})"
+                        )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS files "
+                "(bucket TEXT, path TEXT, data BLOB, PRIMARY KEY (bucket, path))"
+            )
+
+    def _where(self, table: str, filters: Optional[Filters]) -> tuple[str, list[Any]]:
+        clauses, params = [], []
+        for column, value in (filters or {}).items():
+            if column not in TABLES[table]:
+                raise ValueError(f"Unknown column for {table}: {column}")
+            if value is None:
+                clauses.append(f"{column} IS NULL")
+            else:
+                clauses.append(f"{column} = ?")
+                params.append(_encode(TABLES[table][column], value))
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def _decode_row(self, table: str, row: sqlite3.Row) -> Row:
+        columns = TABLES[table]
+        return {key: _decode(columns[key], row[key]) for key in row.keys()}
+
+    def _select(
+        self,
+        table: str,
+        filters: Optional[Filters] = None,
+        columns: str = "*",
+        order_by: Optional[str] = None,
+        desc: bool = False,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> list[Row]:
+        if columns != "*":
+            wanted = [column.strip() for column in columns.split(",")]
+            if not set(wanted) <= set(TABLES[table]):
+                raise ValueError(f"Unknown columns for {table}: {columns}")
+        where, params = self._where(table, filters)
+        sql = f"SELECT {columns} FROM {table}{where}"
+        if order_by:
+            if order_by not in TABLES[table]:
+                raise ValueError(f"Unknown column for {table}: {order_by}")
+            sql += f" ORDER BY {order_by} {'DESC' if desc else 'ASC'}"
+        if limit is not None or offset:
+            sql += f" LIMIT {-1 if limit is None else int(limit)} OFFSET {int(offset)}"
+        with self._read_lock:
+            rows = self._connection().execute(sql, params).fetchall()
+        return [self._decode_row(table, row) for row in rows]
+
+    def _insert(self, table: str, rows: Row | list[Row]) -> list[Row]:
+        rows = rows if isinstance(rows, list) else [rows]
+        inserted = [with_defaults(table, row) for row in rows]
+        if not inserted:
+            return []
+        connection = self._connection()
+        with self._write_lock, connection:
+            self._insert_rows(connection, table, inserted)
+        return inserted
+
+    def _update(self, table: str, values: Row, filters: Filters) -> list[Row]:
+        columns = TABLES[table]
+        unknown = set(values) - set(columns)
+        if unknown:
+            raise ValueError(f"Unknown columns for {table}: {sorted(unknown)}")
+        where, params = self._where(table, filters)
+        assignments = ", ".join(f"{column} = ?" for column in values)
+        connection = self._connection()
+        with self._write_lock, connection:
+            rowids = [
+                row[0]
+                for row in connection.execute(
+                    f"SELECT rowid FROM {table}{where}", params
+                ).fetchall()
+            ]
+            connection.execute(
+                f"UPDATE {table} SET {assignments}{where}",
+                [_encode(columns[column], value) for column, value in values.items()]
+                + params,
+            )
+            if not rowids:
+                return []
+            placeholders = ", ".join("?" for _ in rowids)
+            rows = connection.execute(
+                f"SELECT * FROM {table} WHERE rowid IN ({placeholders})", rowids
+            ).fetchall()
+        return [self._decode_row(table, row) for row in rows]
+
+    def _delete(self, table: str, filters: Filters) -> list[Row]:
+        deleted = self._select(table, filters)
+        where, params = self._where(table, filters)
+        connection = self._connection()
+        with self._write_lock, connection:
+            connection.execute(f"DELETE FROM {table}{where}", params)
+        for child_table, column in CASCADES.get(table, []):
+            for row in deleted:
+                self._delete(child_table, {column: row["id"]})
+        return deleted
+
+    def _insert_rows(self, connection: sqlite3.Connection, table: str, rows: list[Row]):
+        columns = TABLES[table]
+        connection.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})",
+            [
+                [_encode(kind, row[column]) for column, kind in columns.items()]
+                for row in rows
+            ],
+        )
+
+    def _commit_graph(self, graph_id: str) -> Row:
+        counts = {"nodes": 0, "edges": 0}
+        connection = self._connection()
+        # one transaction: if any batch fails, the graph keeps its old rows
+        with self._write_lock, connection:
+            staged = connection.execute(
+                "SELECT kind, rows FROM content_map_staging WHERE graph_id = ? "
+                "ORDER BY created_at",
+                (graph_id,),
+            ).fetchall()
+            connection.execute(
+                "DELETE FROM graph_edges WHERE graph_id = ?", (graph_id,)
+            )
+            connection.execute(
+                "DELETE FROM graph_nodes WHERE graph_id = ?", (graph_id,)
+            )
+            staged = [
+                {"kind": batch["kind"], "rows": json.loads(batch["rows"])}
+                for batch in staged
+            ]
+            for kind, table in (("nodes", "graph_nodes"), ("edges", "graph_edges")):
+                rows = [
+                    with_defaults(table, {**row, "graph_id": graph_id})
+                    for batch in staged
+                    if batch["kind"] == kind
+                    for row in batch["rows"]
+                ]
+                if kind == "nodes":
+                    apply_staged_levels(rows, staged)
+                self._insert_rows(connection, table, rows)
+                counts[kind] = len(rows)
+            connection.execute(
+                "DELETE FROM content_map_staging WHERE graph_id = ?", (graph_id,)
+            )
+        return counts
+
+    def _download(self, bucket: str, path: str) -> bytes:
+        with self._read_lock:
+            row = (
+                self._connection()
+                .execute(
+                    "SELECT data FROM files WHERE bucket = ? AND path = ?",
+                    (bucket, path),
+                )
+                .fetchone()
+            )
+        if row is None:
+            raise FileNotFoundError(f"{bucket}/{path} not found")
+        return bytes(row["data"])
+
+    def _upload(self, bucket: str, path: str, data: bytes) -> None:
+        connection = self._connection()
+        with self._write_lock, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO files (bucket, path, data) VALUES (?, ?, ?)",
+                (bucket, path, data),
+            )
@@ -0,0 +1,71 @@
+from typing import Optional
+
+from supabase import Client
+
+from src.storage.base import Filters, Row, Storage
+
+
+class SupabaseStorage(Storage):
+    """
+    Storage backed by the Supabase tables.
+
+    The supabase client is synchronous, so each query is built and executed on the
+    bounded db thread pool (see src/services/db.py) and awaited from the event loop.
+    """
+
+    def __init__(self, client: Client):
+        self.client = client
+
+    def _filtered(self, query, filters: Optional[Filters]):
+        for column, value in (filters or {}).items():
+            query = (
+                query.is_(column, "null") if value is None else query.eq(column, value)
+            )
+        return query
+
+    def _select(
+        self,
+        table: str,
+        filters: Optional[Filters] = None,
+        columns: str = "*",
+        order_by: Optional[str] = None,
+        desc: bool = False,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> list[Row]:
+        query = self._filtered(self.client.from_(table).select(columns), filters)
+        if order_by:
+            query = query.order(order_by, desc=desc)
+        if limit is not None:
+            query = query.limit(limit)
+        if offset:
+            query = query.offset(offset)
+        return query.execute().data
+
+    def _insert(self, table: str, rows: Row | list[Row]) -> list[Row]:
+        return self.client.from_(table).insert(rows).execute().data
+
+    def _update(self, table: str, values: Row, filters: Filters) -> list[Row]:
+        return (
+            self._filtered(self.client.from_(table).update(values), filters)
+            .execute()
+            .data
+        )
+
+    def _delete(self, table: str, filters: Filters) -> list[Row]:
+        return self._filtered(self.client.from_(table).delete(), filters).execute().data
+
+    def _download(self, bucket: str, path: str) -> bytes:
+        return self.client.storage.from_(bucket).download(path)
+
+    def _upload(self, bucket: str, path: str, data: bytes) -> None:
+        self.client.storage.from_(bucket).upload(path, data)
+
+    def _commit_graph(self, graph_id: str) -> Row:
+        # commit_content_map is a plpgsql function (see migration.txt), so it runs
+        # in a single transaction
+        return (
+            self.client.rpc("commit_content_map", {"p_graph_id": graph_id})
+            .execute()
+            .data
+        )
@@ -1,5 +1,23 @@
+"""
+Which prompt a user's content maps are made with: the one selected in their settings,
+or the default prompt.
+
+Prompts are resolved through a PromptResolver, which caches a user's selection, the
+default prompt and prompt texts by id for PROMPT_CACHE_TTL_SECONDS. The settings page
+writes to user_settings and prompts directly, then tells the backend
+(POST /api/settings/prompts_changed), which drops that user's entries; other
+processes see the change within the TTL.
+"""
+
+import asyncio
+import os
+import time
 from dataclasses import dataclass
-from src.services import supabase
+from typing import Callable, Optional
+
+from src.storage import Storage, get_storage
+
+PROMPT_CACHE_TTL_SECONDS = float(os.getenv("PROMPT_CACHE_TTL_SECONDS", "60"))
 
 
 @dataclass
@@ -8,33 +26,107 @@ class UserPrompt:
     prompt_texts: dict
 
 
-async def get_user_prompt(user_id: str | None) -> UserPrompt:
+@dataclass
+class _Entry:
+    value: object
+    expires: float
+    # whose prompt it is (None for default prompts), to invalidate it with their settings
+    owner: Optional[str] = None
+
+
+class PromptResolver:
+    def __init__(
+        self,
+        ttl_seconds: float = PROMPT_CACHE_TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        # user id -> their selected prompt id (or None)
+        self._selections: dict[str, _Entry] = {}
+        # prompt id -> UserPrompt
+        self._prompts: dict[str, _Entry] = {}
+        self._default: Optional[_Entry] = None
+
+    def _fresh(self, entry: Optional[_Entry]) -> Optional[_Entry]:
+        return entry if entry is not None and entry.expires > self.clock() else None
+
+    def _entry(self, value, owner: Optional[str] = None) -> _Entry:
+        return _Entry(value, self.clock() + self.ttl_seconds, owner)
+
+    async def selected_prompt_id(self, user_id: str, storage: Storage) -> Optional[str]:
+        entry = self._fresh(self._selections.get(user_id))
+        if entry is None:
+            settings = await storage.get_user_settings(user_id)
+            prompt_id = settings.get("current_prompt_id") if settings else None
+            entry = self._selections[user_id] = self._entry(prompt_id, user_id)
+        return entry.value
+
+    async def prompt(self, prompt_id: str, storage: Storage) -> UserPrompt:
+        entry = self._fresh(self._prompts.get(prompt_id))
+        if entry is None:
+            prompt = await storage.get_prompt(prompt_id)
+            if not prompt:
+                raise ValueError(f"Prompt {prompt_id} not found")
+            entry = self._prompts[prompt_id] = self._entry(
+                UserPrompt(id=prompt["id"], prompt_texts=prompt["prompt_texts"]),
+                prompt["user_id"],
+            )
+        return entry.value
+
+    async def default_prompt(self, storage: Storage) -> Optional[UserPrompt]:
+        entry = self._fresh(self._default)
+        if entry is None:
+            prompt = await storage.get_default_prompt()
+            if not prompt:
+                return None
+            entry = self._default = self._entry(
+                UserPrompt(id=prompt["id"], prompt_texts=prompt["prompt_texts"])
+            )
+        return entry.value
+
+    async def resolve(self, user_id: Optional[str], storage: Storage) -> UserPrompt:
+        # the selection and the default don't depend on each other, so look both up
+        # at once (usually from the cache)
+        if user_id:
+            prompt_id, default = await asyncio.gather(
+                self.selected_prompt_id(user_id, storage), self.default_prompt(storage)
+            )
+        else:
+            prompt_id, default = None, await self.default_prompt(storage)
+
+        if prompt_id:
+            return await self.prompt(prompt_id, storage)
+        if default is None:
+            raise ValueError("No prompt found (neither user-selected nor default)")
+        return default
+
+    def invalidate_user(self, user_id: str):
+        """Forget a user's selection and their own prompts"""
+        self._selections.pop(user_id, None)
+        for prompt_id, entry in list(self._prompts.items()):
+            if entry.owner == user_id:
+                del self._prompts[prompt_id]
+
+
+prompt_resolver = PromptResolver()
+
+
+async def get_user_prompt(
+    user_id: str | None, storage: Storage | None = None
+) -> UserPrompt:
     """Get the user's current prompt (or default), returning both ID and texts."""
+    # prompts are resolved with the admin client unless told otherwise
+    return await prompt_resolver.resolve(user_id, storage or get_storage())
+
+
+async def get_prompt_by_id(
+    prompt_id: str, storage: Storage | None = None
+) -> UserPrompt:
+    """Get a specific prompt, e.g. the one a content map job was queued with."""
+    return await prompt_resolver.prompt(prompt_id, storage or get_storage())
+
 
-    # Get prompt_id from user settings if it exists
-    if user_id:
-        settings = (
-            supabase.from_("user_settings")
-            .select("current_prompt_id")
-            .eq("user_id", user_id)
-            .single()
-            .execute()
-        )
-        prompt_id = settings.data.get("current_prompt_id") if settings.data else None
-    else:
-        prompt_id = None
-
-    # Get the prompt data (either user-selected or default)
-    prompt_query = supabase.from_("prompts").select("id, prompt_texts")
-
-    if prompt_id:
-        prompt_query = prompt_query.eq("id", prompt_id)
-    else:
-        prompt_query = prompt_query.is_("user_id", None)
-
-    result = prompt_query.single().execute()
-
-    if not result.data:
-        raise ValueError("No prompt found (neither user-selected nor default)")
-
-    return UserPrompt(id=result.data["id"], prompt_texts=result.data["prompt_texts"])
+def invalidate_user_prompts(user_id: str):
+    """Call when a user's prompt selection or prompts have changed"""
+    prompt_resolver.invalidate_user(user_id)
@@ -0,0 +1,82 @@
+"""Test doubles shared by the test modules (the benchmarks keep their own)."""
+
+import asyncio
+from types import SimpleNamespace
+from typing import AsyncIterator, Optional
+
+import pytest
+
+from src.api.stt import Transcript
+from src.services import security
+
+
+@pytest.fixture
+def supabase_users(monkeypatch) -> dict[str, str]:
+    """
+    access token -> user id, as known to a fake Supabase client. Everything else on
+    the way from a token to a user id (src/services/security.py) is real.
+    """
+    users: dict[str, str] = {}
+
+    def get_user(jwt: str):
+        if jwt not in users:
+            raise ValueError("invalid JWT")
+        return SimpleNamespace(user=SimpleNamespace(id=users[jwt]))
+
+    client = SimpleNamespace(auth=SimpleNamespace(get_user=get_user))
+    monkeypatch.setattr(security, "get_supabase_client", lambda token=None: client)
+    return users
+
+
+class FakeRecognizer:
+    """
+    Mimics GoogleRecognizer.stream: the "audio" is UTF-8 text, each chunk one or more
+    words. Every chunk gets an interim transcript of the words so far, and the end of
+    the audio a final one.
+    """
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+
+    async def stream(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[Transcript]:
+        words: list[str] = []
+        async for chunk in chunks:
+            self.chunks.append(chunk)
+            words += chunk.decode("utf-8").split()
+            yield Transcript(" ".join(words), is_final=False)
+        if words:
+            yield Transcript(" ".join(words), is_final=True)
+
+
+@pytest.fixture
+def recognizer() -> FakeRecognizer:
+    return FakeRecognizer()
+
+
+class FakeSynthesizer:
+    """
+    Mimics TTSService.synthesize: the "audio" is the text, encoded, after delay seconds
+    (or delays[text]). Records the most syntheses that ran at once.
+    """
+
+    def __init__(self, delay: float = 0.0, delays: Optional[dict[str, float]] = None):
+        self.delay = delay
+        self.delays = delays or {}
+        self.texts: list[str] = []
+        self.running = 0
+        self.most_running = 0
+
+    async def synthesize(self, text: str) -> bytes:
+        self.texts.append(text)
+        self.running += 1
+        self.most_running = max(self.most_running, self.running)
+        try:
+            await asyncio.sleep(self.delays.get(text, self.delay))
+        finally:
+            self.running -= 1
+        return text.encode("utf-8")
+
+
+@pytest.fixture
+def synthesizer() -> FakeSynthesizer:
+    return FakeSynthesizer()
@@ -0,0 +1,41 @@
+import base64
+
+from benchmarks.generators import make_graph_output, make_pdf
+from benchmarks.harness import BenchmarkResult, find_regressions, measure, percentile
+from src.api.ai.prompts import parse_graph_output
+from src.api.pdf2text import convert_base64_pdf_to_text
+
+
+def test_percentile_nearest_rank():
+    samples = [float(i) for i in range(1, 101)]
+    assert percentile(samples, 50) == 50
+    assert percentile(samples, 99) == 99
+    assert percentile([3.0], 95) == 3.0
+
+
+def test_find_regressions():
+    result = BenchmarkResult("build_graph[nodes=10]", 10, 2.0, 3.0, 4.0, 100.0, 10)
+    baseline = {
+        "build_graph[nodes=10]": {"p50_ms": 1.0, "p95_ms": 2.9, "peak_alloc_kib": 100.0}
+    }
+
+    regressions = find_regressions([result], baseline, tolerance=0.25)
+
+    assert len(regressions) == 1
+    assert regressions[0].startswith("build_graph[nodes=10]: p50_ms")
+
+
+def test_measure_sync_and_async():
+    async def coro():
+        return 1
+
+    assert measure("sync", lambda: sum(range(100)), min_time=0).iterations >= 5
+    assert measure("async", coro, min_time=0).iterations >= 5
+
+
+def test_generated_inputs_are_valid():
+    nodes, edges = parse_graph_output(make_graph_output(30))
+    assert len(nodes) == 30 and len(edges) > 0
+
+    text = convert_base64_pdf_to_text(base64.b64encode(make_pdf(2)).decode("utf-8"))
+    assert len(text.splitlines()) == 80
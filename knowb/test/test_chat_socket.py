@@ -0,0 +1,178 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from benchmarks.fakes import FakeAnthropic
+from benchmarks.generators import seed_storage
+from main import app
+from src.api.ai import chat_socket
+from src.api.ai import session as chat_session
+from src.services import security
+from src.storage import MemoryStorage, set_storage
+
+
+@pytest.fixture
+def seeded(monkeypatch):
+    import asyncio
+
+    storage = MemoryStorage()
+    ids = asyncio.run(seed_storage(storage, n_nodes=5))
+    checked = []
+
+    async def user_id(token):
+        checked.append(token.credentials)
+        if token.credentials != "good-token":
+            raise ValueError("invalid token")
+        return ids["user_id"]
+
+    client = FakeAnthropic(n_chunks=3, tool_use={"node_id": 1, "judgement": "good"})
+    monkeypatch.setattr(chat_socket, "get_user_id_from_token", user_id)
+    monkeypatch.setattr(chat_session, "get_user_id_from_token", user_id)
+    monkeypatch.setattr(chat_session, "get_anthropic_client", lambda: client)
+    monkeypatch.setattr(chat_session, "STREAM_CHUNK_DELAY", 0)
+    set_storage(storage)
+    yield ids, checked
+    set_storage(None)
+
+
+def receive_turn(websocket) -> list[dict]:
+    messages = []
+    while not messages or messages[-1]["type"] not in ("end", "error"):
+        messages.append(websocket.receive_json())
+    return messages
+
+
+def test_turns_of_one_connection_share_its_authentication(seeded):
+    ids, checked = seeded
+    with TestClient(app).websocket_connect("/api/chat/ws") as websocket:
+        websocket.send_json({"type": "auth", "token": "good-token"})
+        assert websocket.receive_json() == {"type": "ready", "user_id": ids["user_id"]}
+
+        turns = []
+        for turn_id in ("turn-a", "turn-b"):
+            websocket.send_json(
+                {
+                    "type": "turn",
+                    "session_id": ids["session_id"],
+                    "turn_id": turn_id,
+                    "message": "What is a parity bit?",
+                }
+            )
+            turns.append(receive_turn(websocket))
+
+    first = [message["type"] for message in turns[0]]
+    assert first[:3] == ["text"] * 3 and first[-1] == "end"
+    assert "tool_use" in first
+    (delta,) = [message for message in turns[0] if message["type"] == "learning_state"]
+    assert delta["changes"] and delta["session_id"] == ids["session_id"]
+    assert turns[1][-1]["turn_id"] == "turn-b"
+    # authenticated once, at connect
+    assert checked == ["good-token"]
+
+
+def test_reused_turn_id_with_another_message_is_an_error(seeded):
+    ids, _ = seeded
+    with TestClient(app).websocket_connect("/api/chat/ws") as websocket:
+        websocket.send_json({"type": "auth", "token": "good-token"})
+        websocket.receive_json()
+        turns = []
+        for message in ("What is a parity bit?", "And a checksum?"):
+            websocket.send_json(
+                {
+                    "type": "turn",
+                    "session_id": ids["session_id"],
+                    "turn_id": "turn-c",
+                    "message": message,
+                }
+            )
+            turns.append(receive_turn(websocket))
+
+    assert turns[0][-1]["type"] == "end"
+    (error,) = turns[1]
+    assert error["type"] == "error" and "different message" in error["detail"]
+
+
+def test_bad_token_closes_the_connection(seeded):
+    with TestClient(app).websocket_connect("/api/chat/ws") as websocket:
+        websocket.send_json({"type": "auth", "token": "bad-token"})
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+    assert closed.value.code == chat_socket.CLOSE_UNAUTHORIZED
+
+
+def test_spoken_turn_gets_audio_per_sentence(seeded, synthesizer, monkeypatch):
+    ids, _ = seeded
+    monkeypatch.setattr(chat_socket, "get_tts_service", lambda: synthesizer)
+    with TestClient(app).websocket_connect("/api/chat/ws") as websocket:
+        websocket.send_json({"type": "auth", "token": "good-token"})
+        websocket.receive_json()
+        websocket.send_json(
+            {
+                "type": "turn",
+                "session_id": ids["session_id"],
+                "turn_id": "spoken",
+                "message": "What is a parity bit?",
+                "speak": True,
+            }
+        )
+        messages = []
+        while not messages or messages[-1]["type"] != "audio_end":
+            messages.append(websocket.receive_json())
+
+    audio = [message for message in messages if message["type"] == "audio"]
+    assert [message["seq"] for message in audio] == list(range(1, len(audio) + 1))
+    # the fake reply is "Let's think about this. " three times, before and after
+    # the tool use
+    assert all(message["text"].startswith("Let's think") for message in audio)
+    assert synthesizer.texts == [message["text"] for message in audio]
+
+
+def test_token_is_checked_by_the_real_security_path(
+    seeded, supabase_users, monkeypatch
+):
+    ids, _ = seeded
+    # undo the fixture's stub: only the Supabase client is faked here
+    monkeypatch.setattr(
+        chat_socket, "get_user_id_from_token", security.get_user_id_from_token
+    )
+    supabase_users["raw-access-token"] = ids["user_id"]
+    with TestClient(app).websocket_connect("/api/chat/ws") as websocket:
+        websocket.send_json({"type": "auth", "token": "raw-access-token"})
+        assert websocket.receive_json() == {"type": "ready", "user_id": ids["user_id"]}
+
+
+def test_spoken_turn_skips_the_models_thinking(seeded, synthesizer, monkeypatch):
+    ids, _ = seeded
+    client = FakeAnthropic()
+    # the tags arrive split across chunks, as they stream
+    client.chunks = [
+        "<thin",
+        "king>The learner mixes up odd and even.</thinking>",
+        "**Even parity** means the count of ones is even. ",
+        "<thinking>Ask next",
+        "</thinking>Shall we try one?",
+    ]
+    monkeypatch.setattr(chat_session, "get_anthropic_client", lambda: client)
+    monkeypatch.setattr(chat_socket, "get_tts_service", lambda: synthesizer)
+    with TestClient(app).websocket_connect("/api/chat/ws") as websocket:
+        websocket.send_json({"type": "auth", "token": "good-token"})
+        websocket.receive_json()
+        websocket.send_json(
+            {
+                "type": "turn",
+                "session_id": ids["session_id"],
+                "turn_id": "thinking",
+                "message": "What is even parity?",
+                "speak": True,
+            }
+        )
+        messages = []
+        while not messages or messages[-1]["type"] != "audio_end":
+            messages.append(websocket.receive_json())
+
+    text = "".join(message["data"] for message in messages if message["type"] == "text")
+    assert "<thinking>" in text  # the chat UI gets it all, and hides it itself
+    assert synthesizer.texts == [
+        "Even parity means the count of ones is even.",
+        "Shall we try one?",
+    ]
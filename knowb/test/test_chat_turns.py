@@ -0,0 +1,196 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from benchmarks.fakes import FakeAnthropic
+from benchmarks.generators import seed_storage
+from src.api.ai import chat_turns
+from src.api.ai import session as chat_session
+from src.api.ai.chat_turns import ChatTurn, format_sse, get_or_start_turn
+from src.services import metrics
+from src.storage import MemoryStorage, set_storage
+
+
+def data_of(events: list[str]) -> list[str]:
+    """The data of each event (joined across data: lines), skipping retry hints"""
+    return [
+        "\n".join(
+            line[len("data: ") :]
+            for line in event.splitlines()
+            if line.startswith("data: ")
+        )
+        for event in events
+        if "data: " in event
+    ]
+
+
+def test_multiline_data_is_framed_line_by_line():
+    assert (
+        format_sse("a\nb\r\n\nc", 7) == "id: 7\ndata: a\ndata: b\ndata: \ndata: c\n\n"
+    )
+
+
+def test_reconnecting_with_the_same_turn_id_resumes_instead_of_restarting():
+    started = []
+
+    async def reply(release: asyncio.Event):
+        started.append(1)
+        yield "Parity\n"
+        yield "bits"
+        await release.wait()
+        yield "[END]"
+
+    async def run():
+        release = asyncio.Event()
+        turn = get_or_start_turn(
+            "session",
+            "turn-1",
+            lambda: reply(release),
+            user_id="user-1",
+            message="What is a parity bit?",
+        )
+
+        first = turn.events()
+        received = []
+        async for event in first:
+            received.append(event)
+            if event.startswith("id: 2"):
+                break
+        await first.aclose()  # the connection drops
+
+        release.set()
+        again = get_or_start_turn(
+            "session",
+            "turn-1",
+            lambda: reply(release),
+            user_id="user-1",
+            message="What is a parity bit?",
+        )
+        resumed = [event async for event in again.events(last_event_id=2)]
+        return again is turn, received, resumed
+
+    same_turn, received, resumed = asyncio.run(run())
+
+    assert same_turn and started == [1]
+    assert data_of(received) == ["Parity\n", "bits"]
+    assert data_of(resumed) == ["[END]"] and resumed[-1].startswith("id: 3")
+
+
+def test_turn_id_only_resumes_the_same_users_same_message():
+    async def reply():
+        yield "[END]"
+
+    async def run():
+        start = dict(user_id="user-1", message="What is a parity bit?")
+        turn = get_or_start_turn("session", "turn-4", reply, **start)
+        assert get_or_start_turn("session", "turn-4", reply, **start) is turn
+
+        with pytest.raises(HTTPException) as other_user:
+            get_or_start_turn("session", "turn-4", reply, **{**start, "user_id": "x"})
+        with pytest.raises(HTTPException) as other_message:
+            get_or_start_turn("session", "turn-4", reply, **{**start, "message": "Hi"})
+        await turn.task
+        return other_user.value.status_code, other_message.value.status_code
+
+    assert asyncio.run(run()) == (403, 409)
+
+
+def test_client_behind_the_replay_buffer_is_told_to_reload(monkeypatch):
+    monkeypatch.setattr(chat_turns, "REPLAY_BUFFER_EVENTS", 2)
+
+    async def reply():
+        for i in range(5):
+            yield str(i)
+
+    async def run():
+        turn = ChatTurn(("session", "turn-2"), reply())
+        await turn.task
+        return [event async for event in turn.events(last_event_id=1)]
+
+    (event,) = data_of(asyncio.run(run()))
+    assert event.startswith("Error:")
+
+
+def test_disconnect_cancels_the_model_stream_and_keeps_the_partial_reply(monkeypatch):
+    monkeypatch.setattr(chat_turns, "DISCONNECT_GRACE_SECONDS", 0)
+    monkeypatch.setattr(chat_session, "STREAM_CHUNK_DELAY", 0.01)
+    cancelled = metrics.CHAT_TURNS_CANCELLED.value(stage="reply")
+
+    async def run():
+        storage = MemoryStorage()
+        ids = await seed_storage(storage, n_nodes=5)
+        client = FakeAnthropic(
+            n_chunks=50, chunk="Parity. ", tool_use={"node_id": 1, "judgement": "good"}
+        )
+        set_storage(storage)
+        try:
+            turn = get_or_start_turn(
+                ids["session_id"],
+                "turn-3",
+                lambda: chat_session.handle_chat_stream(
+                    "What is a parity bit?", ids["session_id"], None, client
+                ),
+                user_id=ids["user_id"],
+                message="What is a parity bit?",
+            )
+            events = turn.events()
+            async for event in events:
+                if event.startswith("id: 3"):
+                    break
+            await events.aclose()  # the tab is closed
+            await asyncio.gather(turn.task, return_exceptions=True)
+        finally:
+            set_storage(None)
+        return client, await storage.get_chat_messages(ids["session_id"])
+
+    client, messages = asyncio.run(run())
+
+    # one model call, closed early; the tool-use follow-up never started
+    (stream,) = client.streams
+    assert stream.closed
+    user, reply = messages
+    assert reply["interrupted"] and not user["interrupted"]
+    (block,) = reply["content"]["content"]
+    assert block["text"].startswith("Parity. Parity. ") and len(block["text"]) < 400
+    assert metrics.CHAT_TURNS_CANCELLED.value(stage="reply") == cancelled + 1
+
+
+def test_a_slow_model_stream_does_not_block_the_event_loop(monkeypatch):
+    monkeypatch.setattr(chat_session, "STREAM_CHUNK_DELAY", 0)
+
+    async def run():
+        storage = MemoryStorage()
+        ids = await seed_storage(storage, n_nodes=5)
+        # each chunk takes 50ms to arrive, like a blocking read of the HTTP response
+        client = FakeAnthropic(n_chunks=4, chunk_delay=0.05)
+        set_storage(storage)
+        try:
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            ticking = asyncio.create_task(ticker())
+            start = time.perf_counter()
+            reply = [
+                event
+                async for event in chat_session.handle_chat_stream(
+                    "What is a parity bit?", ids["session_id"], None, client
+                )
+            ]
+            elapsed = time.perf_counter() - start
+            ticking.cancel()
+        finally:
+            set_storage(None)
+        return reply, ticks, elapsed
+
+    reply, ticks, elapsed = asyncio.run(run())
+
+    assert reply[-1] == "[END]"
+    # the loop kept running other tasks while the chunks were being read
+    assert ticks >= elapsed / 0.01 / 2
@@ -0,0 +1,143 @@
+import json
+import re
+
+import anthropic
+from starlette.testclient import TestClient
+
+from benchmarks.generators import make_pdf
+from loadtest.fake_anthropic import (
+    FakeAnthropicConfig,
+    FakeReply,
+    create_fake_anthropic_app,
+)
+from src.api.ai.chunked_map import make_chunked_content_map, split_pdf
+from src.api.ai.make_map import MODEL
+from src.api.ai.usage import UsageLog
+from src.users.user_settings import UserPrompt
+
+USER_PROMPT = UserPrompt(
+    id="prompt", prompt_texts={"brainstorm_prompt": "Think.", "final_prompt": "Map."}
+)
+
+
+def chunk_graph(first_page: int, last_page: int) -> dict:
+    # one node per page, so the overlapping page shows up in both chunks
+    nodes = [
+        {
+            "order_index": i + 1,
+            "summary": f"Concept from page {page}",
+            "content": f"What page {page} says",
+            "supporting_quotes": [f"quote {page}"],
+        }
+        for i, page in enumerate(range(first_page, last_page + 1))
+    ]
+    edges = [{"parent_index": i, "child_index": i + 1} for i in range(1, len(nodes))]
+    return {"nodes": nodes, "edges": edges}
+
+
+def responder(body: dict) -> FakeReply:
+    text = json.dumps(body["messages"])
+    pages = re.search(r"pages (\d+) to (\d+)", text)
+    if pages:
+        return FakeReply(
+            tokens=[],
+            tool_use=chunk_graph(int(pages[1]), int(pages[2])),
+            tool_name="save_content_map",
+        )
+    # the stitching pass: link page 3 (first chunk) to page 6 (second chunk), plus
+    # an edge naming a node that doesn't exist
+    return FakeReply(
+        tokens=[
+            'EDGES\n[{"parent_index": 3, "child_index": 6}, '
+            '{"parent_index": 3, "child_index": 99}]'
+        ]
+    )
+
+
+def make_client(responder=responder):
+    app = create_fake_anthropic_app(
+        FakeAnthropicConfig(tokens_per_second=1e6, first_token_delay=0), responder
+    )
+    client = anthropic.Anthropic(
+        api_key="test", base_url="http://testserver", http_client=TestClient(app)
+    )
+    return client, app.state.stats
+
+
+def test_split_pdf_overlaps_page_ranges():
+    chunks = split_pdf(make_pdf(10, lines_per_page=2), chunk_pages=4, overlap=1)
+
+    assert [(c.first_page, c.last_page) for c in chunks] == [(1, 4), (4, 7), (7, 10)]
+    assert all(c.pdf.startswith(b"%PDF") for c in chunks)
+
+
+def test_chunked_content_map_merges_and_stitches():
+    client, stats = make_client()
+    pdf = make_pdf(7, lines_per_page=2)
+
+    nodes, edges = make_chunked_content_map(
+        pdf, USER_PROMPT, client, MODEL, chunk_pages=4, concurrency=2
+    )
+
+    # pages 1-4 and 4-7: page 4 is extracted twice but kept once
+    assert [node.summary for node in nodes] == [
+        f"Concept from page {page}" for page in range(1, 8)
+    ]
+    assert [node.order_index for node in nodes] == list(range(1, 8))
+    assert set(nodes[3].supporting_quotes) == {"quote 4"}
+
+    by_id = {node.id: node.order_index for node in nodes}
+    pairs = {(by_id[e.parent_id], by_id[e.child_id]) for e in edges}
+    # chain within each chunk (4->5 redirected to the merged page-4 node) + stitched 3->6
+    assert pairs == {(1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 7), (3, 6)}
+    assert stats.requests == 3
+
+
+def test_an_invalid_chunk_is_repaired_instead_of_failing_the_job():
+    requests = []
+
+    def respond(body: dict) -> FakeReply:
+        requests.append(body)
+        text = json.dumps(body["messages"])
+        if "were invalid" in text:
+            graph = {"nodes": [chunk_graph(2, 2)["nodes"][0] | {"order_index": 2}]}
+            return FakeReply(tokens=[], tool_use=graph, tool_name="save_content_map")
+        if "pages 1 to 4" in text:
+            # page 2's node came back without a summary
+            graph = chunk_graph(1, 4)
+            graph["nodes"][1]["summary"] = None
+            return FakeReply(tokens=[], tool_use=graph, tool_name="save_content_map")
+        if "pages 4 to 7" in text:
+            # nothing usable in this chunk at all
+            return FakeReply(
+                tokens=[], tool_use={"nodes": []}, tool_name="save_content_map"
+            )
+        return responder(body)
+
+    client, _ = make_client(respond)
+    usage = UsageLog()
+
+    nodes, edges = make_chunked_content_map(
+        make_pdf(7, lines_per_page=2),
+        USER_PROMPT,
+        client,
+        MODEL,
+        chunk_pages=4,
+        concurrency=2,
+        usage=usage,
+    )
+
+    assert [node.summary for node in nodes] == [
+        f"Concept from page {page}" for page in range(1, 5)
+    ]
+    assert all(
+        body["tool_choice"]["name"] == "save_content_map"
+        for body in requests
+        if "pages " in json.dumps(body["messages"])
+    )
+    assert sorted(stage.stage for stage in usage.stages) == [
+        "pages 1-4",
+        "pages 4-7",
+        "repair",
+        "stitch",
+    ]
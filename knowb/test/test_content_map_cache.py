@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+from benchmarks.generators import make_pdf
+from src.api.models import ContentMapEdge, ContentMapNode
+from src.api.routes.content_map import copy_cached_content_map
+from src.jobs.queue import enqueue_content_map_job
+from src.jobs.worker import ContentMapWorker
+from src.storage import MemoryStorage, set_storage
+
+
+async def seed(storage: MemoryStorage):
+    prompt = await storage._run(
+        storage._insert,
+        "prompts",
+        {
+            "name": "Default",
+            "prompt_texts": {"brainstorm_prompt": "", "final_prompt": ""},
+        },
+    )
+    pdf = make_pdf(2)
+    await storage.upload_document("alice/doc.pdf", pdf)
+    document = await storage.insert_document(
+        {
+            "user_id": "alice",
+            "title": "Doc",
+            "file_size": len(pdf),
+            "storage_path": "alice/doc.pdf",
+        }
+    )
+    return document["id"], prompt[0]["id"]
+
+
+async def run_job(document_id: str, prompt_id: str, storage: MemoryStorage) -> str:
+    graph = await storage.insert_graph({"document_id": document_id})
+    await enqueue_content_map_job(graph["id"], document_id, "alice", prompt_id, storage)
+    return graph["id"]
+
+
+def fake_make_content_map(calls: list):
+    def make_content_map(pdf_content, user_prompt, on_node=None):
+        calls.append(user_prompt.id)
+        time.sleep(0.1)
+        nodes = [
+            ContentMapNode(
+                summary=f"Concept {i}", content="", supporting_quotes=[], order_index=i
+            )
+            for i in (1, 2)
+        ]
+        for node in nodes:
+            on_node(node)
+        return nodes, [ContentMapEdge(parent_id=nodes[0].id, child_id=nodes[1].id)]
+
+    return make_content_map
+
+
+def test_duplicate_runs_coalesce_and_repeat_runs_copy_the_cache(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        "src.jobs.content_map.make_content_map", fake_make_content_map(calls)
+    )
+    monkeypatch.setattr("src.jobs.cache.COALESCE_POLL_SECONDS", 0.01)
+
+    async def run():
+        storage = MemoryStorage()
+        document_id, prompt_id = await seed(storage)
+        # two runs of the same document at once generate it only once
+        graph_ids = [await run_job(document_id, prompt_id, storage) for _ in range(2)]
+        worker = ContentMapWorker(
+            storage, per_user_limit=2, poll_seconds=0.01, heartbeat_seconds=60
+        )
+        assert await worker.poll() == 2
+        await worker.drain()
+
+        assert len(calls) == 1
+        for graph_id in graph_ids:
+            assert (await storage.get_graph(graph_id))["status"] == "complete"
+            nodes = await storage.get_nodes(graph_id)
+            assert [node["summary"] for node in nodes] == ["Concept 1", "Concept 2"]
+            edges = await storage.get_edges(graph_id)
+            assert [(e["parent_id"], e["child_id"]) for e in edges] == [
+                (nodes[0]["id"], nodes[1]["id"])
+            ]
+        all_node_ids = [node["id"] for node in storage.tables["graph_nodes"]]
+        assert len(set(all_node_ids)) == 4
+
+        # the worker recorded the document's hash, so a repeat run is served straight
+        # from the cache without queueing a job
+        set_storage(storage)
+        try:
+            graph = await storage.insert_graph({"document_id": document_id})
+            assert await copy_cached_content_map(
+                document_id, prompt_id, graph["id"], storage
+            )
+            assert (await storage.get_graph(graph["id"]))["status"] == "complete"
+            assert len(await storage.get_nodes(graph["id"])) == 2
+            assert len(calls) == 1
+
+            # a different prompt is a different cache key
+            assert not await copy_cached_content_map(
+                document_id, "other-prompt", graph["id"], storage
+            )
+        finally:
+            set_storage(None)
+
+    asyncio.run(run())
@@ -0,0 +1,129 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from src.api.routes.content_map import (
+    get_content_map_status,
+    stream_content_map_events,
+)
+from src.jobs.events import broker, progress_events
+from src.jobs.worker import ContentMapWorker
+from src.storage import MemoryStorage, set_storage
+from test_content_map_cache import fake_make_content_map, run_job, seed
+
+
+def parse_events(body: str) -> list[dict]:
+    return [
+        json.loads(line[len("data: ") :])
+        for line in body.splitlines()
+        if line.startswith("data: ")
+    ]
+
+
+def test_job_pipeline_pushes_each_transition(monkeypatch):
+    monkeypatch.setattr(
+        "src.jobs.content_map.make_content_map", fake_make_content_map([])
+    )
+
+    async def run():
+        storage = MemoryStorage()
+        document_id, prompt_id = await seed(storage)
+        graph_id = await run_job(document_id, prompt_id, storage)
+        queue = broker.subscribe(graph_id)
+        worker = ContentMapWorker(storage, poll_seconds=0.01, heartbeat_seconds=60)
+        assert await worker.poll() == 1
+        await worker.drain()
+        broker.unsubscribe(graph_id, queue)
+
+        events = []
+        while not queue.empty():
+            events.append(queue.get_nowait())
+        return events
+
+    events = asyncio.run(run())
+
+    stages = [event["stage"] for event in events if event["event"] == "stage"]
+    assert stages[0] == "loading_document" and "saving" in stages
+    assert [e["node_count"] for e in events if e["event"] == "nodes"][-1] == 2
+    assert [e["edge_count"] for e in events if e["event"] == "edges"] == [1]
+    assert events[-1]["event"] == "complete"
+    assert broker.subscriber_count(events[-1]["graph_id"]) == 0
+
+
+def test_progress_events_between_snapshots():
+    queued = {"status": "queued", "stage": "queued", "node_count": 0, "edge_count": 0}
+    running = {**queued, "status": "running", "stage": "generating", "node_count": 5}
+    failed = {**running, "status": "failed", "stage": "failed"}
+
+    assert [e["event"] for e in progress_events(queued, running)] == ["stage", "nodes"]
+    assert progress_events(running, running) == []
+    assert [e["event"] for e in progress_events(running, failed)] == ["error"]
+
+
+def bearer(access_token: str) -> HTTPAuthorizationCredentials:
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=access_token)
+
+
+def test_event_stream_relays_status_written_by_another_process(
+    monkeypatch, supabase_users
+):
+    monkeypatch.setattr("src.jobs.events.RELAY_POLL_SECONDS", 0.01)
+    supabase_users["alice-token"] = "alice"
+
+    async def run():
+        storage = MemoryStorage()
+        document_id, prompt_id = await seed(storage)
+        graph_id = await run_job(document_id, prompt_id, storage)
+        job = await storage.get_content_map_job(graph_id)
+        set_storage(storage)
+        try:
+            response = await stream_content_map_events(
+                graph_id, token=bearer("alice-token")
+            )
+            body = ""
+            async for chunk in response.body_iterator:
+                body += chunk
+                if "snapshot" in chunk:
+                    # a worker elsewhere finishes the job: nothing is published in
+                    # this process, the relay picks it up from the job row
+                    await storage.update_graph(
+                        graph_id, {"status": "complete", "node_count": 3}
+                    )
+                    await storage.update_content_map_job(
+                        job["id"], {"status": "complete", "stage": "complete"}
+                    )
+            return graph_id, parse_events(body)
+        finally:
+            set_storage(None)
+
+    graph_id, events = asyncio.run(run())
+
+    assert events[0]["event"] == "snapshot" and events[0]["status"] == "queued"
+    assert events[-1]["event"] == "complete"
+    assert any(event.get("node_count") == 3 for event in events)
+    assert broker.subscriber_count(graph_id) == 0
+
+
+def test_another_users_graph_is_not_found(supabase_users):
+    supabase_users["bob-token"] = "bob"
+
+    async def run():
+        storage = MemoryStorage()
+        document_id, prompt_id = await seed(storage)
+        graph_id = await run_job(document_id, prompt_id, storage)
+        set_storage(storage)
+        try:
+            for route in (get_content_map_status, stream_content_map_events):
+                with pytest.raises(HTTPException) as error:
+                    await route(graph_id, token=bearer("bob-token"))
+                assert error.value.status_code == 404
+        finally:
+            set_storage(None)
+        return graph_id
+
+    graph_id = asyncio.run(run())
+    # bob never got as far as listening
+    assert broker.subscriber_count(graph_id) == 0
@@ -0,0 +1,177 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+
+from src.jobs.queue import enqueue_content_map_job, recover_stale_jobs
+from src.jobs.worker import ContentMapWorker
+from src.storage import MemoryStorage
+
+
+async def make_job(storage: MemoryStorage, user_id: str):
+    graph = await storage.insert_graph({"document_id": "doc"})
+    return await enqueue_content_map_job(graph["id"], "doc", user_id, None, storage)
+
+
+def make_worker(storage, process, **kwargs):
+    return ContentMapWorker(
+        storage, poll_seconds=0.01, heartbeat_seconds=60, process=process, **kwargs
+    )
+
+
+def test_worker_respects_per_user_and_global_caps():
+    async def run():
+        storage = MemoryStorage()
+        for user_id in ["alice", "alice", "bob", "carol"]:
+            await make_job(storage, user_id)
+        release = asyncio.Event()
+        started = []
+
+        async def process(job, storage, set_stage):
+            await set_stage("generating")
+            started.append(job["id"])
+            await release.wait()
+
+        worker = make_worker(storage, process, global_limit=2, per_user_limit=1)
+        assert await worker.poll() == 2
+        while len(started) < 2:
+            await asyncio.sleep(0)
+        running = await storage.get_content_map_jobs("running")
+        assert sorted(job["user_id"] for job in running) == ["alice", "bob"]
+        assert {job["stage"] for job in running} == {"generating"}
+        # at the global cap nothing more is claimed
+        assert await worker.poll() == 0
+
+        release.set()
+        await worker.drain()
+        assert await worker.poll() == 2
+        await worker.drain()
+
+        assert len(await storage.get_content_map_jobs("complete")) == 4
+        graphs = storage.tables["knowledge_graphs"]
+        assert {graph["status"] for graph in graphs} == {"complete"}
+
+    asyncio.run(run())
+
+
+def test_failed_job_is_retried_with_backoff_then_fails():
+    async def run():
+        storage = MemoryStorage()
+        job = await make_job(storage, "alice")
+
+        async def process(job, storage, set_stage):
+            raise RuntimeError("overloaded")
+
+        worker = make_worker(storage, process)
+        assert await worker.poll() == 1
+        await worker.drain()
+
+        job = await storage.get_content_map_job(job["graph_id"])
+        assert job["status"] == "queued" and job["attempts"] == 1
+        assert job["error_message"] == "overloaded"
+        # not runnable until the backoff has passed
+        assert await worker.poll() == 0
+
+        for attempt in range(2, 4):
+            await storage.update_content_map_job(
+                job["id"], {"run_after": datetime.now(timezone.utc).isoformat()}
+            )
+            assert await worker.poll() == 1
+            await worker.drain()
+
+        job = await storage.get_content_map_job(job["graph_id"])
+        assert job["status"] == "failed" and job["attempts"] == 3
+        graph = await storage.get_graph(job["graph_id"])
+        assert graph["status"] == "error"
+        assert graph["error_message"] == "overloaded"
+
+    asyncio.run(run())
+
+
+def test_permanent_errors_are_not_retried():
+    async def run():
+        storage = MemoryStorage()
+        job = await make_job(storage, "alice")
+
+        async def process(job, storage, set_stage):
+            raise HTTPException(status_code=404, detail="Document not found")
+
+        worker = make_worker(storage, process)
+        await worker.poll()
+        await worker.drain()
+
+        job = await storage.get_content_map_job(job["graph_id"])
+        assert job["status"] == "failed" and job["attempts"] == 1
+
+    asyncio.run(run())
+
+
+def test_stale_running_job_is_requeued():
+    async def run():
+        storage = MemoryStorage()
+        job = await make_job(storage, "alice")
+
+        async def process(job, storage, set_stage):
+            await asyncio.sleep(10)
+
+        crashed = make_worker(storage, process, worker_id="crashed")
+        await crashed.poll()
+        # the worker dies without cleaning up: its job stays "running"
+        for task in crashed.tasks.values():
+            task.cancel()
+        await crashed.drain()
+
+        running = await storage.get_content_map_jobs("running")
+        assert len(running) == 1
+        assert await recover_stale_jobs(running, storage) == []
+        later = datetime.now(timezone.utc) + timedelta(minutes=10)
+        assert len(await recover_stale_jobs(running, storage, later)) == 1
+
+        job = await storage.get_content_map_job(job["graph_id"])
+        assert job["status"] == "queued" and job["locked_by"] is None
+        assert "crashed" in job["error_message"]
+
+    asyncio.run(run())
+
+
+def test_capped_user_does_not_starve_the_queue(monkeypatch):
+    monkeypatch.setattr("src.jobs.worker.QUEUE_PAGE_SIZE", 3)
+
+    async def run():
+        storage = MemoryStorage()
+        for _ in range(7):
+            await make_job(storage, "alice")
+        await make_job(storage, "bob")
+        release = asyncio.Event()
+
+        async def process(job, storage, set_stage):
+            await release.wait()
+
+        worker = make_worker(storage, process, per_user_limit=1)
+        assert await worker.poll() == 2
+        running = await storage.get_content_map_jobs("running")
+        assert sorted(job["user_id"] for job in running) == ["alice", "bob"]
+
+        release.set()
+        await worker.drain()
+
+    asyncio.run(run())
+
+
+def test_stop_requeues_held_jobs():
+    async def run():
+        storage = MemoryStorage()
+        job = await make_job(storage, "alice")
+
+        async def process(job, storage, set_stage):
+            await asyncio.sleep(10)
+
+        worker = make_worker(storage, process)
+        assert await worker.poll() == 1
+        # stop before the job task has had a chance to run at all
+        await asyncio.wait_for(worker.stop(), 5)
+
+        job = await storage.get_content_map_job(job["graph_id"])
+        assert job["status"] == "queued" and job["attempts"] == 0
+
+    asyncio.run(run())
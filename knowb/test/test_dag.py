@@ -0,0 +1,49 @@
+from src.api.dag import analyse_content_map, analyse_dag
+from src.api.models import ContentMapEdge, ContentMapNode
+
+
+def test_cycle_edge_pointing_back_in_the_text_is_dropped():
+    analysis = analyse_dag(["a", "b", "c"], [("a", "b"), ("b", "c"), ("c", "a")])
+
+    assert analysis.cycle_edges == [("c", "a")]
+    assert analysis.edges == [("a", "b"), ("b", "c")]
+    assert analysis.levels == {"a": 0, "b": 1, "c": 2}
+
+
+def test_transitive_and_invalid_edges_are_dropped():
+    edges = [("a", "b"), ("b", "c"), ("a", "c"), ("a", "d"), ("a", "b"), ("b", "b")]
+    analysis = analyse_dag(["a", "b", "c", "d"], edges + [("a", "missing")])
+
+    assert analysis.redundant_edges == [("a", "c")]
+    assert analysis.edges == [("a", "b"), ("b", "c"), ("a", "d")]
+    assert analysis.invalid_edges == 3
+    assert analysis.levels == {"a": 0, "b": 1, "c": 2, "d": 1}
+
+
+def test_deep_chain_does_not_recurse():
+    ids = [f"n{i}" for i in range(5000)]
+    chain = list(zip(ids, ids[1:]))
+    analysis = analyse_dag(ids, chain + [(ids[0], ids[-1]), (ids[-1], ids[1])])
+
+    assert analysis.edges == chain
+    assert analysis.levels[ids[-1]] == len(ids) - 1
+
+
+def test_analyse_content_map_sets_levels():
+    nodes = [
+        ContentMapNode(
+            order_index=i, summary=f"Node {i}", content="", supporting_quotes=[]
+        )
+        for i in range(1, 4)
+    ]
+    a, b, c = (node.id for node in nodes)
+    edges = [
+        ContentMapEdge(parent_id=a, child_id=b),
+        ContentMapEdge(parent_id=a, child_id=c),
+        ContentMapEdge(parent_id=b, child_id=c),
+    ]
+
+    reduced = analyse_content_map(nodes, edges)
+
+    assert [(e.parent_id, e.child_id) for e in reduced] == [(a, b), (b, c)]
+    assert [node.topo_level for node in nodes] == [0, 1, 2]
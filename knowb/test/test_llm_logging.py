@@ -0,0 +1,169 @@
+import asyncio
+import copy
+import json
+import time
+
+import pytest
+
+from benchmarks.fakes import FakeAnthropic
+from benchmarks.generators import seed_storage
+from src.api.ai import session as chat_session
+from src.api.ai import logging as llm_logging
+from src.api.ai.logging import LLMCallLog
+from src.services.jsonl_log import SizeAndTimeRotatingFileHandler
+from src.services.metrics import LLMCallTimer
+from src.storage import MemoryStorage, set_storage
+
+PDF_DATA = "JVBERi0xLjQK" * 1000
+
+
+def document_request() -> dict:
+    return {
+        "model": "claude-3-5-sonnet-20241022",
+        "max_tokens": 10,
+        "headers": {"x-api-key": "secret"},
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "document",
+                        "source": {
+                            "type": "base64",
+                            "media_type": "application/pdf",
+                            "data": PDF_DATA,
+                        },
+                    },
+                    {"type": "text", "text": "Summarise this"},
+                ],
+            }
+        ],
+    }
+
+
+@pytest.fixture
+def call_log(tmp_path, monkeypatch):
+    log = LLMCallLog(str(tmp_path / "calls.jsonl"), console=False)
+    monkeypatch.setattr(llm_logging, "call_log", log)
+    yield log, tmp_path / "calls.jsonl"
+    log.close()
+
+
+def read_entries(path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_sampled_payload_is_redacted_without_touching_the_request(
+    call_log, monkeypatch
+):
+    log, path = call_log
+    monkeypatch.setattr(llm_logging, "PAYLOAD_SAMPLE_RATE", 1.0)
+    received = []
+
+    @llm_logging.log_anthropic_call
+    def call(**kwargs):
+        received.append(copy.deepcopy(kwargs))
+        return {"content": "ok"}
+
+    request = document_request()
+    original = copy.deepcopy(request)
+    call(**request)
+    log.flush()
+
+    # neither the request we sent nor our copy of it was redacted
+    assert received == [original] and request == original
+    (entry,) = read_entries(path)
+    assert entry["status"] == "ok" and entry["model"] == original["model"]
+    logged = entry["payload"]["request"]
+    assert logged["messages"][0]["content"][0]["source"]["data"].startswith("<12000")
+    assert logged["headers"]["x-api-key"] == "<redacted>"
+    assert entry["payload"]["response"] == {"content": "ok"}
+
+
+def test_unsampled_calls_log_metadata_and_failures_log_payload(call_log, monkeypatch):
+    log, path = call_log
+    monkeypatch.setattr(llm_logging, "PAYLOAD_SAMPLE_RATE", 0.0)
+
+    @llm_logging.log_anthropic_call
+    def call(**kwargs):
+        if kwargs["max_tokens"] == 0:
+            raise ValueError("max_tokens must be positive")
+        return {"content": "ok"}
+
+    call(**document_request())
+    with pytest.raises(ValueError):
+        call(**{**document_request(), "max_tokens": 0})
+    log.flush()
+
+    ok, failed = read_entries(path)
+    assert "payload" not in ok and ok["latency_ms"] >= 0
+    assert failed["status"] == "error" and "max_tokens" in failed["error"]
+    assert failed["payload"]["request"]["max_tokens"] == 0
+
+
+def test_log_file_rotates_by_size_and_by_age(tmp_path):
+    log = LLMCallLog(
+        str(tmp_path / "calls.jsonl"),
+        max_bytes=300,
+        rotate_seconds=3600,
+        backups=5,
+        console=False,
+    )
+    entry = {"provider": "test", "model": "m", "status": "ok", "latency_ms": 1.0}
+    for _ in range(5):
+        log.log(dict(entry))
+    log.flush()
+    assert len(list(tmp_path.glob("calls.jsonl.*"))) >= 1
+    assert all(p.stat().st_size <= 300 for p in tmp_path.glob("calls.jsonl*"))
+
+    # time-based: once the interval has passed, the next record starts a new file
+    (file_handler,) = [
+        handler
+        for handler in log.listener.handlers
+        if isinstance(handler, SizeAndTimeRotatingFileHandler)
+    ]
+    backups = len(list(tmp_path.glob("calls.jsonl.*")))
+    file_handler.rollover_at = time.time() - 1
+    log.log(dict(entry))
+    log.flush()
+    log.close()
+    assert len(list(tmp_path.glob("calls.jsonl.*"))) == backups + 1
+    assert len(read_entries(tmp_path / "calls.jsonl")) == 1
+
+
+def test_the_apps_model_calls_are_logged(call_log, monkeypatch):
+    log, path = call_log
+    monkeypatch.setattr(llm_logging, "PAYLOAD_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(chat_session, "STREAM_CHUNK_DELAY", 0)
+
+    async def run():
+        storage = MemoryStorage()
+        ids = await seed_storage(storage, n_nodes=5)
+
+        async def user_id(token):
+            return ids["user_id"]
+
+        monkeypatch.setattr(chat_session, "get_user_id_from_token", user_id)
+        client = FakeAnthropic(n_chunks=3, tool_use={"node_id": 1, "judgement": "good"})
+        set_storage(storage)
+        try:
+            async for _ in chat_session.handle_chat_stream(
+                "What is a parity bit?", ids["session_id"], None, client
+            ):
+                pass
+        finally:
+            set_storage(None)
+
+    asyncio.run(run())
+    LLMCallTimer("claude-3-5-sonnet-20241022").fail(TimeoutError("read timed out"))
+    log.flush()
+
+    # the streamed reply and the reply to the tool result, then the failed call
+    reply, tool_result, failed = read_entries(path)
+    assert reply["status"] == tool_result["status"] == "ok"
+    assert reply["usage"]["input_tokens"] == 1000 and reply["cost_usd"] > 0
+    assert reply["payload"]["request"]["messages"][-1]["content"] == (
+        "What is a parity bit?"
+    )
+    assert reply["payload"]["response"]["stop_reason"] == "tool_use"
+    assert failed["status"] == "error" and "timed out" in failed["error"]
@@ -0,0 +1,61 @@
+import asyncio
+
+import anthropic
+import httpx
+
+from loadtest.fake_anthropic import FakeAnthropicConfig, create_fake_anthropic_app
+from loadtest.runner import compare_reports, summarise
+
+
+def test_fake_anthropic_streams_tool_use_through_sdk():
+    app = create_fake_anthropic_app(
+        FakeAnthropicConfig(
+            tokens_per_second=10_000,
+            first_token_delay=0,
+            output_tokens=5,
+            tool_use_rate=1.0,
+            seed=0,
+        )
+    )
+    client = anthropic.AsyncAnthropic(
+        api_key="test",
+        base_url="http://fake",
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=app)),
+    )
+
+    async def run():
+        async with client.beta.prompt_caching.messages.stream(
+            model="claude-3-5-sonnet-20241022",
+            max_tokens=100,
+            messages=[{"role": "user", "content": "hi"}],
+            tools=[{"name": "node_complete", "input_schema": {"type": "object"}}],
+        ) as stream:
+            text = "".join([t async for t in stream.text_stream])
+            return text, await stream.get_final_message()
+
+    text, message = asyncio.run(run())
+
+    assert len(text.split()) == 5
+    assert message.stop_reason == "tool_use"
+    tool_use = message.content[1]
+    assert tool_use.name == "node_complete"
+    assert set(tool_use.input) == {"node_id", "judgement"}
+    assert app.state.stats.streams == 1
+
+
+def test_compare_reports():
+    def level(ttfb_p50):
+        return {
+            "concurrency": 5,
+            "error_rate": 0.0,
+            "requests_per_s": 2.0,
+            "chunks_per_s": 40.0,
+            "ttfb_ms": {"p50": ttfb_p50, "p95": 400.0},
+            "inter_chunk_ms": {"p95": 25.0, "p99": 30.0},
+        }
+
+    diff = compare_reports({"levels": [level(200.0)]}, {"levels": [level(100.0)]})
+
+    assert "concurrency 5:" in diff
+    assert "ttfb_ms.p50" in diff and "(-50%)" in diff
+    assert summarise([])["p95"] == 0.0
@@ -0,0 +1,149 @@
+import json
+
+import anthropic
+from starlette.testclient import TestClient
+
+from benchmarks.generators import make_pdf
+from loadtest.fake_anthropic import (
+    FakeAnthropicConfig,
+    FakeReply,
+    create_fake_anthropic_app,
+)
+from src.api.ai import repair
+from src.api.ai.make_map import make_content_map
+from src.api.ai.usage import UsageLog
+from src.users.user_settings import UserPrompt
+
+USER_PROMPT = UserPrompt(
+    id="prompt", prompt_texts={"brainstorm_prompt": "Think.", "final_prompt": "Map."}
+)
+
+GRAPH = {
+    "nodes": [
+        {
+            "order_index": i,
+            "summary": f"Concept {i}",
+            "content": "...",
+            "supporting_quotes": [],
+        }
+        for i in (1, 2)
+    ],
+    "edges": [{"parent_index": 1, "child_index": 2}],
+}
+
+
+def responder(body: dict) -> FakeReply:
+    if len(body["messages"]) == 1:
+        return FakeReply(tokens=["Some brainstorming."])
+    return FakeReply(tokens=[], tool_use=GRAPH, tool_name="save_content_map")
+
+
+def make_client(responder):
+    app = create_fake_anthropic_app(
+        FakeAnthropicConfig(tokens_per_second=1e6, first_token_delay=0), responder
+    )
+    client = anthropic.Anthropic(
+        api_key="test", base_url="http://testserver", http_client=TestClient(app)
+    )
+    return client, app
+
+
+def test_brainstorm_is_free_text_and_the_final_call_forces_the_tool():
+    requests = []
+
+    def respond(body: dict) -> FakeReply:
+        requests.append(body)
+        return responder(body)
+
+    client, app = make_client(respond)
+    usage = UsageLog()
+
+    nodes, edges = make_content_map(
+        make_pdf(3, lines_per_page=5), USER_PROMPT, client, usage
+    )
+
+    assert [node.summary for node in nodes] == ["Concept 1", "Concept 2"]
+    assert len(edges) == 1
+
+    brainstorm, final = requests
+    # a brainstorm can't come back as a tool call with only its text kept
+    assert "tools" not in brainstorm
+    assert final["tool_choice"] == {"type": "tool", "name": "save_content_map"}
+    assert final["messages"][1] == {
+        "role": "assistant",
+        "content": "Some brainstorming.",
+    }
+
+    # the first call writes the document + brainstorm prompt to the cache, which a
+    # retried job's brainstorm reads back
+    assert usage.stages[0].cache_creation_input_tokens > 0
+    retry = UsageLog()
+    make_content_map(make_pdf(3, lines_per_page=5), USER_PROMPT, client, retry)
+    assert (
+        retry.stages[0].cache_read_input_tokens
+        == usage.stages[0].cache_creation_input_tokens
+    )
+    assert retry.tokens_saved > 0
+    assert app.state.stats.cache_read_input_tokens > 0
+
+
+def node(i: int, **changes) -> dict:
+    return {
+        "order_index": i,
+        "summary": f"Concept {i}",
+        "content": "...",
+        "supporting_quotes": [],
+        **changes,
+    }
+
+
+def tool_responder(requests: list):
+    def respond(body: dict) -> FakeReply:
+        requests.append(body)
+        text = json.dumps(body["messages"])
+        if len(body["messages"]) == 1 and "were invalid" in text:
+            # the repair request: node 2 fixed, the edge to the missing node 3 dropped
+            graph = {
+                "nodes": [node(2)],
+                "edges": [{"parent_index": 1, "child_index": 2}],
+            }
+        elif len(body["messages"]) == 1:
+            return FakeReply(tokens=["Some brainstorming."])
+        else:
+            # node 2 has no summary; one edge names a node 3 that doesn't exist
+            graph = {
+                "nodes": [node(1), node(2, summary=None), node(4)],
+                "edges": [
+                    {"parent_index": 1, "child_index": 4},
+                    {"parent_index": 2, "child_index": 3},
+                ],
+            }
+        return FakeReply(tokens=[], tool_use=graph, tool_name="save_content_map")
+
+    return respond
+
+
+def test_invalid_tool_output_is_repaired_without_a_rerun(monkeypatch):
+    monkeypatch.setattr(repair, "repair_stats", repair.RepairStats())
+    requests = []
+    client, _ = make_client(tool_responder(requests))
+    usage = UsageLog()
+    streamed = []
+
+    nodes, edges = make_content_map(
+        make_pdf(3, lines_per_page=5), USER_PROMPT, client, usage, streamed.append
+    )
+
+    assert [node.summary for node in nodes] == ["Concept 1", "Concept 2", "Concept 4"]
+    # the repaired node is handed over like the streamed ones
+    assert sorted(node.order_index for node in streamed) == [1, 2, 4]
+    by_id = {node.id: node.order_index for node in nodes}
+    assert {(by_id[e.parent_id], by_id[e.child_id]) for e in edges} == {(1, 4), (1, 2)}
+
+    # brainstorm, final and one small repair call: no second pass over the document
+    assert len(requests) == 3
+    assert "document" not in json.dumps(requests[2])
+    assert [stage.stage for stage in usage.stages] == ["brainstorm", "final", "repair"]
+    assert repair.repair_stats.repaired == repair.repair_stats.outputs == 1
+    assert repair.repair_stats.repair_rate == 1.0
+    assert repair.repair_stats.tokens_saved > 0
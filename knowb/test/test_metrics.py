@@ -0,0 +1,75 @@
+import asyncio
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from main import app
+from src.services import metrics
+from src.services.metrics import LLMCallTimer
+from src.storage.sqlite_storage import SQLiteStorage
+
+
+def test_routes_db_calls_and_llm_calls_show_up_in_metrics(tmp_path):
+    client = TestClient(app)
+    client.get("/api/content_map/status/missing")
+    before = metrics.DB_QUERY_DURATION.count(table="documents", operation="select")
+
+    storage = SQLiteStorage(str(tmp_path / "db.sqlite"))
+    asyncio.run(storage.get_document("missing"))
+
+    model = "claude-3-5-sonnet-20241022"
+    cost_before = metrics.LLM_COST.value(model=model)
+    timer = LLMCallTimer(model)
+    timer.first_token()
+    timer.finish(
+        SimpleNamespace(
+            input_tokens=1000,
+            output_tokens=100,
+            cache_creation_input_tokens=0,
+            cache_read_input_tokens=10000,
+        )
+    )
+
+    text = client.get("/metrics").text
+    assert 'http_request_duration_seconds_count{router="content_map",method="GET"' in (
+        text
+    )
+    assert metrics.DB_QUERY_DURATION.count(table="documents", operation="select") == (
+        before + 1
+    )
+    assert f'llm_tokens_total{{model="{model}",kind="cache_read"}} 10000' in text
+    assert f'llm_time_to_first_token_seconds_count{{model="{model}"}}' in text
+    # 1000 * $3 + 100 * $15 + 10000 * $0.30 per million tokens
+    cost = metrics.LLM_COST.value(model=model) - cost_before
+    assert round(cost, 6) == 0.0075
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("test_seconds", "test", ("name",), buckets=(1, 2))
+    metrics._registry.remove(histogram)
+    for value in (0.5, 1.5, 1.5, 5):
+        histogram.observe(value, name="a")
+
+    assert histogram.samples() == [
+        'test_seconds_bucket{name="a",le="1"} 1',
+        'test_seconds_bucket{name="a",le="2"} 3',
+        'test_seconds_bucket{name="a",le="+Inf"} 4',
+        'test_seconds_sum{name="a"} 8.5',
+        'test_seconds_count{name="a"} 4',
+    ]
+
+
+def test_active_streams_gauge_drops_when_the_client_goes_away():
+    async def events():
+        for i in range(10):
+            yield i
+
+    async def run():
+        stream = metrics.track_stream("test", events())
+        await stream.__anext__()
+        open_streams = metrics.SSE_ACTIVE_STREAMS.value(stream="test")
+        await stream.aclose()
+        return open_streams
+
+    assert asyncio.run(run()) == 1
+    assert metrics.SSE_ACTIVE_STREAMS.value(stream="test") == 0
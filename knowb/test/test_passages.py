@@ -0,0 +1,68 @@
+import asyncio
+
+from benchmarks.generators import seed_storage
+from src.api import passages
+from src.api.ai.prompts import get_session_system_prompt
+from src.api.ai.tokens import count_tokens
+from src.api.passages import (
+    Passage,
+    PassageIndex,
+    chunk_pages,
+    get_passage_index,
+)
+from src.storage import MemoryStorage
+
+PAGES = [
+    "Parity bits detect single-bit errors in transmitted data.\n\n"
+    "A parity bit is set so that the number of ones is even.",
+    "Hamming codes correct single-bit errors using several parity bits.",
+    "Checksums add up the bytes of a message. " * 20,
+]
+
+
+def test_passages_stay_on_their_page_and_under_the_size_limit():
+    chunks = chunk_pages(PAGES, max_chars=120)
+
+    assert {passage.page for passage in chunks} == {1, 2, 3}
+    assert all(len(passage.text) <= 120 for passage in chunks)
+    # the two short paragraphs of page 1 share a passage
+    assert chunks[0].page == 1 and "number of ones" in chunks[0].text
+
+
+def test_bm25_ranks_the_relevant_passage_first_within_the_budget():
+    index = PassageIndex.from_dict(
+        PassageIndex.build(chunk_pages(PAGES, max_chars=120)).to_dict()
+    )
+
+    best = index.passages[index.search("How do Hamming codes correct errors?", 1)[0][1]]
+    assert best.page == 2
+
+    selected = index.select("parity bits and checksums", k=10, token_budget=60)
+    assert sum(count_tokens(passage.text) for passage in selected) <= 60
+    assert [passage.page for passage in selected] == sorted(
+        passage.page for passage in selected
+    )
+    # nothing matches: fall back to the opening of the document
+    assert index.select("zebra", k=1)[0] == Passage(1, index.passages[0].text)
+
+
+def test_session_prompt_indexes_the_document_once():
+    async def run():
+        storage = MemoryStorage()
+        ids = await seed_storage(storage, n_nodes=5, n_pages=3)
+        passages._loaded.clear()
+        prompt = await get_session_system_prompt(
+            ids["session_id"], storage, "What is a parity bit?"
+        )
+        stored = await storage.get_document_passages(ids["document_id"])
+
+        # later turns (in another process too) reuse the stored index
+        passages._loaded.clear()
+        index = await get_passage_index(ids["document_id"], storage)
+        return prompt, stored, index
+
+    prompt, stored, index = asyncio.run(run())
+
+    assert "[page " in prompt
+    assert len(stored["passage_index"]["passages"]) == len(index.passages) > 3
+    assert stored["content_hash"]
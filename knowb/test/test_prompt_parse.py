@@ -1,5 +1,14 @@
+import json
+
 import pytest
-from src.api.ai.prompts import parse_graph_output
+from src.api.ai.prompts import (
+    format_node_for_session_prompt,
+    pack_nodes,
+    parse_graph_output,
+)
+from src.api.ai.tokens import count_tokens
+from src.api.models import ContentMapNode
+from src.api.ai.stream_parse import GraphStreamParser
 
 
 # Example valid output string
@@ -83,3 +92,83 @@ def test_parse_graph_output_claude():
 
     assert len(nodes) == 11
     assert len(edges) == 13
+
+
+def feed_in_pieces(parser: GraphStreamParser, output: str, size: int = 7):
+    nodes = []
+    for start in range(0, len(output), size):
+        nodes += parser.feed(output[start : start + size])
+    return nodes
+
+
+def test_stream_parser_matches_parse_graph_output():
+    parser = GraphStreamParser()
+    streamed = feed_in_pieces(parser, VALID_OUTPUT_CLAUDE)
+    nodes, edges = parser.finish()
+
+    expected_nodes, expected_edges = parse_graph_output(VALID_OUTPUT_CLAUDE)
+    assert [node.summary for node in streamed] == [n.summary for n in expected_nodes]
+    assert nodes == streamed
+    assert len(edges) == len(expected_edges)
+
+
+def test_stream_parser_emits_nodes_as_they_close():
+    parser = GraphStreamParser()
+    assert parser.feed('NODES\n[{"order_index": 1, "summary": "A {brace}"') == []
+    nodes = parser.feed(', "content": "x", "supporting_quotes": []}, {"order')
+    assert [node.summary for node in nodes] == ["A {brace}"]
+
+
+def test_stream_parser_recovers_from_a_malformed_tail():
+    # the second node is invalid and the output stops halfway through the edges
+    output = VALID_OUTPUT_SIMPLE.replace('"order_index": 2,', '"order_index": 2,,')
+    output = output[: output.index('{"parent_index"')]
+    output += '{"parent_index": 1, "child_index": 2}, {"parent_index": 1, "chi'
+    parser = GraphStreamParser()
+    feed_in_pieces(parser, output)
+    nodes, edges = parser.finish()
+
+    assert [node.summary for node in nodes] == ["First concept"]
+    assert parser.skipped == 1 and parser.truncated
+    # the edge parsed, but it points at the node that didn't
+    assert len(parser.edges_pre) == 1 and edges == []
+
+
+def test_stream_parser_without_nodes_raises():
+    parser = GraphStreamParser()
+    parser.feed("Just brainstorming, no graph")
+    with pytest.raises(ValueError):
+        parser.finish()
+
+
+def make_node(i: int, quote_chars: int = 1000) -> ContentMapNode:
+    return ContentMapNode(
+        order_index=i,
+        summary=f"Concept {i}",
+        content=f"What concept {i} says, in a sentence or two.",
+        supporting_quotes=["quoted text " * (quote_chars // 12)],
+    )
+
+
+def test_pack_nodes_shortens_quotes_before_dropping_nodes():
+    nodes = [make_node(i) for i in range(1, 6)]
+    full = [count_tokens(format_node_for_session_prompt(node)) for node in nodes]
+
+    # everything fits: nothing changes
+    assert pack_nodes(nodes, token_budget=sum(full)) == [
+        format_node_for_session_prompt(node) for node in nodes
+    ]
+
+    # a little short: the last nodes' quotes give way, every node stays
+    packed = pack_nodes(nodes, token_budget=sum(full) - 100)
+    assert len(packed) == 5
+    assert packed[0] == format_node_for_session_prompt(nodes[0])
+    assert json.loads(packed[-1])["supporting_quotes"][0].endswith("...")
+
+    # far too short: quotes go, then the least urgent nodes
+    packed = pack_nodes(nodes, token_budget=60)
+    assert 1 <= len(packed) < 5
+    assert [json.loads(node)["id"] for node in packed] == list(
+        range(1, len(packed) + 1)
+    )
+    assert all("supporting_quotes" not in json.loads(node) for node in packed)
@@ -0,0 +1,87 @@
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from main import app
+from src.api.ai.chat_socket import CLOSE_UNAUTHORIZED
+from src.api.routes import speech
+from src.api.stt import google_stt
+from src.services.security import security
+
+
+@pytest.fixture
+def speech_socket(monkeypatch, recognizer, supabase_users):
+    supabase_users["good-token"] = "user-1"
+    monkeypatch.setattr(speech, "get_recognizer", lambda: recognizer)
+    return recognizer
+
+
+def test_streaming_returns_interim_transcripts_while_audio_arrives(speech_socket):
+    with TestClient(app).websocket_connect("/api/speech-to-text/ws") as websocket:
+        websocket.send_json({"type": "auth", "token": "good-token"})
+        assert websocket.receive_json() == {"type": "ready"}
+
+        # each chunk is transcribed before the next one is sent
+        websocket.send_bytes(b"what is")
+        assert websocket.receive_json() == {
+            "type": "transcript",
+            "text": "what is",
+            "final": False,
+        }
+        websocket.send_bytes(b"a parity bit")
+        assert websocket.receive_json()["text"] == "what is a parity bit"
+
+        websocket.send_json({"type": "end"})
+        assert websocket.receive_json() == {
+            "type": "transcript",
+            "text": "what is a parity bit",
+            "final": True,
+        }
+        assert websocket.receive_json() == {
+            "type": "end",
+            "text": "what is a parity bit",
+        }
+    assert speech_socket.chunks == [b"what is", b"a parity bit"]
+
+
+def test_whole_recording_uses_the_pooled_async_client(monkeypatch):
+    requests = []
+
+    def google(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(
+            200,
+            json={
+                "results": [
+                    {"alternatives": [{"transcript": "hello"}]},
+                    {"alternatives": [{"transcript": " there"}]},
+                ]
+            },
+        )
+
+    monkeypatch.setattr(
+        google_stt,
+        "_http_client",
+        httpx.AsyncClient(transport=httpx.MockTransport(google)),
+    )
+    app.dependency_overrides[security] = lambda: "token"
+    try:
+        client = TestClient(app)
+        for _ in range(2):
+            response = client.post(
+                "/api/speech-to-text", json={"audio": "AAAA", "session_id": "s"}
+            )
+            assert response.json() == {"text": "hello there"}
+    finally:
+        app.dependency_overrides.clear()
+    assert len(requests) == 2
+    assert requests[0].url.path == "/v1/speech:recognize"
+
+
+def test_streaming_rejects_an_unknown_token(speech_socket):
+    with TestClient(app).websocket_connect("/api/speech-to-text/ws") as websocket:
+        websocket.send_json({"type": "auth", "token": "bad-token"})
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+    assert closed.value.code == CLOSE_UNAUTHORIZED
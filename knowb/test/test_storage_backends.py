@@ -0,0 +1,209 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.api.graph import (
+    GraphNode,
+    build_graph,
+    get_graph_learning_state,
+    rank_unlocked_nodes,
+)
+from src.api.learning_progress import delete_learning_progress, update_learning_progress
+from src.api.models import (
+    ContentMapNode,
+    LearningProgressUpdateData,
+    LearningProgressUpdateRequest,
+)
+from src.jobs.persist import save_graph, stage_in_batches
+from src.storage import MemoryStorage, SQLiteStorage, Storage
+
+
+async def seed_graph(storage: Storage, n_nodes: int = 3) -> str:
+    document = await storage.insert_document(
+        {
+            "user_id": str(uuid.uuid4()),
+            "title": "Doc",
+            "file_size": 4,
+            "storage_path": "doc.pdf",
+        }
+    )
+    graph = await storage.insert_graph({"document_id": document["id"]})
+    await storage.insert_nodes(
+        [
+            {
+                "id": f"node_{i}",
+                "graph_id": graph["id"],
+                "summary": f"Node {i}",
+                "content": f"Content {i}",
+                "supporting_quotes": [f"Quote {i}"],
+                "order_index": i,
+            }
+            for i in range(1, n_nodes + 1)
+        ]
+    )
+    await storage.insert_edges(
+        [
+            {
+                "parent_id": f"node_{i}",
+                "child_id": f"node_{i + 1}",
+                "graph_id": graph["id"],
+            }
+            for i in range(1, n_nodes)
+        ]
+    )
+    return graph["id"]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def storage(request) -> Storage:
+    return MemoryStorage() if request.param == "memory" else SQLiteStorage()
+
+
+def test_graph_defaults_and_build(storage):
+    async def run():
+        graph_id = await seed_graph(storage)
+        graph_row = await storage.get_graph(graph_id)
+        graph = await build_graph(graph_id, storage)
+        return graph_row, graph
+
+    graph_row, graph = asyncio.run(run())
+
+    assert graph_row["status"] == "processing"
+    assert graph_row["created_at"] is not None
+    assert graph["node_1"].unlocked
+    assert not graph["node_2"].unlocked
+    assert graph["node_1"].node.supporting_quotes == ["Quote 1"]
+
+
+def test_learning_update_flow(storage):
+    async def run():
+        graph_id = await seed_graph(storage)
+        request = LearningProgressUpdateRequest(
+            node_id="node_1",
+            graph_id=graph_id,
+            user_id=str(uuid.uuid4()),
+            created_at=datetime.now(),
+            update_data=LearningProgressUpdateData(quality="good"),
+        )
+        await update_learning_progress(request, storage)
+        progress = await storage.get_learning_progress_for_node("node_1")
+        state = await get_graph_learning_state(graph_id, datetime.now(), storage)
+        graph = await build_graph(graph_id, storage)
+        await delete_learning_progress("node_1", storage)
+        deleted = await storage.get_learning_progress_for_node("node_1")
+        return progress, state, graph, deleted
+
+    progress, state, graph, deleted = asyncio.run(run())
+
+    assert progress["version"] == 2
+    assert len(progress["spaced_rep_state"]["review_history"]) == 1
+    assert [n.node.id for n in state.past] == ["node_1"]
+    assert [n.node.id for n in state.not_yet_learned] == ["node_2", "node_3"]
+    assert graph["node_2"].unlocked and not graph["node_1"].unlocked
+    assert deleted is None
+
+
+def test_delete_graph_cascades(storage):
+    async def run():
+        graph_id = await seed_graph(storage)
+        await storage.delete_graph(graph_id)
+        return await storage.get_nodes(graph_id), await storage.get_edges(graph_id)
+
+    nodes, edges = asyncio.run(run())
+
+    assert nodes == [] and edges == []
+
+
+def test_save_graph_replaces_rows_in_one_commit(storage):
+    async def run():
+        graph_id = await seed_graph(storage)
+        nodes = [
+            {
+                "id": f"node_new{i}",
+                "summary": f"New {i}",
+                "content": "",
+                "supporting_quotes": [],
+                "order_index": i,
+            }
+            for i in range(1, 6)
+        ]
+        edges = [{"parent_id": "node_new1", "child_id": "node_new5"}]
+
+        # staging alone leaves the old graph untouched
+        await stage_in_batches(graph_id, "nodes", nodes[:2], storage, batch_size=1)
+        assert len(await storage.get_nodes(graph_id)) == 3
+
+        levels = [
+            {"id": "node_new1", "topo_level": 0},
+            {"id": "node_new5", "topo_level": 1},
+        ]
+        result = await save_graph(
+            graph_id,
+            nodes[2:],
+            edges,
+            storage,
+            batch_size=2,
+            staged_batches=2,
+            levels=levels,
+        )
+        assert (result.nodes, result.edges, result.batches) == (5, 1, 6)
+        saved = await storage.get_nodes(graph_id)
+        assert sorted(node["summary"] for node in saved) == [
+            f"New {i}" for i in range(1, 6)
+        ]
+        assert [
+            (e["parent_id"], e["child_id"]) for e in await storage.get_edges(graph_id)
+        ] == [("node_new1", "node_new5")]
+        assert {node["id"]: node["topo_level"] for node in saved} == {
+            "node_new1": 0,
+            "node_new2": None,
+            "node_new3": None,
+            "node_new4": None,
+            "node_new5": 1,
+        }
+        graph = await storage.get_graph(graph_id)
+        assert (graph["node_count"], graph["edge_count"]) == (5, 1)
+        assert await storage.discard_staged_graph(graph_id) == []
+
+    asyncio.run(run())
+
+
+def test_unlocked_nodes_rank_due_reviews_first():
+    now = datetime.now()
+
+    def graph_node(i, state, next_review=None, unlocked=True):
+        node = ContentMapNode(
+            id=f"node_{i}",
+            summary=f"Node {i}",
+            content="",
+            supporting_quotes=[],
+            order_index=i,
+        )
+        return GraphNode(
+            node=node,
+            state=state,
+            children=[],
+            parents=[],
+            unlocked=unlocked,
+            next_review=next_review,
+        )
+
+    graph = {
+        node.node.id: node
+        for node in [
+            graph_node(1, "not_yet_learned"),
+            graph_node(2, "to_review", now - timedelta(days=1)),
+            graph_node(3, "past", now + timedelta(days=1), unlocked=False),
+            graph_node(4, "to_review", now - timedelta(days=3)),
+            graph_node(5, "not_yet_learned"),
+        ]
+    }
+
+    assert [node.node.order_index for node in rank_unlocked_nodes(graph)] == [
+        4,
+        2,
+        1,
+        5,
+    ]
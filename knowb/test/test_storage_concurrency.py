@@ -0,0 +1,82 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from src.api.graph import build_graph
+from src.storage.supabase_storage import SupabaseStorage
+
+QUERY_LATENCY = 0.05
+CONCURRENT_REQUESTS = 12
+
+
+class SlowQuery:
+    """Mimics the chained postgrest query builder, sleeping on execute like a real round-trip."""
+
+    def __init__(self, rows: list[dict]):
+        self.rows = rows
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def eq(self, column, value):
+        return SlowQuery([row for row in self.rows if row.get(column) == value])
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def limit(self, n):
+        return SlowQuery(self.rows[:n])
+
+    def execute(self):
+        time.sleep(QUERY_LATENCY)
+        return SimpleNamespace(data=self.rows)
+
+
+class SlowClient:
+    def __init__(self, tables: dict[str, list[dict]]):
+        self.tables = tables
+
+    def from_(self, table: str):
+        return SlowQuery(self.tables.get(table, []))
+
+
+def make_tables(graph_id: str, n_nodes: int = 5) -> dict[str, list[dict]]:
+    nodes = [
+        {
+            "id": f"node_{i}",
+            "graph_id": graph_id,
+            "summary": f"Node {i}",
+            "content": f"Content {i}",
+            "supporting_quotes": [],
+            "order_index": i,
+        }
+        for i in range(n_nodes)
+    ]
+    edges = [
+        {"parent_id": f"node_{i}", "child_id": f"node_{i + 1}", "graph_id": graph_id}
+        for i in range(n_nodes - 1)
+    ]
+    return {"graph_nodes": nodes, "graph_edges": edges, "learning_progress": []}
+
+
+def test_build_graph_does_not_block_event_loop():
+    storage = SupabaseStorage(SlowClient(make_tables("graph_1")))
+
+    async def load():
+        start = time.perf_counter()
+        graphs = await asyncio.gather(
+            *(build_graph("graph_1", storage) for _ in range(CONCURRENT_REQUESTS))
+        )
+        return graphs, time.perf_counter() - start
+
+    graphs, elapsed = asyncio.run(load())
+
+    assert all(len(graph) == 5 for graph in graphs)
+    assert graphs[0]["node_0"].unlocked and not graphs[0]["node_1"].unlocked
+
+    # Run serially on the event loop this would take 3 queries x N requests x latency
+    serial = 3 * CONCURRENT_REQUESTS * QUERY_LATENCY
+    print(
+        f"{CONCURRENT_REQUESTS} concurrent build_graph calls: {elapsed:.3f}s (serial: {serial:.3f}s)"
+    )
+    assert elapsed < serial / 4
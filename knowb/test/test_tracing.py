@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+from benchmarks.fakes import FakeAnthropic
+from benchmarks.generators import seed_storage
+from src.api.ai import session as chat_session
+from src.services import tracing
+from src.services.tracing import span, start_trace
+from src.storage import MemoryStorage, set_storage
+
+
+def test_chat_turn_is_traced_end_to_end(tmp_path, monkeypatch):
+    trace_file = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "TRACE_FILE", str(trace_file))
+    monkeypatch.setattr(tracing, "TRACE_EXPORTER", "file")
+    monkeypatch.setattr(tracing, "SLOW_TRACE_SECONDS", 0)
+    monkeypatch.setattr(chat_session, "STREAM_CHUNK_DELAY", 0)
+
+    async def run():
+        storage = MemoryStorage()
+        ids = await seed_storage(storage, n_nodes=5)
+
+        async def user_id(token):
+            return ids["user_id"]
+
+        monkeypatch.setattr(chat_session, "get_user_id_from_token", user_id)
+        set_storage(storage)
+        try:
+            client = FakeAnthropic(
+                n_chunks=3, tool_use={"node_id": 1, "judgement": "good"}
+            )
+            return [
+                event
+                async for event in chat_session.handle_chat_stream(
+                    "What is a parity bit?", ids["session_id"], None, client
+                )
+            ]
+        finally:
+            set_storage(None)
+
+    events = asyncio.run(run())
+    tracing.flush()
+
+    assert events[-1] == "[END]"
+    (trace,) = [json.loads(line) for line in trace_file.read_text().splitlines()]
+    spans = {span["name"]: span for span in trace["spans"]}
+    assert trace["name"] == "chat.turn" and spans["chat.turn"]["parent_id"] is None
+    assert spans["llm.stream"]["attributes"]["chunks"] == 3
+    assert "llm.stream.tool_result" in spans
+    # helpers called in gathered tasks still nest under the turn
+    context = spans["chat.context"]["span_id"]
+    assert spans["prompts.get_session_system_prompt"]["parent_id"] == context
+    post_process = spans["session.post_process_ai_response"]
+    assert post_process["parent_id"] == spans["chat.tool_use"]["span_id"]
+    update = spans["learning_progress.update_learning_progress"]
+    assert update["parent_id"] == post_process["span_id"]
+    assert "graph.build_graph" in spans and "data.session_id_to_graph_id" in spans
+
+
+def test_fast_traces_are_not_exported_and_spans_need_a_trace(monkeypatch):
+    exported = []
+    monkeypatch.setattr(tracing, "export", exported.append)
+    monkeypatch.setattr(tracing, "SLOW_TRACE_SECONDS", 60)
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 0)
+
+    with span("outside") as outside:
+        assert outside is None
+    with start_trace("fast"):
+        pass
+    try:
+        with start_trace("failing"):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+
+    # only the failed trace is exported
+    assert [trace.name for trace in exported] == ["failing"]
+    assert exported[0].root.error == "ValueError: boom"
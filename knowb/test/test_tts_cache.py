@@ -0,0 +1,72 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+from src.api.tts import TTSService
+from src.api.tts.cache import AudioCache, audio_cache_key
+from src.services.metrics import TTS_CACHE_LOOKUPS
+
+
+class FakeTextToSpeechClient:
+    def __init__(self):
+        self.requests = []
+
+    async def synthesize_speech(self, input, voice, audio_config):
+        self.requests.append(input.text)
+        return SimpleNamespace(audio_content=f"mp3:{input.text}".encode())
+
+
+def test_memory_then_disk_tier(tmp_path):
+    async def run():
+        key = audio_cache_key("Well done!", voice="a")
+        assert key != audio_cache_key("Well done!", voice="b")
+
+        cache = AudioCache(str(tmp_path), memory_bytes=1024, disk_bytes=1024)
+        assert await cache.get(key) is None
+        await cache.put(key, b"audio")
+        memory_hits = TTS_CACHE_LOOKUPS.value(tier="memory")
+        assert await cache.get(key) == b"audio"
+        assert TTS_CACHE_LOOKUPS.value(tier="memory") == memory_hits + 1
+
+        # another process on the host, with a cold memory tier
+        disk_hits = TTS_CACHE_LOOKUPS.value(tier="disk")
+        assert await AudioCache(str(tmp_path)).get(key) == b"audio"
+        assert TTS_CACHE_LOOKUPS.value(tier="disk") == disk_hits + 1
+
+    asyncio.run(run())
+    # written atomically: nothing but the entry is left behind
+    (entry,) = [name for _, _, names in os.walk(tmp_path) for name in names]
+    assert entry.endswith(".mp3")
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    async def run():
+        cache = AudioCache(str(tmp_path), memory_bytes=0, disk_bytes=250)
+        await cache.put("old", b"x" * 100)
+        await cache.put("used", b"x" * 100)
+        os.utime(cache._path("old"), (1000, 1000))
+        os.utime(cache._path("used"), (500, 500))
+        # reading "used" makes it the most recently used
+        assert await cache.get("used") == b"x" * 100
+        await cache.put("new", b"x" * 100)
+        return cache
+
+    cache = asyncio.run(run())
+    assert [os.path.exists(cache._path(key)) for key in ("old", "used", "new")] == [
+        False,
+        True,
+        True,
+    ]
+
+
+def test_service_serves_repeated_text_without_calling_google(tmp_path):
+    async def run():
+        client = FakeTextToSpeechClient()
+        service = TTSService(client=client, cache=AudioCache(str(tmp_path)))
+        first = await service.synthesize("Great, let's move on.")
+        second = await service.synthesize("Great, let's move on.")
+        return client, first, second
+
+    client, first, second = asyncio.run(run())
+    assert first == second == b"mp3:Great, let's move on."
+    assert client.requests == ["Great, let's move on."]
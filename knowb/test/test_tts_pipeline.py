@@ -0,0 +1,80 @@
+import asyncio
+
+from src.api.tts.pipeline import SentenceSegmenter, SpeakableText, speak
+
+
+def segment(chunks: list[str], **kwargs) -> list[str]:
+    segmenter = SentenceSegmenter(**kwargs)
+    sentences = [sentence for chunk in chunks for sentence in segmenter.feed(chunk)]
+    rest = segmenter.flush()
+    return sentences + ([rest] if rest else [])
+
+
+def test_sentences_are_cut_as_the_text_streams_in():
+    segmenter = SentenceSegmenter(min_chars=10)
+    assert segmenter.feed("A parity bit is one extra") == []
+    assert segmenter.feed(" bit. It makes the count") == [
+        "A parity bit is one extra bit."
+    ]
+    assert segmenter.feed(" even!\nNow, what") == ["It makes the count even!"]
+    assert segmenter.flush() == "Now, what"
+
+
+def test_abbreviations_short_and_long_sentences():
+    assert segment(["See e.g. the table. ", "Ok. Then the next part follows."]) == [
+        "See e.g. the table. Ok.",
+        "Then the next part follows.",
+    ]
+    long = "word " * 30
+    sentences = segment([long], min_chars=5, max_chars=50)
+    assert all(len(sentence) <= 50 for sentence in sentences)
+    assert " ".join(sentences).split() == long.split()
+
+
+def test_audio_comes_in_order_with_bounded_parallelism_before_the_text_ends(
+    synthesizer,
+):
+    async def run():
+        # the first sentence is slowest to synthesize, yet comes out first
+        synthesizer.delay = 0.01
+        synthesizer.delays = {"The first sentence is here.": 0.05}
+        text_done = asyncio.Event()
+
+        async def reply():
+            for i, chunk in enumerate(
+                ["The first sentence is here. ", "The second one follows. "]
+                + [f"Sentence number {i} is next. " for i in range(6)]
+            ):
+                yield chunk
+                await asyncio.sleep(0)
+            await asyncio.sleep(0.2)
+            text_done.set()
+
+        received = []
+        first_audio_before_end = None
+        async for sentence, audio in speak(reply(), synthesizer, concurrency=2):
+            if first_audio_before_end is None:
+                first_audio_before_end = not text_done.is_set()
+            received.append((sentence, audio))
+        return synthesizer, received, first_audio_before_end
+
+    synthesizer, received, first_audio_before_end = asyncio.run(run())
+    assert [sentence for sentence, _ in received][:2] == [
+        "The first sentence is here.",
+        "The second one follows.",
+    ]
+    assert all(audio == sentence.encode() for sentence, audio in received)
+    assert len(received) == 8
+    assert synthesizer.most_running == 2
+    assert first_audio_before_end
+
+
+def test_thinking_and_markup_are_not_spoken():
+    speakable = SpeakableText()
+    chunks = ["Hi <thin", "king>they seem unsure</thin", "king>**Even** parity, a < b."]
+    assert [speakable.feed(chunk) for chunk in chunks] == [
+        "Hi ",
+        "",
+        "Even parity, a < b.",
+    ]
+    assert speakable.flush() == ""
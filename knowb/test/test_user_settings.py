@@ -0,0 +1,74 @@
+import asyncio
+
+from src.storage import MemoryStorage
+from src.users.user_settings import PromptResolver
+
+
+class CountingStorage(MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.reads: list[str] = []
+
+    async def get_user_settings(self, user_id):
+        self.reads.append("user_settings")
+        return await super().get_user_settings(user_id)
+
+    async def get_prompt(self, prompt_id):
+        self.reads.append("prompt")
+        return await super().get_prompt(prompt_id)
+
+    async def get_default_prompt(self):
+        self.reads.append("default_prompt")
+        return await super().get_default_prompt()
+
+
+async def seed(storage: MemoryStorage) -> tuple[str, str]:
+    texts = {"brainstorm_prompt": "", "final_prompt": ""}
+    default = await storage._run(
+        storage._insert, "prompts", {"name": "Default", "prompt_texts": texts}
+    )
+    own = await storage._run(
+        storage._insert,
+        "prompts",
+        {"name": "Mine", "user_id": "alice", "prompt_texts": texts},
+    )
+    await storage._run(
+        storage._insert,
+        "user_settings",
+        {"user_id": "alice", "current_prompt_id": own[0]["id"]},
+    )
+    return default[0]["id"], own[0]["id"]
+
+
+def test_resolutions_are_cached_until_the_ttl_or_an_invalidation():
+    now = [0.0]
+    resolver = PromptResolver(ttl_seconds=60, clock=lambda: now[0])
+    storage = CountingStorage()
+
+    async def run():
+        default_id, own_id = await seed(storage)
+        assert (await resolver.resolve("alice", storage)).id == own_id
+        assert (await resolver.resolve("bob", storage)).id == default_id
+        reads = len(storage.reads)
+
+        # the job looks up the prompt the run was requested with: no queries
+        assert (await resolver.prompt(own_id, storage)).id == own_id
+        assert (await resolver.resolve("alice", storage)).id == own_id
+        assert len(storage.reads) == reads
+
+        # alice switches to the default prompt in her settings
+        await storage._run(
+            storage._update,
+            "user_settings",
+            {"current_prompt_id": default_id},
+            {"user_id": "alice"},
+        )
+        resolver.invalidate_user("alice")
+        assert (await resolver.resolve("alice", storage)).id == default_id
+
+        now[0] = 61
+        storage.reads.clear()
+        await resolver.resolve("bob", storage)
+        assert sorted(storage.reads) == ["default_prompt", "user_settings"]
+
+    asyncio.run(run())
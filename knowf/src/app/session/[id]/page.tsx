@@ -97,10 +97,12 @@ function ChatSession({ params }: { params: Promise<{ id: string }> }) {
 
     try {
       debug.log("Creating EventSource connection");
+      // the same turn id on a reconnect resumes this turn instead of starting another
+      const turnId = crypto.randomUUID();
       const eventSource = new EventSourcePolyfill(
         `/api/chat/stream?message=${encodeURIComponent(
           messageText.trim()
-        )}&session_id=${sessionId}`,
+        )}&session_id=${sessionId}&turn_id=${turnId}`,
         {
           headers: { Authorization: `Bearer ${session.access_token}` },
         }
@@ -150,6 +152,11 @@ function ChatSession({ params }: { params: Promise<{ id: string }> }) {
       };
 
       eventSource.onerror = (error) => {
+        if (eventSource.readyState !== eventSource.CLOSED) {
+          // dropped connection: the EventSource reconnects with Last-Event-ID
+          debug.log("EventSource reconnecting:", error);
+          return;
+        }
         debug.error("EventSource error:", error);
         eventSource.close();
         setIsStreaming(false);
@@ -4,7 +4,7 @@ import { useEffect, useState } from "react";
 import { supabase } from "@/lib/supabase";
 import { debug } from "@/lib/debug";
 import { Prompt } from "./userSettings";
-import { ensureUserSettings } from "./userSettings";
+import { ensureUserSettings, notifyPromptsChanged } from "./userSettings";
 import { useAuth } from "@/contexts/AuthContext";
 import { useRouter } from "next/navigation";
 
@@ -140,6 +140,7 @@ export default function SettingsPage() {
 
       setPrompts(promptsData);
       setSaveStatus("saved");
+      await notifyPromptsChanged();
     } catch (err) {
       debug.error("Error saving settings:", err);
       setSaveStatus("unsaved");
@@ -202,6 +203,7 @@ export default function SettingsPage() {
       }
 
       setSelectedPromptId(newSelectedId);
+      await notifyPromptsChanged();
     }
 
     // Now safe to update local state
@@ -77,3 +77,17 @@ export async function getCurrentPrompt(userId: string) {
   const promptId = await getCurrentPromptId(userId);
   return getPromptTexts(promptId);
 }
+
+// The backend caches each user's prompt selection (see knowb/src/users/user_settings.py);
+// call this after changing prompts or user_settings so it picks the change up at once
+export async function notifyPromptsChanged() {
+  const {
+    data: { session },
+  } = await supabase.auth.getSession();
+  if (!session?.access_token) return;
+
+  await fetch("/api/settings/prompts_changed", {
+    method: "POST",
+    headers: { Authorization: `Bearer ${session.access_token}` },
+  });
+}
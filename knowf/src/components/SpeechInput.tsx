@@ -11,48 +11,98 @@ interface SpeechInputProps {
   buttonText?: string;
   isRecording?: boolean;
   onRecordingStateChange?: (isRecording: boolean) => void;
+  // the transcript so far, while the learner is still speaking
+  onInterimTranscript?: (text: string) => void;
 }
 
+const SPEECH_SOCKET_URL = "ws://127.0.0.1:8000/api/speech-to-text/ws";
+// how often the recorder hands over audio to send
+const CHUNK_MILLISECONDS = 250;
+
 export const SpeechInput: React.FC<SpeechInputProps> = ({
   onTranscript,
-  sessionId,
   className = "",
   buttonStyle,
   buttonText,
   isRecording,
   onRecordingStateChange,
+  onInterimTranscript,
 }) => {
   const [error, setError] = useState<string>("");
   const mediaRecorderRef = useRef<MediaRecorder | null>(null);
-  const chunksRef = useRef<Blob[]>([]);
+  const socketRef = useRef<WebSocket | null>(null);
   const [isListening, setIsListening] = useState(false);
 
+  // Audio is streamed to the backend while recording, so the transcript is
+  // ready soon after the learner stops talking (see src/api/routes/speech.py)
+  const openSocket = (token: string): Promise<WebSocket> =>
+    new Promise((resolve, reject) => {
+      const socket = new WebSocket(SPEECH_SOCKET_URL);
+      socket.onopen = () =>
+        socket.send(JSON.stringify({ type: "auth", token }));
+      socket.onerror = () => reject(new Error("Speech socket failed"));
+      socket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        switch (message.type) {
+          case "ready":
+            resolve(socket);
+            break;
+          case "transcript":
+            onInterimTranscript?.(message.text);
+            break;
+          case "end":
+            if (message.text) {
+              onTranscript(message.text);
+              setError("");
+            } else {
+              debug.warn("No text returned from speech recognition");
+              setError("No speech detected");
+            }
+            socket.close();
+            break;
+          case "error":
+            debug.error("Error in speech recognition:", message.detail);
+            setError("Speech recognition failed");
+            socket.close();
+            break;
+        }
+      };
+    });
+
   const startRecording = async () => {
     try {
+      const {
+        data: { session },
+      } = await supabase.auth.getSession();
+      if (!session?.access_token) throw new Error("No auth session");
+
+      const socket = await openSocket(session.access_token);
+      socketRef.current = socket;
+
       const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
       mediaRecorderRef.current = new MediaRecorder(stream, {
         mimeType: "audio/webm;codecs=opus",
       });
 
-      chunksRef.current = [];
-
       mediaRecorderRef.current.ondataavailable = (event) => {
-        if (event.data.size > 0) {
-          chunksRef.current.push(event.data);
+        if (event.data.size > 0 && socket.readyState === WebSocket.OPEN) {
+          socket.send(event.data);
         }
       };
 
-      mediaRecorderRef.current.onstop = async () => {
-        const audioBlob = new Blob(chunksRef.current, { type: "audio/webm" });
-        await sendAudioToGoogle(audioBlob);
+      mediaRecorderRef.current.onstop = () => {
+        if (socket.readyState === WebSocket.OPEN) {
+          socket.send(JSON.stringify({ type: "end" }));
+        }
       };
 
-      mediaRecorderRef.current.start(1000);
+      mediaRecorderRef.current.start(CHUNK_MILLISECONDS);
       setIsListening(true);
       onRecordingStateChange?.(true);
       setError("");
     } catch (err) {
       debug.error("Error starting recording:", err);
+      socketRef.current?.close();
       setError("Failed to access microphone");
     }
   };
@@ -71,56 +121,6 @@ export const SpeechInput: React.FC<SpeechInputProps> = ({
     }
   };
 
-  const sendAudioToGoogle = async (audioBlob: Blob) => {
-    try {
-      const {
-        data: { session },
-      } = await supabase.auth.getSession();
-      if (!session?.access_token) throw new Error("No auth session");
-
-      const reader = new FileReader();
-      reader.readAsDataURL(audioBlob);
-
-      reader.onloadend = async () => {
-        const base64Audio = (reader.result as string).split(",")[1];
-
-        try {
-          const response = await fetch("/api/speech-to-text", {
-            method: "POST",
-            headers: {
-              "Content-Type": "application/json",
-              Authorization: `Bearer ${session.access_token}`,
-            },
-            body: JSON.stringify({
-              audio: base64Audio,
-              session_id: sessionId,
-            }),
-          });
-
-          if (!response.ok) {
-            const errorData = await response.json();
-            throw new Error(errorData.detail || "Speech recognition failed");
-          }
-
-          const { text } = await response.json();
-          if (text) {
-            onTranscript(text);
-            setError("");
-          } else {
-            debug.warn("No text returned from speech recognition");
-            setError("No speech detected");
-          }
-        } catch (err) {
-          debug.error("Error in speech recognition:", err);
-          setError("Speech recognition failed");
-        }
-      };
-    } catch (err) {
-      debug.error("Error in speech recognition:", err);
-      setError("Speech recognition failed");
-    }
-  };
-
   return (
     <div className={`relative ${className}`}>
       <button
@@ -59,7 +59,7 @@ export const TTSStreamer: React.FC<TTSStreamerProps> = ({ text }) => {
   
   useEffect(() => {
     if (text && websocketRef.current?.readyState === WebSocket.OPEN) {
-      websocketRef.current.send(JSON.stringify({ text }));
+      websocketRef.current.send(JSON.stringify({ text, end: true }));
     }
   }, [text]);
   
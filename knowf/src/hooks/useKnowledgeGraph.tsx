@@ -1,9 +1,11 @@
+import { useEffect } from "react";
 import {
   useQuery,
   useMutation,
   useQueryClient,
   UseMutationResult,
 } from "@tanstack/react-query";
+import { EventSourcePolyfill } from "event-source-polyfill";
 import { KnowledgeGraphService, KnowledgeGraph } from "@/lib/graphService";
 import { debug } from "@/lib/debug";
 
@@ -43,11 +45,48 @@ export function useDocumentGraph(documentId: string | undefined | null) {
       return KnowledgeGraphService.getGraphForDocument(documentId);
     },
     enabled: !!documentId,
-    refetchInterval: (query) => {
-      return query.state.data?.status === "processing" ? 2000 : false;
-    },
   });
 
+  // While the graph generates, the backend pushes its status instead of us polling
+  const processingGraphId =
+    graph?.status === "processing" && graph.id !== "pending" ? graph.id : null;
+  useEffect(() => {
+    if (!processingGraphId) return;
+    let eventSource: EventSourcePolyfill | null = null;
+    let closed = false;
+
+    const finish = () => {
+      eventSource?.close();
+      queryClient.invalidateQueries({ queryKey });
+    };
+
+    KnowledgeGraphService.subscribeToGraphEvents(processingGraphId)
+      .then((source) => {
+        if (closed) {
+          source.close();
+          return;
+        }
+        eventSource = source;
+        source.addEventListener("snapshot", (event) => {
+          const { status } = JSON.parse((event as MessageEvent).data);
+          if (["complete", "failed", "error"].includes(status)) finish();
+        });
+        source.addEventListener("complete", finish);
+        source.addEventListener("error", (event) => {
+          // "error" is both our event name and the connection error; the
+          // polyfill reconnects on its own after a connection error
+          if ((event as MessageEvent).data) finish();
+        });
+      })
+      .catch((error) => debug.error("Error subscribing to graph events:", error));
+
+    return () => {
+      closed = true;
+      eventSource?.close();
+    };
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [processingGraphId]);
+
   // Mutation for generating graph
   const {
     mutate: generateGraph,
@@ -68,6 +107,10 @@ export function useDocumentGraph(documentId: string | undefined | null) {
       queryClient.setQueryData(queryKey, newGraph);
       return { previousGraph: null };
     },
+    onSuccess: () => {
+      // fetch the real graph id, which starts the event subscription above
+      queryClient.invalidateQueries({ queryKey });
+    },
     onError: (error) => {
       debug.error("Error generating graph:", error);
       // Never clear processing state on timeout - backend is still working
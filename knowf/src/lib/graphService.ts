@@ -1,3 +1,4 @@
+import { EventSourcePolyfill } from "event-source-polyfill";
 import { supabase } from "@/lib/supabase";
 import { debug } from "@/lib/debug";
 
@@ -75,6 +76,22 @@ export class KnowledgeGraphService {
     }
   }
 
+  // Server-sent status events for a graph being generated: a "snapshot", then
+  // "stage", "nodes", "edges", "retrying" and finally "complete" or "error"
+  static async subscribeToGraphEvents(
+    graphId: string
+  ): Promise<EventSourcePolyfill> {
+    const {
+      data: { session },
+    } = await supabase.auth.getSession();
+    if (!session?.access_token) throw new Error("No auth session");
+
+    return new EventSourcePolyfill(`/api/content_map/events/${graphId}`, {
+      headers: { Authorization: `Bearer ${session.access_token}` },
+      heartbeatTimeout: 60000,
+    });
+  }
+
   static async getGraphForDocument(
     documentId: string
   ): Promise<KnowledgeGraph | null> {
@@ -149,7 +149,7 @@ export class SessionService {
     return new EventSourcePolyfill(
       `/api/chat/stream?message=${encodeURIComponent(
         message
-      )}&session_id=${sessionId}`,
+      )}&session_id=${sessionId}&turn_id=${crypto.randomUUID()}`,
       {
         headers: { Authorization: `Bearer ${session.access_token}` },
       }